@@ -5,14 +5,46 @@ Läuft als Cronjob (empfohlen: jede Stunde)
 
 Aufgaben:
 1. Rohdaten älter als 48h zu Minuten-Werten aggregieren
-2. Minuten-Daten älter als 7 Tage zu Stunden-Werten aggregieren  
+2. Minuten-Daten älter als 7 Tage zu Stunden-Werten aggregieren
 3. Stunden-Daten älter als 90 Tage zu Tages-Werten aggregieren
 4. Alte Daten löschen gemäß Retention Policy
+5. Tageszusammenfassung energy_daily für abgeschlossene Tage ergänzen
+   (wird nie gelöscht, Grundlage für Monats- und Jahreswerte)
+6. Grundlast baseload_daily (Minimum und Perzentil im Fenster
+   BASELOAD_HOURS) für abgeschlossene Tage ergänzen
+7. Mit ARCHIVE_AFTER_DAYS > 0: abgeschlossene Jahre bzw. Monate der Tages-
+   und Stundenwerte ins Archiv verschieben (archive.py)
+
+Inkrementell: pro Tier wird ein High-Water-Mark gespeichert, verarbeitet
+werden nur neue, abgeschlossene Intervalle. Quellzeilen unterhalb des
+Watermarks (Backfill, verspätete Flushes) werden trotzdem aggregiert und
+gelöscht, die Ausgabe meldet ihre Anzahl. Jeder Chunk (Upsert, Löschen
+der Quelldaten, neuer Watermark) ist eine eigene kurze Transaktion, damit
+der Ingest nie lange blockiert wird. `--rebuild` ignoriert die Watermarks.
+
+Zeilen, die der Ingest bereits live geschrieben hat (LIVE_ROLLUPS), bleiben
+erhalten; das Script füllt nur Lücken und setzt die Retention durch.
+Nur `--rebuild` überschreibt bestehende Aggregate.
+
+Große oder mehrere Datenbanken: `--workers N` (AGGREGATE_WORKERS) rechnet
+die Chunks in N Prozessen parallel, je Datenbank schreibt weiterhin nur
+ein Prozess, Chunk für Chunk. Eine Lock-Datei neben der DB verhindert, dass
+sich zwei Läufe überschneiden. `-v` gibt die Zeiten je Chunk aus.
 """
-import sqlite3
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime, timedelta
+from multiprocessing import get_context
 import os
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 try:
@@ -21,102 +53,406 @@ try:
 except ImportError:
     pass
 
-_db_env = os.getenv("DB_PATH", "instance/energy.db")
-DB_PATH = _db_env if os.path.isabs(_db_env) else os.path.join(SCRIPT_DIR, _db_env)
+from sqlalchemy import func, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateIndex, CreateTable
+from archive import ARCHIVE_AFTER_DAYS, archive
+from energy import summarize_baseload, summarize_days, to_db, from_db
+from ingest import BASELOAD_PERCENTILE
+from schema import COMPACT, metadata, baseload_daily, energy_daily, check_layout, floor, watt_avg
+from storage import DB_PATH, connect, reader_engine, writer_engine, checkpoint
+BASELOAD_HOURS = (int(os.getenv("BASELOAD_HOUR_START", 2)), int(os.getenv("BASELOAD_HOUR_END", 5)))
 
-def aggregate():
-    if not os.path.exists(DB_PATH):
-        print(f"DB not found: {DB_PATH}")
-        return
-    
-    conn = sqlite3.connect(DB_PATH)
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+DAILY_CHUNK = timedelta(days=92)
+WORKERS = int(os.getenv("AGGREGATE_WORKERS", 1))
+
+# tier: (Quelle, Ziel, Bucket-Länge, Alter bis zur Aggregation, Chunk-Länge, Ziel-Spalten, Aggregat-SQL)
+TIERS = [
+    ("minute", "measurement", "measurement_minute", timedelta(minutes=1), timedelta(hours=48), timedelta(hours=6),
+     "power_avg, power_max, power_min, total_kwh",
+     f"{floor('timestamp', 60)}, {watt_avg('power_watt')}, MAX(power_watt), MIN(power_watt), MAX(total_kwh)"),
+    # kWh ab dem letzten Minutenwert der Vorstunde wie im Live-Rollup (ingest.Rollup), damit Stunden und
+    # Tage lückenlos sind; ohne Vorstunde ab dem ersten Minutenwert der Stunde
+    ("hour", "measurement_minute", "measurement_hour", timedelta(hours=1), timedelta(days=7), timedelta(days=2),
+     "power_avg, power_max, power_min, kwh_used",
+     f"{floor('timestamp', 3600)}, {watt_avg('power_avg')}, MAX(power_max), MIN(power_min), "
+     f"MAX(MAX(total_kwh) - COALESCE((SELECT p.total_kwh FROM measurement_minute p "
+     f"WHERE p.timestamp >= {floor('measurement_minute.timestamp', 3600, -1)} "
+     f"AND p.timestamp < {floor('measurement_minute.timestamp', 3600)} "
+     f"ORDER BY p.timestamp DESC LIMIT 1), MIN(total_kwh)), 0)"),
+    ("day", "measurement_hour", "measurement_day", timedelta(days=1), timedelta(days=90), timedelta(days=31),
+     "power_avg, power_max, power_min, kwh_used",
+     f"{floor('timestamp', 86400)}, {watt_avg('power_avg')}, MAX(power_max), MIN(power_min), SUM(kwh_used)"),
+]
+# Quellzeilen, die nach dem Rollup bis zum nächsten Chunk bleiben: der erste Bucket eines
+# Chunks braucht die Minutenwerte der Vorstunde
+KEEP = {"hour": timedelta(hours=1)}
+
+
+def ensure_schema(cur):
+    """Legt fehlende Tabellen und Indizes im Layout von DB_SCHEMA an (schema.py)."""
+    check_layout(cur)
+    dialect = sqlite.dialect()
+    for table in metadata.sorted_tables:
+        cur.execute(str(CreateTable(table, if_not_exists=True).compile(dialect=dialect)))
+    if not COMPACT:
+        for table in ("measurement_minute", "measurement_hour", "measurement_day"):
+            _ensure_unique_ts(cur, table)
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            cur.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)))
+
+
+def _ensure_unique_ts(cur, table):
+    """UNIQUE-Index auf timestamp als Upsert-Ziel; ältere DBs werden einmalig bereinigt."""
+    for _, name, unique, *_ in cur.execute(f"PRAGMA index_list({table})").fetchall():
+        cols = [r[2] for r in cur.execute(f"PRAGMA index_info({name})").fetchall()]
+        if unique and cols == ["timestamp"]:
+            return
+    # Alte Aggregate ohne Mikrosekunden ins SQLAlchemy-Format bringen, Duplikate entfernen
+    cur.execute(f"UPDATE {table} SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19")
+    cur.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY timestamp)")
+    short = {"measurement_minute": "mm", "measurement_hour": "mh", "measurement_day": "md"}[table]
+    cur.execute(f"DROP INDEX IF EXISTS idx_{short}_ts")
+    cur.execute(f"DROP INDEX IF EXISTS ix_{table}_timestamp")
+    cur.execute(f"CREATE UNIQUE INDEX ix_{table}_timestamp ON {table}(timestamp)")
+
+
+def floor_ts(dt, step):
+    if step >= timedelta(days=1):
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if step >= timedelta(hours=1):
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(second=0, microsecond=0)
+
+
+def _first_ts(cur, table, lo=None):
+    if lo is None:
+        row = cur.execute(f"SELECT MIN(timestamp) FROM {table}").fetchone()
+    else:
+        row = cur.execute(f"SELECT MIN(timestamp) FROM {table} WHERE timestamp >= ?", (to_db(lo),)).fetchone()
+    return from_db(row[0]) if row and row[0] is not None else None
+
+
+def _spans(cur, source, step, chunk, start, cutoff):
+    """Chunks [lo, hi) von `start` bis `cutoff`; Lücken in den Quelldaten werden übersprungen."""
+    lo = _first_ts(cur, source, start)
+    while lo is not None and floor_ts(lo, step) < cutoff:
+        lo = floor_ts(lo, step)
+        hi = min(floor_ts(lo + chunk, step), cutoff)
+        yield lo, hi
+        lo = _first_ts(cur, source, hi)
+
+
+def _db_file(cur):
+    return cur.execute("PRAGMA database_list").fetchone()[2]
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    return fn(*args), time.perf_counter() - t0
+
+
+def _rollup(conn, source, select, lo, hi):
+    return conn.execute(f"SELECT {select} FROM {source} WHERE timestamp >= ? AND timestamp < ? GROUP BY 1",
+                        (lo, hi)).fetchall()
+
+
+# Lese-Verbindungen und -Engines der Worker-Prozesse, je eine pro Datenbank
+_worker_dbs = {}
+_worker_engines = {}
+
+
+def _rollup_job(job):
+    """Worker: Aggregat-Zeilen eines Chunks, nur lesend. Gibt (Zeilen, Sekunden, PID) zurück."""
+    path, *args = job
+    if path not in _worker_dbs:
+        _worker_dbs[path] = connect(path, readonly=True)
+    return (*_timed(_rollup, _worker_dbs[path], *args), os.getpid())
+
+
+def _days_job(job):
+    """Worker: Tageszeilen von `summarize(conn, lo, hi)` für [lo, hi). Gibt (Zeilen, Sekunden, PID) zurück."""
+    path, summarize, lo, hi = job
+    if path not in _worker_engines:
+        _worker_engines[path] = reader_engine(path)
+    with _worker_engines[path].connect() as conn:
+        return (*_timed(summarize, conn, lo, hi), os.getpid())
+
+
+def _chunk_line(tier, lo, hi, rows, compute, held, pid):
+    return (f"    {tier:6s} {lo:%Y-%m-%d %H:%M} .. {hi:%Y-%m-%d %H:%M}: {rows:6d} rows, "
+            f"compute {compute * 1000:6.0f} ms (pid {pid}), commit {held * 1000:5.0f} ms")
+
+
+def aggregate_tier(conn, tier, source, target, step, age, chunk, columns, select, now, rebuild=False,
+                   pool=None, report=None, note=None):
+    """Verarbeitet [watermark, now - age) in Chunks. Gibt (Zeilen, gelöscht, Sekunden, Lock-Sekunden) zurück.
+
+    Liegen Quellzeilen vor dem Watermark, beginnt der Lauf bei der ersten
+    davon; bestehende Ziel-Buckets bleiben dabei unverändert (außer mit
+    `rebuild`), `note` erhält ihre Anzahl.
+
+    Mit `pool` (ProcessPoolExecutor) rechnen Worker-Prozesse die Chunks
+    parallel auf eigenen Lese-Verbindungen; geschrieben wird nur über `conn`,
+    Chunk für Chunk in zeitlicher Reihenfolge. `report` erhält je Chunk eine
+    Zeile mit den Zeiten.
+    """
     cur = conn.cursor()
+    cutoff = floor_ts(now - age, step)
+    row = cur.execute("SELECT watermark FROM aggregate_state WHERE tier = ?", (tier,)).fetchone()
+    wm = from_db(row[0]) if row and row[0] is not None and not rebuild else None
+    keep = KEEP.get(tier, timedelta(0))
+    start = wm
+    first = _first_ts(cur, source) if wm is not None else None
+    if first is not None and first < wm - keep:
+        start = first
+        late = cur.execute(f"SELECT COUNT(*) FROM {source} WHERE timestamp < ?", (to_db(wm - keep),)).fetchone()[0]
+        if note:
+            note(f"  ! {tier}: {late} {source} rows before the watermark {wm:%Y-%m-%d %H:%M} "
+                 f"(backfill or late flush), aggregated into missing buckets and deleted")
+    update = "UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in columns.split(", "))
+    insert = f"""INSERT INTO {target} (timestamp, {columns}) VALUES ({", ".join("?" * (columns.count(",") + 2))})
+        ON CONFLICT(timestamp) DO {update if rebuild else "NOTHING"}"""
+    upserted = deleted = 0
+    lock_total = lock_max = 0.0
+    t0 = time.perf_counter()
+    if pool is None:
+        # seriell: Chunk für Chunk auf der eigenen Verbindung, Lücken werden dabei übersprungen
+        work = (((lo, hi), (*_timed(_rollup, cur, source, select, to_db(lo), to_db(hi)), os.getpid()))
+                for lo, hi in _spans(cur, source, step, chunk, start, cutoff))
+    else:
+        spans = list(_spans(cur, source, step, chunk, start, cutoff))
+        path = _db_file(cur)
+        work = zip(spans, pool.map(_rollup_job, [(path, source, select, to_db(lo), to_db(hi)) for lo, hi in spans]))
+    for (lo, hi), (rows, compute, pid) in work:
+        t_lock = time.perf_counter()
+        cur.executemany(insert, rows)
+        upserted += max(cur.rowcount, 0)
+        cur.execute(f"DELETE FROM {source} WHERE timestamp < ?", (to_db(hi - keep),))
+        deleted += max(cur.rowcount, 0)
+        cur.execute("""INSERT INTO aggregate_state (tier, watermark, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(tier) DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at""",
+                    (tier, to_db(max(hi, wm) if wm else hi), datetime.now().strftime(TS_FORMAT)))
+        conn.commit()
+        held = time.perf_counter() - t_lock
+        lock_total += held
+        lock_max = max(lock_max, held)
+        if report:
+            report(_chunk_line(tier, lo, hi, len(rows), compute, held, pid))
+    return upserted, deleted, time.perf_counter() - t0, lock_total, lock_max
+
+
+def _refresh_days(engine, now, tier, insert, summarize, rebuild, pool, report):
+    """Schreibt Tageszeilen für alle abgeschlossenen Tage ab dem Watermark von `tier`, in DAILY_CHUNK-Blöcken."""
+    today = floor_ts(now, timedelta(days=1))
+    upserted = 0
+    lock_total = lock_max = 0.0
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        wm = None if rebuild else conn.execute(
+            text("SELECT watermark FROM aggregate_state WHERE tier = :t"), {"t": tier}).scalar()
+        if wm is not None:
+            lo = from_db(wm)
+        else:
+            first = conn.execute(text(" UNION ALL ".join(
+                f"SELECT MIN(timestamp) FROM {t}"
+                for t in ("measurement", "measurement_minute", "measurement_hour", "measurement_day")))).fetchall()
+            first = [from_db(r[0]) for r in first if r[0] is not None]
+            lo = floor_ts(min(first), timedelta(days=1)) if first else None
+        spans = []
+        while lo is not None and lo < today:
+            spans.append((lo, min(lo + DAILY_CHUNK, today)))
+            lo = spans[-1][1]
+        if pool is None:
+            results = ((*_timed(summarize, conn, lo, hi), os.getpid()) for lo, hi in spans)
+        else:
+            results = pool.map(_days_job, [(engine.url.database, summarize, lo, hi) for lo, hi in spans])
+        for (lo, hi), (rows, compute, pid) in zip(spans, results):
+            t_lock = time.perf_counter()
+            if rows:
+                result = conn.execute(insert, rows)
+                upserted += max(result.rowcount, 0)
+            conn.execute(text("""INSERT INTO aggregate_state (tier, watermark, updated_at) VALUES (:t, :w, :u)
+                ON CONFLICT(tier) DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at"""),
+                         {"t": tier, "w": to_db(hi), "u": datetime.now().strftime(TS_FORMAT)})
+            conn.commit()
+            held = time.perf_counter() - t_lock
+            lock_total += held
+            lock_max = max(lock_max, held)
+            if report:
+                report(_chunk_line(tier, lo, hi, len(rows), compute, held, pid))
+    return upserted, 0, time.perf_counter() - t0, lock_total, lock_max
+
+
+def refresh_daily(engine, now, rebuild=False, pool=None, report=None):
+    """Ergänzt energy_daily für alle abgeschlossenen Tage ab dem Watermark.
+
+    Bestehende Zeilen (z.B. live vom Ingest geschrieben) bleiben erhalten, nur
+    `rebuild` berechnet alle Tage neu. `pool` und `report` und die Rückgabe
+    wie bei aggregate_tier.
+    """
+    insert = sqlite_insert(energy_daily)
+    if rebuild:
+        # Rohwert-Anzahl und Grundlast sind nach der Aggregation nicht mehr rekonstruierbar
+        keep = ("samples", "baseload_watt")
+        cols = [c.name for c in energy_daily.columns if c.name not in ("id", "timestamp")]
+        insert = insert.on_conflict_do_update(index_elements=["timestamp"], set_={
+            c: func.coalesce(insert.excluded[c], energy_daily.c[c]) if c in keep else insert.excluded[c]
+            for c in cols})
+    else:
+        insert = insert.on_conflict_do_nothing(index_elements=["timestamp"])
+    summarize = partial(summarize_days, baseload_hours=BASELOAD_HOURS)
+    return _refresh_days(engine, now, "daily", insert, summarize, rebuild, pool, report)
+
+
+def refresh_baseload(engine, now, rebuild=False, pool=None, report=None):
+    """Ergänzt baseload_daily (Minimum und Perzentil im Grundlast-Fenster) für abgeschlossene Tage.
+
+    Tage, deren Fenster schon zu Tageswerten aggregiert ist, übernehmen beim
+    ersten Lauf die Grundlast aus energy_daily (ohne Perzentil). Sonst wie
+    refresh_daily.
+    """
+    insert = sqlite_insert(baseload_daily)
+    if rebuild:
+        # nur Tage mit Werten im Fenster werden neu berechnet, ältere bleiben
+        insert = insert.on_conflict_do_update(index_elements=["timestamp"], set_={
+            c: insert.excluded[c] for c in ("min_watt", "percentile_watt", "samples")})
+    else:
+        insert = insert.on_conflict_do_nothing(index_elements=["timestamp"])
+    summarize = partial(summarize_baseload, baseload_hours=BASELOAD_HOURS, percent=BASELOAD_PERCENTILE)
+    result = _refresh_days(engine, now, "baseload", insert, summarize, rebuild, pool, report)
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT INTO baseload_daily (timestamp, min_watt)
+            SELECT timestamp, baseload_watt FROM energy_daily WHERE baseload_watt IS NOT NULL
+            ON CONFLICT(timestamp) DO NOTHING"""))
+    return result
+
+
+@contextmanager
+def run_lock(path):
+    """Exklusiver Lauf pro Datenbank (Lock-Datei neben der DB); liefert False, wenn schon ein Lauf aktiv ist."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path + ".aggregate.lock", "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def record_run(engine, results):
+    """Hält den Lauf je Tier in aggregate_runs fest (Dauer, Zeilen, Lock-Zeiten), die App liest ihn für /metrics."""
+    finished = datetime.now().strftime(TS_FORMAT)
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT INTO aggregate_runs (tier, finished_at, seconds, rows, deleted, lock_seconds,
+                lock_max_seconds) VALUES (:t, :f, :s, :r, :d, :l, :m)
+            ON CONFLICT(tier) DO UPDATE SET finished_at = excluded.finished_at, seconds = excluded.seconds,
+                rows = excluded.rows, deleted = excluded.deleted, lock_seconds = excluded.lock_seconds,
+                lock_max_seconds = excluded.lock_max_seconds"""),
+                     [{"t": tier, "f": finished, "s": secs, "r": rows, "d": deleted, "l": lock, "m": lock_max}
+                      for tier, (rows, deleted, secs, lock, lock_max) in results.items()])
+
+
+def aggregate(rebuild=False, now=None, path=DB_PATH, pool=None, verbose=False):
+    """Aggregiert eine Datenbank; mit `pool` rechnen Worker-Prozesse die Chunks (siehe aggregate_tier).
+
+    Gibt je Tier (Zeilen, gelöscht, Sekunden, Lock-Sekunden, max. Lock) zurück.
+    """
+    if not os.path.exists(path):
+        print(f"DB not found: {path}")
+        return
+
+    with run_lock(path) as acquired:
+        if not acquired:
+            print(f"Aggregation of {path} is already running, skipped")
+            return
+        now = now or datetime.now()
+        lines = []
+        report = lines.append if verbose else None
+        t0 = time.perf_counter()
+
+        conn = connect(path)
+        cur = conn.cursor()
+        ensure_schema(cur)
+        conn.commit()
+
+        results = {}
+        notes = []
+        for tier, *spec in TIERS:
+            results[tier] = aggregate_tier(conn, tier, *spec, now=now, rebuild=rebuild, pool=pool, report=report,
+                                           note=notes.append)
+
+        conn.close()
+
+        engine = writer_engine(path)
+        results["daily"] = refresh_daily(engine, now, rebuild=rebuild, pool=pool, report=report)
+        results["baseload"] = refresh_baseload(engine, now, rebuild=rebuild, pool=pool, report=report)
+        if ARCHIVE_AFTER_DAYS > 0:
+            results["archive"] = archive(engine, now, report=report)
+        record_run(engine, results)
+        with engine.connect() as c:
+            checkpoint(c, optimize=True)
+        engine.dispose()
+
+    labels = {"minute": "Minuten", "hour": "Stunden", "day": "Tages", "daily": "Tageszusammenfassungs",
+              "baseload": "Grundlast", "archive": "Archiv"}
+    sources = {"minute": "Rohdaten", "hour": "Minuten", "day": "Stunden", "archive": "DB-Zeilen"}
+    mode = "rebuild" if rebuild else "incremental"
+    lines.insert(0, f"[{now.isoformat()}] Aggregation done ({mode}{', parallel' if pool else ''}, {path}) "
+                    f"in {time.perf_counter() - t0:.1f} s:")
+    for tier, (rows, deleted, secs, lock_total, lock_max) in results.items():
+        if tier in ("daily", "baseload"):
+            rate = rows / secs if secs > 0 else 0
+            removed = ""
+        else:
+            rate = deleted / secs if secs > 0 else 0
+            removed = f"  - {sources[tier]} gelöscht: {deleted}"
+        lines.append(f"  + {labels[tier]}-Einträge: {rows}{removed}  "
+                     f"({rate:.0f} rows/s, Lock {lock_total * 1000:.0f} ms gesamt, max {lock_max * 1000:.0f} ms)")
+    lines += notes
+    # in einem Stück, damit sich parallel laufende Datenbanken nicht vermischen
+    print("\n".join(lines), flush=True)
+    return results
+
+
+def aggregate_all(paths, rebuild=False, workers=WORKERS, verbose=False):
+    """Aggregiert mehrere Datenbanken; ab zwei Workern über einen gemeinsamen Prozess-Pool.
+
+    Je Datenbank koordiniert ein Thread (Chunks lesen, Ergebnisse schreiben),
+    die Berechnung läuft in den Worker-Prozessen. Getrennte Dateien schreiben
+    sich nicht gegenseitig in die Quere.
+    """
     now = datetime.now()
-    
-    cur.execute("""CREATE TABLE IF NOT EXISTS measurement_minute (
-        id INTEGER PRIMARY KEY, timestamp DATETIME, 
-        power_avg FLOAT, power_max FLOAT, power_min FLOAT, total_kwh FLOAT)""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS measurement_hour (
-        id INTEGER PRIMARY KEY, timestamp DATETIME, 
-        power_avg FLOAT, power_max FLOAT, power_min FLOAT, kwh_used FLOAT)""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS measurement_day (
-        id INTEGER PRIMARY KEY, timestamp DATETIME, 
-        power_avg FLOAT, power_max FLOAT, power_min FLOAT, kwh_used FLOAT)""")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_mm_ts ON measurement_minute(timestamp)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_mh_ts ON measurement_hour(timestamp)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_md_ts ON measurement_day(timestamp)")
-
-    
-    cutoff_48h = now - timedelta(hours=48)
-    cutoff_7d = now - timedelta(days=7)
-    cutoff_90d = now - timedelta(days=90)
-    
-    # 1. Raw -> Minuten (älter als 48h)
-    cur.execute("""
-        INSERT INTO measurement_minute (timestamp, power_avg, power_max, power_min, total_kwh)
-        SELECT 
-            datetime(strftime('%Y-%m-%d %H:%M:00', timestamp)),
-            AVG(power_watt), MAX(power_watt), MIN(power_watt), MAX(total_kwh)
-        FROM measurement
-        WHERE timestamp < ?
-        AND datetime(strftime('%Y-%m-%d %H:%M:00', timestamp)) NOT IN 
-            (SELECT timestamp FROM measurement_minute)
-        GROUP BY strftime('%Y-%m-%d %H:%M', timestamp)
-    """, (cutoff_48h.isoformat(),))
-    rows_min = cur.rowcount
-    
-    # 2. Minuten -> Stunden (älter als 7 Tage)
-    cur.execute("""
-        INSERT INTO measurement_hour (timestamp, power_avg, power_max, power_min, kwh_used)
-        SELECT 
-            datetime(strftime('%Y-%m-%d %H:00:00', timestamp)),
-            AVG(power_avg), MAX(power_max), MIN(power_min),
-            MAX(total_kwh) - MIN(total_kwh)
-        FROM measurement_minute
-        WHERE timestamp < ?
-        AND datetime(strftime('%Y-%m-%d %H:00:00', timestamp)) NOT IN 
-            (SELECT timestamp FROM measurement_hour)
-        GROUP BY strftime('%Y-%m-%d %H', timestamp)
-    """, (cutoff_7d.isoformat(),))
-    rows_hour = cur.rowcount
-    
-    # 3. Stunden -> Tage (älter als 90 Tage)
-    cur.execute("""
-        INSERT INTO measurement_day (timestamp, power_avg, power_max, power_min, kwh_used)
-        SELECT 
-            datetime(strftime('%Y-%m-%d 00:00:00', timestamp)),
-            AVG(power_avg), MAX(power_max), MIN(power_min), SUM(kwh_used)
-        FROM measurement_hour
-        WHERE timestamp < ?
-        AND datetime(strftime('%Y-%m-%d 00:00:00', timestamp)) NOT IN 
-            (SELECT timestamp FROM measurement_day)
-        GROUP BY strftime('%Y-%m-%d', timestamp)
-    """, (cutoff_90d.isoformat(),))
-    rows_day = cur.rowcount
-
-    
-    # 4. Cleanup: Alte Rohdaten löschen (älter als 48h)
-    cur.execute("DELETE FROM measurement WHERE timestamp < ?", (cutoff_48h.isoformat(),))
-    deleted_raw = cur.rowcount
-    
-    # 5. Cleanup: Alte Minuten-Daten löschen (älter als 7 Tage)
-    cur.execute("DELETE FROM measurement_minute WHERE timestamp < ?", (cutoff_7d.isoformat(),))
-    deleted_min = cur.rowcount
-    
-    # 6. Cleanup: Alte Stunden-Daten löschen (älter als 90 Tage)
-    cur.execute("DELETE FROM measurement_hour WHERE timestamp < ?", (cutoff_90d.isoformat(),))
-    deleted_hour = cur.rowcount
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"[{now.isoformat()}] Aggregation done:")
-    print(f"  + Minuten-Einträge: {rows_min}")
-    print(f"  + Stunden-Einträge: {rows_hour}")
-    print(f"  + Tages-Einträge: {rows_day}")
-    print(f"  - Rohdaten gelöscht: {deleted_raw}")
-    print(f"  - Minuten gelöscht: {deleted_min}")
-    print(f"  - Stunden gelöscht: {deleted_hour}")
+    if workers <= 1:
+        for path in paths:
+            aggregate(rebuild, now, path, verbose=verbose)
+        return
+    print(f"Aggregating {len(paths)} database(s) with {workers} worker processes", flush=True)
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool, \
+            ThreadPoolExecutor(len(paths)) as threads:
+        for done in [threads.submit(aggregate, rebuild, now, path, pool, verbose) for path in paths]:
+            done.result()
+
 
 if __name__ == "__main__":
-    aggregate()
+    parser = argparse.ArgumentParser(description="Smart Energy Pi Aggregation")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Watermarks ignorieren und alle Tiers vollständig neu berechnen")
+    parser.add_argument("--meter", help="nur diesen Zähler aggregieren (Standard: alle vorhandenen)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Worker-Prozesse für die Chunks (Standard: AGGREGATE_WORKERS, 1 = seriell)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Zeiten je Chunk ausgeben")
+    args = parser.parse_args()
+    # erst hier: meters.py importiert selbst aus diesem Modul
+    from meters import db_path, known_meters
+    ids = [args.meter] if args.meter else known_meters()
+    aggregate_all([db_path(i) for i in ids] or [DB_PATH], args.rebuild, args.workers, args.verbose)
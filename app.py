@@ -1,10 +1,19 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from datetime import datetime, timedelta
+from functools import partial
 from sqlalchemy import func
-from functools import lru_cache
 from dotenv import load_dotenv
-import threading, json, calendar, logging, os
+from ingest import BASELOAD_PERCENTILE
+import export, httpcache, metrics, schema, tariff
+from meters import DEFAULT_METER, MeterRegistry
+from subscriber import MQTT_AVAILABLE, resolve, run as run_mqtt, submit
+from storage import reader_url, reader_options, tune_reader
+from schema import hour_of_day
+from downsample import downsample, MODES
+from energy import kwh_for_buckets, minute_series, hour_series, bucket_means, from_epoch
+import threading, json, calendar, logging, os, atexit, signal, sys
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
@@ -19,62 +28,183 @@ WD_SHORT = T["calendar"]["weekdays_short"]
 WD_MAP = dict(zip(["Mon","Tue","Wed","Thu","Fri","Sat","Sun"], WD_SHORT))
 MONTHS_SHORT = T["calendar"]["months_short"]
 BASELOAD_HOURS = (int(os.getenv("BASELOAD_HOUR_START", 2)), int(os.getenv("BASELOAD_HOUR_END", 5)))
-PRICE_KWH = float(os.getenv("PRICE_KWH", 0.226))
 CURRENCY = os.getenv("CURRENCY_SYMBOL", "€")
-MQTT_HOST = os.getenv("MQTT_HOST", "127.0.0.1")
-MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
-MQTT_TOPIC = os.getenv("MQTT_TOPIC", "sensor")
-OBIS_POWER = os.getenv("OBIS_POWER", "1.7.0")
-OBIS_ENERGY = os.getenv("OBIS_ENERGY", "1.8.0")
-OBIS_ENERGY_DIVISOR = float(os.getenv("OBIS_ENERGY_DIVISOR", 1000))
-DB_PATH = os.getenv("DB_PATH", "instance/energy.db")
+# Zeiträume gelten erst als abgeschlossen, wenn auch verspätete Batches geschrieben sind
+CLOSE_GRACE = timedelta(minutes=2)
+
+
+
+class MeterSession(Session):
+    """Session, die jede Abfrage an die Lese-Engine des Zählers im aktuellen Kontext (g.meter) leitet."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and "meter" in g:
+            return g.meter.read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
 
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
+# Requests lesen read-only über den Lese-Pool des gewählten Zählers (meters.py),
+# Schema-Setup und Ingest schreiben je Zähler über eine eigene Engine mit einer Verbindung.
+app.config["SQLALCHEMY_DATABASE_URI"] = reader_url()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = reader_options()
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, metadata=schema.metadata, session_options={"class_": MeterSession})
+with app.app_context():
+    tune_reader(db.engine)
 
 
+# Tabellen kommen aus schema.py (Layout je nach DB_SCHEMA)
 class Measurement(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.now, index=True)
-    power_watt = db.Column(db.Float)
-    total_kwh = db.Column(db.Float)
+    __table__ = schema.measurement
 
 
 class MeasurementMinute(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, index=True)
-    power_avg = db.Column(db.Float)
-    power_max = db.Column(db.Float)
-    power_min = db.Column(db.Float)
-    total_kwh = db.Column(db.Float)
+    __table__ = schema.measurement_minute
 
 
 class MeasurementHour(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, index=True)
-    power_avg = db.Column(db.Float)
-    power_max = db.Column(db.Float)
-    power_min = db.Column(db.Float)
-    kwh_used = db.Column(db.Float)
+    __table__ = schema.measurement_hour
 
 
 class MeasurementDay(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, index=True)
-    power_avg = db.Column(db.Float)
-    power_max = db.Column(db.Float)
-    power_min = db.Column(db.Float)
-    kwh_used = db.Column(db.Float)
+    __table__ = schema.measurement_day
+
+
+class EnergyDaily(db.Model):
+    __table__ = schema.energy_daily
+
+
+class BaseloadDaily(db.Model):
+    __table__ = schema.baseload_daily
+
+
+def _register_listeners(meter):
+    # Quelle neuer Werte: eigener Ingest-Writer oder (Web-Worker) der Follower auf die DB
+    source = meter.writer or meter.follower
+    source.listeners += [partial(invalidate_cache, meter), partial(notify_updates, meter)]
+    meter.publisher.start(partial(publish_updates, meter))
+    if meter.follower:
+        meter.follower.on_readings.append(partial(publish_reading, meter))
+    metrics.instrument(meter.read_engine, meter.id, "read")
+    if meter.write_engine is not None:
+        metrics.instrument(meter.write_engine, meter.id, "write")
+
+
+meters = MeterRegistry(on_open=_register_listeners)
+
+
+def current_meter():
+    """Zähler des aktuellen Requests bzw. Kontexts (siehe select_meter)."""
+    return g.meter
+
+
+@app.before_request
+def start_profile():
+    """Misst Dauer und SQL-Abfragen des Requests (metrics.py)."""
+    g.metrics_token = metrics.start_request(request.endpoint)
+
+
+@app.after_request
+def finish_profile(response):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        profile = metrics.finish_request(token, request.method, response.status_code)
+        if profile is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(profile)
+    return response
+
+
+# nach finish_profile registriert, läuft also vorher (after_request in umgekehrter Reihenfolge)
+app.after_request(httpcache.finalize)
+
+
+@app.teardown_request
+def abort_profile(exc):
+    # Request ohne after_request (unbehandelte Exception)
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        metrics.finish_request(token, request.method, 500)
+
+
+@app.before_request
+def select_meter():
+    """?meter=<id> wählt den Zähler, ohne Parameter gilt DEFAULT_METER. Web-Worker (ohne Ingest)
+    beantworten API-Aufrufe mit 503, bis der Ingest-Prozess die Datenbank angelegt hat; Seite und
+    Assets brauchen keinen Zähler."""
+    meter_id = request.args.get("meter", DEFAULT_METER)
+    g.meter = meters.get(meter_id, create=meter_id == DEFAULT_METER)
+    if g.meter is None and not meters.pending(meter_id):
+        return jsonify({"error": f"Unknown meter: {meter_id}"}), 404
+    if g.meter is None and request.path.startswith("/api/"):
+        return jsonify({"error": "No data yet"}), 503
 
 
 def format_weekday(dt):
     return WD_MAP.get(dt.strftime("%a"), dt.strftime("%a")[:2]) + "."
 
 
+class Plan:
+    """Berechnungsplan eines Requests (bzw. App-Kontexts): ein gemeinsames `now` für alle Panels und
+    die kWh-Zeiträume, die schon berechnet sind. Panels melden ihre Zeiträume mit want() an,
+    resolve() berechnet alle offenen in einem Durchgang über kwh_for_buckets. Zeiträume, die
+    mehrere Panels brauchen (z.B. heute in Statistik und Zeitraum), kosten nur einmal."""
+
+    def __init__(self):
+        self.now = datetime.now()
+        self.kwh = {}
+        self.pending = {}
+        self.shapes = {}
+
+    def want(self, bounds):
+        for b in bounds:
+            if b not in self.kwh:
+                self.pending[b] = None
+
+    def resolve(self):
+        if self.pending:
+            bounds = list(self.pending)
+            self.kwh.update(zip(bounds, kwh_for_buckets(db.session.connection(), bounds)))
+            self.pending = {}
+
+    def kwh_for(self, bounds):
+        self.want(bounds)
+        self.resolve()
+        return [self.kwh[b] for b in bounds]
+
+    def hourly_shape(self, origin, n):
+        """Leistungsprofil je Stunde für die Kosten (tariff.hourly_shape), kürzere Zeiträume als Ausschnitt
+        eines schon geladenen."""
+        for (o, m), values in self.shapes.items():
+            lo = int((origin - o).total_seconds()) // 3600
+            if 0 <= lo and lo + n <= m:
+                return values[lo:lo + n]
+        values = self.shapes[(origin, n)] = tariff.hourly_shape(db.session.connection(), origin, n)
+        return values
+
+
+def plan():
+    """Plan des laufenden Requests, beim ersten Zugriff angelegt."""
+    if "plan" not in g:
+        g.plan = Plan()
+    return g.plan
+
+
+def parse_period(default="today"):
+    """(period, start_custom, end_custom) aus den Query-Parametern; ValueError("Invalid date") bei
+    fehlendem oder ungültigem Datum, ohne den Text des Parsers weiterzugeben."""
+    period = request.args.get("period", default)
+    if period != "custom":
+        return period, None, None
+    try:
+        return (period, datetime.fromisoformat(request.args.get("start")),
+                datetime.fromisoformat(request.args.get("end")) + timedelta(days=1))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date") from None
+
+
 def get_period_bounds(period, start_custom=None, end_custom=None):
-    now = datetime.now()
+    now = plan().now
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
     periods = {
@@ -92,161 +222,82 @@ def get_period_bounds(period, start_custom=None, end_custom=None):
     return periods.get(period, periods['today'])
 
 
+def cache_key(endpoint, period="today", start_custom=None, end_custom=None):
+    """(Schlüssel, abgeschlossen) für cached()."""
+    start, end = get_period_bounds(period, start_custom, end_custom)
+    closed = end <= plan().now - CLOSE_GRACE
+    return (endpoint, period, start, end if closed or period == "custom" else None, APP_LANG, tariff.version()), closed
+
+
+def cached(endpoint, build, period="today", start_custom=None, end_custom=None, immutable=False):
+    """Antwort aus dem Cache oder per build(period, start, end). Gibt (httpcache.Body, hit) zurück,
+    der Payload steht in `.payload`.
+
+    Schlüssel: (endpoint, period, start, end, lang, Tarifstand). Bei offenen Standard-Zeiträumen
+    wandert das Ende mit `now` und wird weggelassen; sie laufen nach CACHE_TTL ab.
+    Abgeschlossene Zeiträume mit festen Daten darf der Browser nur mit `immutable` behalten: Antworten
+    mit Kosten ändern sich mit TARIFF_FILE, ohne dass sich die URL ändert, und werden per ETag
+    revalidiert (304 ohne Body).
+    """
+    key, closed = cache_key(endpoint, period, start_custom, end_custom)
+    cache_control = httpcache.CLOSED if immutable and closed and period == "custom" else httpcache.REVALIDATE
+    return current_meter().cache.get(key, lambda: httpcache.Body.json(
+        build(period, start_custom, end_custom), app.json.dumps, cache_control=cache_control), closed)
+
+
+def cached_response(body, hit):
+    resp = httpcache.respond(body)
+    resp.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return resp
+
+
 def get_kwh_for_range(start, end):
     """Berechnet kWh für Zeitraum [start, end) - kombiniert alle Quellen chronologisch."""
-    total = 0.0
-    cursor = start
-    
-    day_kwh = db.session.query(func.sum(MeasurementDay.kwh_used)).filter(
-        MeasurementDay.timestamp >= start, MeasurementDay.timestamp < end
-    ).scalar() or 0
-    total += day_kwh
-    
-    day_last = MeasurementDay.query.filter(
-        MeasurementDay.timestamp >= start, MeasurementDay.timestamp < end
-    ).order_by(MeasurementDay.timestamp.desc()).first()
-    cursor = day_last.timestamp + timedelta(days=1) if day_last else start
-    
-    hour_kwh = db.session.query(func.sum(MeasurementHour.kwh_used)).filter(
-        MeasurementHour.timestamp >= cursor, MeasurementHour.timestamp < end
-    ).scalar() or 0
-    total += hour_kwh
-    
-    hour_last = MeasurementHour.query.filter(
-        MeasurementHour.timestamp >= cursor, MeasurementHour.timestamp < end
-    ).order_by(MeasurementHour.timestamp.desc()).first()
-    cursor = hour_last.timestamp + timedelta(hours=1) if hour_last else cursor
-    
-    minute_first = MeasurementMinute.query.filter(
-        MeasurementMinute.timestamp >= cursor, MeasurementMinute.timestamp < end
-    ).order_by(MeasurementMinute.timestamp.asc()).first()
-    minute_last = MeasurementMinute.query.filter(
-        MeasurementMinute.timestamp >= cursor, MeasurementMinute.timestamp < end
-    ).order_by(MeasurementMinute.timestamp.desc()).first()
-    
-    if minute_first and minute_last and minute_first.id != minute_last.id:
-        total += minute_last.total_kwh - minute_first.total_kwh
-        cursor = minute_last.timestamp + timedelta(minutes=1)
-    elif minute_last:
-        cursor = minute_last.timestamp + timedelta(minutes=1)
-    
-    raw_first = Measurement.query.filter(
-        Measurement.timestamp >= cursor, Measurement.timestamp < end
-    ).order_by(Measurement.timestamp.asc()).first()
-    raw_last = Measurement.query.filter(
-        Measurement.timestamp >= cursor, Measurement.timestamp < end
-    ).order_by(Measurement.timestamp.desc()).first()
-    
-    if raw_first and raw_last and raw_first.id != raw_last.id:
-        total += raw_last.total_kwh - raw_first.total_kwh
-    
-    return total
+    return get_kwh_for_ranges([(start, end)])[0]
 
 
-def get_history_data(start, end, resolution):
-    """Holt History-Daten mit automatischer Quellenauswahl."""
-    data = []
-    
-    if resolution == 'raw':
-        rows = Measurement.query.filter(
-            Measurement.timestamp >= start, Measurement.timestamp < end
-        ).order_by(Measurement.timestamp.asc()).all()
-        data = [(r.timestamp, r.power_watt) for r in rows]
-    
-    elif resolution == 'minute':
-        combined = {}
-        for m in MeasurementMinute.query.filter(
-            MeasurementMinute.timestamp >= start, MeasurementMinute.timestamp < end
-        ).all():
-            combined[m.timestamp.strftime("%Y-%m-%d %H:%M")] = (m.timestamp, m.power_avg)
-        
-        for m in Measurement.query.filter(
-            Measurement.timestamp >= start, Measurement.timestamp < end
-        ).all():
-            key = m.timestamp.strftime("%Y-%m-%d %H:%M")
-            if key not in combined:
-                combined[key] = (m.timestamp, m.power_watt)
-        
-        data = sorted(combined.values(), key=lambda x: x[0])
-    
-    elif resolution == 'hour':
-        combined = {}
-        for m in MeasurementHour.query.filter(
-            MeasurementHour.timestamp >= start, MeasurementHour.timestamp < end
-        ).all():
-            combined[m.timestamp.strftime("%Y-%m-%d %H")] = (m.timestamp, m.power_avg)
-        
-        for m in MeasurementMinute.query.filter(
-            MeasurementMinute.timestamp >= start, MeasurementMinute.timestamp < end
-        ).all():
-            key = m.timestamp.strftime("%Y-%m-%d %H")
-            if key not in combined:
-                combined[key] = (m.timestamp, m.power_avg)
-        
-        for m in Measurement.query.filter(
-            Measurement.timestamp >= start, Measurement.timestamp < end
-        ).all():
-            key = m.timestamp.strftime("%Y-%m-%d %H")
-            if key not in combined:
-                combined[key] = (m.timestamp, m.power_watt)
-        
-        data = sorted(combined.values(), key=lambda x: x[0])
-    
-    elif resolution == 'day':
-        combined = {}
-        for m in MeasurementDay.query.filter(
-            MeasurementDay.timestamp >= start, MeasurementDay.timestamp < end
-        ).all():
-            combined[m.timestamp.strftime("%Y-%m-%d")] = (m.timestamp, m.power_avg)
-        
-        for m in MeasurementHour.query.filter(
-            MeasurementHour.timestamp >= start, MeasurementHour.timestamp < end
-        ).all():
-            key = m.timestamp.strftime("%Y-%m-%d")
-            if key not in combined:
-                combined[key] = (m.timestamp, m.power_avg)
-        
-        data = sorted(combined.values(), key=lambda x: x[0])
-    
-    return data
+def get_kwh_for_ranges(bounds):
+    """kWh für mehrere Zeiträume [start, end) in einem Durchgang (4 Abfragen), über den Plan des
+    Requests: schon berechnete Zeiträume kommen aus dem Plan."""
+    return plan().kwh_for(bounds)
 
 
-def sample_data(data, max_points=300):
-    if len(data) <= max_points:
-        return data
-    step = max(1, len(data) // max_points)
-    return data[::step]
+def period_costs(start, end, bars=(), kwh=None, bar_kwh=None):
+    """Kosten für [start, end) gesamt, je Balken und je Band (tariff.costs); kWh je Tag über den Plan,
+    mit `kwh` auf die kWh des ganzen Zeitraums abgeglichen. Bei flachem Tarif reichen die kWh des
+    Zeitraums bzw. der Balken (`bar_kwh`), wenn sie bekannt sind."""
+    if tariff.calendar().flat and (kwh is not None or bar_kwh is not None):
+        return tariff.flat(kwh if kwh is not None else sum(bar_kwh), bar_kwh or ())
+    days = tariff.day_bounds(start, end)
+    return tariff.costs(db.session.connection(), days, get_kwh_for_ranges(days), bars, plan().now, kwh,
+                        plan().hourly_shape)
 
 
-try:
-    import paho.mqtt.client as mqtt
-    
-    def on_connect(client, userdata, flags, rc, properties=None):
-        log.info(f"MQTT connected: {rc}")
-        client.subscribe(MQTT_TOPIC)
-    
+def cost_days(start, end):
+    """Tage, deren kWh die Kosten brauchen (keine bei flachem Tarif)."""
+    return [] if tariff.calendar().flat else tariff.day_bounds(start, end)
+
+
+if MQTT_AVAILABLE:
     def on_message(client, userdata, msg):
-        try:
-            data = json.loads(msg.payload.decode())
-            watt = float(data.get(OBIS_POWER, 0))
-            kwh = float(data.get(OBIS_ENERGY, 0)) / OBIS_ENERGY_DIVISOR
-            with app.app_context():
-                db.session.add(Measurement(power_watt=watt, total_kwh=kwh))
-                db.session.commit()
-        except Exception as e:
-            log.error(f"MQTT message error: {e}")
-    
-    def start_mqtt():
-        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        client.on_connect = on_connect
-        client.on_message = on_message
-        client.connect(MQTT_HOST, MQTT_PORT, 60)
-        client.loop_forever()
-    
-    MQTT_AVAILABLE = True
-except ImportError:
-    log.warning("paho-mqtt not installed, MQTT disabled")
-    MQTT_AVAILABLE = False
+        reading = resolve(meters, msg)
+        if reading is None:
+            return
+        meter, watt, kwh = reading
+        now = datetime.now()
+        meter.live.push(now, watt, kwh)
+        publish_reading(meter)
+        submit(meter, now, watt, kwh)
+
+
+assets = httpcache.Assets(app.static_folder)
+# Texte ändern sich nur mit einem Neustart: einmal serialisieren, Version für die URL aus dem ETag
+I18N = httpcache.Body.json({**T, "currency": CURRENCY}, app.json.dumps)
+
+
+@app.context_processor
+def asset_urls():
+    return {"asset": assets.url, "i18n_version": I18N.etag}
 
 
 @app.route("/")
@@ -254,69 +305,152 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/assets/<path:name>")
+def asset(name):
+    body = assets.get(name)
+    if body is None:
+        return jsonify({"error": "Unknown asset"}), 404
+    return httpcache.respond(body)
+
+
 @app.route("/api/i18n")
 def api_i18n():
-    out = dict(T)
-    out["currency"] = CURRENCY
-    return jsonify(out)
+    return httpcache.respond(I18N, httpcache.IMMUTABLE if request.args.get("v") == I18N.etag else None)
 
 
-@app.route("/api/latest")
-def api_latest():
-    m = Measurement.query.order_by(Measurement.id.desc()).first()
+def _latest_from_db(now):
+    m = Measurement.query.order_by(Measurement.timestamp.desc()).first()
     if not m:
-        return jsonify({"power_watt": 0, "total_kwh": 0, "timestamp": None, "kwh_today": 0, "online": False})
-    
-    now = datetime.now()
+        return None, 0
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    first_today = Measurement.query.filter(Measurement.timestamp >= today_start).order_by(Measurement.id.asc()).first()
+    first_today = Measurement.query.filter(Measurement.timestamp >= today_start).order_by(Measurement.timestamp.asc()).first()
     kwh_today = m.total_kwh - first_today.total_kwh if first_today else 0
-    online = (now - m.timestamp).total_seconds() < 30
+    return (m.timestamp, m.power_watt, m.total_kwh), kwh_today
+
+
+def latest_payload():
+    now = datetime.now()
+    live = current_meter().live
+    if live.ready:
+        last, kwh_today = live.latest(), live.kwh_today(now)
+    else:
+        last, kwh_today = _latest_from_db(now)
+    if not last:
+        return {"power_watt": 0, "total_kwh": 0, "timestamp": None, "kwh_today": 0, "online": False}
+    
+    ts, power_watt, total_kwh = last
+    online = (now - ts).total_seconds() < 30
     
-    return jsonify({
-        "power_watt": m.power_watt,
-        "total_kwh": round(m.total_kwh, 2),
+    return {
+        "power_watt": power_watt,
+        "total_kwh": round(total_kwh, 2),
         "kwh_today": round(kwh_today, 2),
-        "timestamp": m.timestamp.isoformat(),
+        "timestamp": ts.isoformat(),
         "online": online,
-        "last_seen": m.timestamp.strftime("%H:%M:%S")
-    })
+        "last_seen": ts.strftime("%H:%M:%S")
+    }
 
 
-@app.route("/api/gauge-range")
-def api_gauge_range():
-    week_ago = datetime.now() - timedelta(days=7)
-    
+@app.route("/api/latest")
+def api_latest():
+    return jsonify(latest_payload())
+
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events: 'reading' je Messwert, 'stats'/'history'/'range' je abgeschlossener Minute.
+    Mit `points` (und `mode`) kommt 'history' als reduzierte Linie wie bei /api/history."""
+    try:
+        variants = {"history": history_args()}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(current_meter().broadcaster.stream([("reading", latest_payload())], variants),
+                    mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def publish_reading(meter):
+    """Neuer Messwert: an verbundene Dashboards verteilen."""
+    if len(meter.broadcaster):
+        with app.app_context():
+            g.meter = meter
+            meter.broadcaster.publish("reading", latest_payload())
+
+
+def invalidate_cache(meter, closed):
+    """Writer-Listener: offene Zeiträume verwerfen, sobald eine Minute abgeschlossen ist."""
+    if any(tier == "minute" for tier, _ in closed):
+        meter.cache.invalidate_open()
+
+
+def notify_updates(meter, closed):
+    """Writer-Listener: nach jeder abgeschlossenen Minute den Publisher wecken. Läuft im Writer-Thread,
+    berechnet wird in publish_updates."""
+    if len(meter.broadcaster) and any(tier == "minute" for tier, _ in closed):
+        meter.publisher.notify()
+
+
+def publish_updates(meter):
+    """Publisher-Thread: Statistik einmal berechnen und an alle Clients verteilen."""
+    if not len(meter.broadcaster):
+        return
+    with app.app_context():
+        g.meter = meter
+        meter.broadcaster.publish("stats", cached("stats", lambda *_: stats_payload())[0].payload)
+        meter.broadcaster.publish("gauge", gauge_payload())
+        # je gewählter Form einmal, aus demselben Cache-Eintrag wie /api/history
+        for variant in meter.broadcaster.variants("history"):
+            payload = cached(*history_build(variant))[0].payload
+            meter.broadcaster.publish("history", payload, variant=variant)
+        meter.broadcaster.publish("range", cached("stats-range", stats_range_payload)[0].payload)
+
+
+def _peak_from_db(since):
     peaks = [
-        db.session.query(func.max(MeasurementHour.power_max)).filter(MeasurementHour.timestamp >= week_ago).scalar(),
-        db.session.query(func.max(MeasurementMinute.power_max)).filter(MeasurementMinute.timestamp >= week_ago).scalar(),
-        db.session.query(func.max(Measurement.power_watt)).filter(Measurement.timestamp >= week_ago).scalar(),
+        db.session.query(func.max(MeasurementHour.power_max)).filter(MeasurementHour.timestamp >= since).scalar(),
+        db.session.query(func.max(MeasurementMinute.power_max)).filter(MeasurementMinute.timestamp >= since).scalar(),
+        db.session.query(func.max(Measurement.power_watt)).filter(Measurement.timestamp >= since).scalar(),
     ]
-    peak = max(filter(None, peaks), default=1000)
+    return max(filter(None, peaks), default=None)
+
+
+def gauge_payload():
+    now = datetime.now()
+    live = current_meter().live
+    peak = live.peak_7d(now) if live.ready else _peak_from_db(now - timedelta(days=7))
+    peak = peak or 1000
     gauge_max = int((peak // 1000 + 1) * 1000)
     
-    return jsonify({
+    return {
         "peak_7d": round(peak, 0),
         "gauge_max": gauge_max,
         "zone_green": int(gauge_max * 0.15),
         "zone_yellow": int(gauge_max * 0.35),
         "zone_orange": int(gauge_max * 0.60)
-    })
+    }
 
 
-@app.route("/api/stats")
-def api_stats():
-    now = datetime.now()
+@app.route("/api/gauge-range")
+def api_gauge_range():
+    return jsonify(gauge_payload())
+
+
+def stats_ranges(now):
+    """Zeiträume der Statistik: heute, gestern, dieser Monat, Vormonat, danach die Tage des Monats (Kosten)."""
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    yesterday_start = today_start - timedelta(days=1)
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    prev_month_end = month_start
     prev_month_start = (month_start - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    kwh_today = get_kwh_for_range(today_start, now)
-    kwh_yesterday = get_kwh_for_range(yesterday_start, today_start)
-    kwh_month = get_kwh_for_range(month_start, now)
-    kwh_prev_month = get_kwh_for_range(prev_month_start, prev_month_end)
+    return [(today_start, now), (today_start - timedelta(days=1), today_start),
+            (month_start, now), (prev_month_start, month_start)] + cost_days(month_start, now)
+
+
+def stats_payload():
+    now = plan().now
+    ranges = stats_ranges(now)
+    yesterday_start, month_start, prev_month_start = ranges[1][0], ranges[2][0], ranges[3][0]
+    kwh_today, kwh_yesterday, kwh_month, kwh_prev_month = get_kwh_for_ranges(ranges)[:4]
+    month = period_costs(month_start, now, kwh=kwh_month)
+    # mittlerer Preis des Monats (bei flachem Tarif PRICE_KWH)
+    price = month["cost"] / kwh_month if kwh_month > 0 and not tariff.calendar().flat else tariff.PRICE_KWH
     
     if kwh_month > 0:
         hours_in_month = (now - month_start).total_seconds() / 3600
@@ -338,45 +472,193 @@ def api_stats():
     else:
         month_change_pct = 0
     
-    baseload = db.session.query(func.min(Measurement.power_watt)).filter(
-        Measurement.timestamp >= yesterday_start,
-        func.cast(func.strftime('%H', Measurement.timestamp), db.Integer).between(*BASELOAD_HOURS)
-    ).scalar() or 0
-    
-    return jsonify({
+    # Grundlast der letzten beiden Nächte, vom Ingest live bzw. von aggregate.py gespeichert
+    baseload, baseload_pct = db.session.query(
+        func.min(BaseloadDaily.min_watt), func.min(BaseloadDaily.percentile_watt)
+    ).filter(BaseloadDaily.timestamp >= yesterday_start).one()
+    if baseload is None:
+        # noch nichts gespeichert (z.B. LIVE_ROLLUPS aus und Cronjob noch nicht gelaufen)
+        baseload = db.session.query(func.min(Measurement.power_watt)).filter(
+            Measurement.timestamp >= yesterday_start,
+            db.literal_column(hour_of_day("measurement.timestamp")).between(*BASELOAD_HOURS)
+        ).scalar()
+    
+    return {
         "kwh_today": round(kwh_today, 2),
         "kwh_yesterday": round(kwh_yesterday, 2),
         "kwh_month": round(kwh_month, 2),
         "kwh_prev_month": round(kwh_prev_month, 2),
         "month_change_pct": round(month_change_pct, 1),
         "prognosis_month": round(prognosis_month, 1),
-        "prognosis_cost": round(prognosis_month * PRICE_KWH, 2),
-        "cost_month": round(kwh_month * PRICE_KWH, 2),
-        "baseload_watt": round(baseload, 0),
-        "price_kwh": PRICE_KWH
-    })
+        "prognosis_cost": round(prognosis_month * price, 2),
+        "cost_month": month["cost"],
+        "cost_month_bands": month["bands"],
+        "baseload_watt": round(baseload or 0, 0),
+        "baseload_percentile_watt": round(baseload_pct, 0) if baseload_pct is not None else None,
+        "price_kwh": round(price, 4)
+    }
+
+
+@app.route("/api/stats")
+def api_stats():
+    return cached_response(*cached("stats", lambda *_: stats_payload()))
+
+
+@app.route("/api/baseload")
+def api_baseload():
+    """Grundlast je Tag (Minimum und Perzentil im Nachtfenster) für Trends über Wochen und Monate."""
+    try:
+        selected = parse_period("month")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return cached_response(*cached("baseload", baseload_payload, *selected, immutable=True))
+
+
+def baseload_payload(period, start_custom=None, end_custom=None):
+    start, end = get_period_bounds(period, start_custom, end_custom)
+    rows = BaseloadDaily.query.filter(
+        BaseloadDaily.timestamp >= start.replace(hour=0, minute=0, second=0, microsecond=0),
+        BaseloadDaily.timestamp < end
+    ).order_by(BaseloadDaily.timestamp).all()
+    return {
+        "period": period,
+        "hours": list(BASELOAD_HOURS),
+        "percentile": BASELOAD_PERCENTILE,
+        "days": [{
+            "date": r.timestamp.date().isoformat(),
+            "min_watt": round(r.min_watt, 0),
+            "percentile_watt": round(r.percentile_watt, 0) if r.percentile_watt is not None else None,
+            "samples": r.samples,
+        } for r in rows],
+    }
+
+
+@app.route("/api/cache-stats")
+def api_cache_stats():
+    return jsonify(current_meter().cache.stats())
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus-Textformat für alle geöffneten Zähler."""
+    opened = list(meters.meters.values())
+    return Response(metrics.render(metrics.meter_lines(opened)), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/api/meters")
+def api_meters():
+    return jsonify({"meters": meters.ids(), "default": DEFAULT_METER})
+
+
+@app.route("/api/export")
+def api_export():
+    """Roh- oder Aggregatdaten eines Zeitraums als CSV-/NDJSON-Stream, optional gzip."""
+    fmt = request.args.get("format", "csv")
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    try:
+        table = export.resolve(request.args.get("tier", "minute"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    try:
+        selected = parse_period()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start, end = get_period_bounds(*selected)
+    name = export.filename(table, start, end, fmt, compress)
+    return Response(export.stream(current_meter().read_engine, table, start, end, fmt, compress),
+                    mimetype="application/gzip" if compress else export.FORMATS[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{name}"'})
 
 
 @app.route("/api/history")
 def api_history():
-    period = request.args.get("period", "today")
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    start_custom = end_custom = None
-    if period == "custom":
-        try:
-            start_custom = datetime.fromisoformat(request.args.get("start"))
-            end_custom = datetime.fromisoformat(request.args.get("end")) + timedelta(days=1)
-        except:
-            return jsonify({"labels": [], "data": [], "period": "custom", "error": "Invalid date"})
-    
-    start, end = get_period_bounds(period, start_custom, end_custom)
+    try:
+        selected = parse_period()
+        endpoint, build = history_build(history_args())
+    except ValueError as e:
+        return jsonify({"labels": [], "data": [], "period": request.args.get("period", "today"), "error": str(e)}), 400
+    return cached_response(*cached(endpoint, build, *selected))
+
+
+def history_args():
+    """(points, mode) aus den Query-Parametern, None ohne `points`; ValueError bei ungültigen Werten."""
+    points = request.args.get("points", type=int)
+    mode = request.args.get("mode", "lttb")
+    if points is None:
+        return None
+    if points < 2 or mode not in MODES:
+        raise ValueError("Invalid points or mode")
+    return points, mode
+
+
+def history_build(args=None):
+    """(Cache-Endpoint, build) des Verlaufs; mit (points, mode) aus history_args() kommt der
+    Tagesverlauf als reduzierte Linie."""
+    if args is None:
+        return "history", history_payload
+    points, mode = args
+    return f"history:{mode}:{points}", partial(history_payload, points=points, mode=mode)
+
+
+def history_resolution(period, start, end):
+    """Balken des Verlaufs: 'hours', 'months' oder 'days'."""
     days_span = (end - start).days + ((end - start).seconds > 0)
-    
     if period in ('today', 'yesterday') or (period == 'custom' and days_span <= 2):
+        return "hours"
+    return "months" if period == 'year' or (period == 'custom' and days_span >= 49) else "days"
+
+
+def history_ranges(period, start_custom=None, end_custom=None):
+    """kWh-Zeiträume, die history_payload braucht (Stundenbalken kommen aus minute_series, die Tage
+    für die Kosten braucht jede Auflösung)."""
+    start, end = get_period_bounds(period, start_custom, end_custom)
+    resolution = history_resolution(period, start, end)
+    bars = [] if resolution == "hours" else month_ranges(start, end) if resolution == "months" else day_ranges(start, end)
+    return bars + cost_days(min([start] + [s for s, _ in bars]), end)
+
+
+def day_ranges(start, end):
+    days = []
+    cursor = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while cursor < end:
+        next_day = cursor + timedelta(days=1)
+        days.append((cursor, min(next_day, end)))
+        cursor = next_day
+    return days
+
+
+def month_ranges(start, end):
+    months = []
+    cursor = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while cursor < end:
+        next_m = (cursor.replace(day=28) + timedelta(days=4)).replace(day=1)
+        months.append((cursor, min(next_m, end)))
+        cursor = next_m
+    return months
+
+
+def cost_fields(start, end, bars, bar_kwh=None):
+    """Kosten des Verlaufs: je Balken (`costs`), gesamt und je Band. Der erste Monatsbalken kann vor
+    `start` beginnen; gerechnet wird über alle Balken, damit die Summe zu den Balken passt."""
+    c = period_costs(min([start] + [s for s, _ in bars]), end, bars, bar_kwh=bar_kwh)
+    return {"costs": c["bars"], "cost": c["cost"], "cost_bands": c["bands"], "kwh_estimated": c["kwh_estimated"]}
+
+
+def history_payload(period, start_custom=None, end_custom=None, points=None, mode="lttb"):
+    now = plan().now
+    start, end = get_period_bounds(period, start_custom, end_custom)
+    resolution = history_resolution(period, start, end)
+    
+    if resolution == "hours":
+        if points:
+            line = _history_line(start, end, period, points, mode)
+            if line:
+                return line
         return _history_hours(start, end, now, period)
-    elif period == 'year' or (period == 'custom' and days_span >= 49):
+    elif resolution == "months":
         return _history_months(start, end, now, period)
     else:
         return _history_days(start, end, now, period)
@@ -384,142 +666,197 @@ def api_history():
 
 def _history_hours(start, end, now, period):
     bars = []
-    cursor = start.replace(minute=0, second=0, microsecond=0)
-    has_data = False
-    days_span = (end - start).days + ((end - start).seconds > 0)
-    multi_day = days_span > 1
+    hours = []
+    origin = cursor = start.replace(minute=0, second=0, microsecond=0)
     while cursor < end:
-        next_h = cursor + timedelta(hours=1)
-        bound = min(next_h, end)
-        data = get_history_data(cursor, bound, 'minute')
-        if data:
-            avg_w = sum(v for _, v in data) / len(data)
-        else:
-            raw = get_history_data(cursor, bound, 'raw')
-            avg_w = sum(v for _, v in raw) / len(raw) if raw else 0
+        hours.append(cursor)
+        cursor += timedelta(hours=1)
+    conn = db.session.connection()
+    ts, watt = minute_series(conn, origin, end)
+    has_data = False
+    for cursor, avg_w in zip(hours, bucket_means(ts, watt, origin, 3600, len(hours))):
         if avg_w > 0:
             has_data = True
         if avg_w > 0 or cursor < now:
             wd = WD_MAP.get(cursor.strftime("%a"), cursor.strftime("%a")[:2])
             tooltip = f"{wd} {cursor.strftime('%d.%m.')} {cursor.strftime('%H:%M')}"
-            bars.append({"label": cursor.strftime("%H:%M"), "tooltip": tooltip, "value": round(avg_w, 1), "is_weekend": False})
-        cursor = next_h
+            bars.append({"label": cursor.strftime("%H:%M"), "tooltip": tooltip, "value": round(avg_w, 1), "is_weekend": False,
+                         "bounds": (cursor, cursor + timedelta(hours=1))})
     
     non_zero = sum(1 for b in bars if b["value"] > 0)
     if non_zero < 2 and has_data is False:
-        hour_rows = MeasurementHour.query.filter(
-            MeasurementHour.timestamp >= start, MeasurementHour.timestamp < end
-        ).order_by(MeasurementHour.timestamp.asc()).all()
-        if hour_rows:
+        hour_ts, hour_avg = hour_series(conn, start, end)
+        if len(hour_ts):
             bars = []
-            for r in hour_rows:
-                wd = WD_MAP.get(r.timestamp.strftime("%a"), r.timestamp.strftime("%a")[:2])
-                tooltip = f"{wd} {r.timestamp.strftime('%d.%m.')} {r.timestamp.strftime('%H:%M')}"
-                bars.append({"label": r.timestamp.strftime("%H:%M"), "tooltip": tooltip, "value": round(r.power_avg, 1), "is_weekend": False})
+            for sec, avg_w in zip(hour_ts, hour_avg):
+                ts = from_epoch(sec)
+                wd = WD_MAP.get(ts.strftime("%a"), ts.strftime("%a")[:2])
+                tooltip = f"{wd} {ts.strftime('%d.%m.')} {ts.strftime('%H:%M')}"
+                bars.append({"label": ts.strftime("%H:%M"), "tooltip": tooltip, "value": round(avg_w, 1), "is_weekend": False,
+                             "bounds": (ts, ts + timedelta(hours=1))})
             has_data = True
     
     if not has_data or sum(1 for b in bars if b["value"] > 0) < 2:
         return _history_days(start, end, now, period)
     
     avg = sum(b["value"] for b in bars) / len(bars) if bars else 0
-    return jsonify({
+    return {
         "labels": [b["label"] for b in bars],
         "tooltips": [b["tooltip"] for b in bars],
         "data": [b["value"] for b in bars],
         "period": period, "chart_type": "bar", "bar_unit": "watt",
         "is_weekend": [False] * len(bars),
-        "avg_kwh": round(avg, 1)
-    })
+        "avg_kwh": round(avg, 1),
+        **cost_fields(start, end, [b["bounds"] for b in bars])
+    }
+
+
+def _history_line(start, end, period, points, mode):
+    """Minutenverlauf als Linie, formerhaltend auf `points` Punkte reduziert (None ohne Daten)."""
+    ts, watt = minute_series(db.session.connection(), start, end)
+    if len(ts) < 2:
+        return None
+    idx = downsample(ts, watt, points, mode)
+    stamps = [from_epoch(ts[i]) for i in idx]
+    multi_day = stamps[0].date() != stamps[-1].date()
+    return {
+        "labels": [t.strftime("%d.%m. %H:%M" if multi_day else "%H:%M") for t in stamps],
+        "tooltips": [f"{WD_MAP.get(t.strftime('%a'), t.strftime('%a')[:2])} {t.strftime('%d.%m. %H:%M')}" for t in stamps],
+        "data": [round(float(watt[i]), 1) for i in idx],
+        "period": period, "chart_type": "line", "bar_unit": "watt",
+        "is_weekend": [False] * len(idx),
+        "avg_kwh": round(float(sum(watt)) / len(watt), 1),
+        **cost_fields(start, end, [])
+    }
 
 
 def _history_days(start, end, now, period):
     bars = []
-    cursor = start.replace(hour=0, minute=0, second=0, microsecond=0)
-    while cursor < end:
-        next_day = cursor + timedelta(days=1)
-        kwh = get_kwh_for_range(cursor, min(next_day, end))
+    days = day_ranges(start, end)
+    for bounds, kwh in zip(days, get_kwh_for_ranges(days)):
+        cursor = bounds[0]
         if kwh > 0 or cursor < now:
             wd_en = cursor.strftime("%a")
             wd_de = WD_MAP.get(wd_en, wd_en[:2])
             bars.append({
                 "label": f"{wd_de} {cursor.strftime('%d.%m.')}",
                 "value": round(kwh, 3),
-                "is_weekend": wd_en in ("Sat", "Sun")
+                "is_weekend": wd_en in ("Sat", "Sun"),
+                "bounds": bounds, "kwh": kwh
             })
-        cursor = next_day
     avg = sum(b["value"] for b in bars) / len(bars) if bars else 0
-    return jsonify({
+    return {
         "labels": [b["label"] for b in bars],
         "data": [b["value"] for b in bars],
         "period": period, "chart_type": "bar", "bar_unit": "kwh",
         "is_weekend": [b["is_weekend"] for b in bars],
-        "avg_kwh": round(avg, 2)
-    })
+        "avg_kwh": round(avg, 2),
+        **cost_fields(start, end, [b["bounds"] for b in bars], [b["kwh"] for b in bars])
+    }
 
 
 def _history_months(start, end, now, period):
     bars = []
-    cursor = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    while cursor < end:
+    months = month_ranges(start, end)
+    for bounds, kwh in zip(months, get_kwh_for_ranges(months)):
+        cursor = bounds[0]
         y, m = cursor.year, cursor.month
-        next_m = (cursor.replace(day=28) + timedelta(days=4)).replace(day=1)
-        kwh = get_kwh_for_range(cursor, min(next_m, end))
         if kwh > 0 or cursor < now:
             bars.append({
                 "label": f"{MONTHS_SHORT[m-1]} {y}" if (end - start).days > 365 else MONTHS_SHORT[m-1],
                 "value": round(kwh, 2),
-                "is_weekend": False
+                "is_weekend": False,
+                "bounds": bounds, "kwh": kwh
             })
-        cursor = next_m
     avg = sum(b["value"] for b in bars) / len(bars) if bars else 0
-    return jsonify({
+    return {
         "labels": [b["label"] for b in bars],
         "data": [b["value"] for b in bars],
         "period": period, "chart_type": "bar", "bar_unit": "kwh",
         "is_weekend": [False] * len(bars),
-        "avg_kwh": round(avg, 2)
-    })
+        "avg_kwh": round(avg, 2),
+        **cost_fields(start, end, [b["bounds"] for b in bars], [b["kwh"] for b in bars])
+    }
 
 
 @app.route("/api/stats-range")
 def api_stats_range():
-    period = request.args.get("period", "today")
-    
-    start_custom = end_custom = None
-    if period == "custom":
-        try:
-            start_custom = datetime.fromisoformat(request.args.get("start"))
-            end_custom = datetime.fromisoformat(request.args.get("end")) + timedelta(days=1)
-        except:
-            return jsonify({"kwh": 0, "cost": 0, "period": "custom", "change_pct": None, "prev_label": ""})
-    
+    try:
+        selected = parse_period()
+    except ValueError as e:
+        return jsonify({"kwh": 0, "cost": 0, "period": "custom", "change_pct": None, "prev_label": "",
+                        "error": str(e)}), 400
+    return cached_response(*cached("stats-range", stats_range_payload, *selected))
+
+
+def stats_range_ranges(period, start_custom=None, end_custom=None):
+    """Zeitraum und gleich langer Vorzeitraum, danach die Tage des Zeitraums (Kosten)."""
     start, end = get_period_bounds(period, start_custom, end_custom)
-    kwh = get_kwh_for_range(start, end)
-    
-    span = end - start
-    prev_end = start
-    prev_start = prev_end - span
-    
+    return [(start, end), (start - (end - start), start)] + cost_days(start, end)
+
+
+def stats_range_payload(period, start_custom=None, end_custom=None):
     prev_labels = T.get("prev_period", {})
     
-    kwh_prev = get_kwh_for_range(prev_start, prev_end)
+    ranges = stats_range_ranges(period, start_custom, end_custom)
+    kwh, kwh_prev = get_kwh_for_ranges(ranges)[:2]
     change_pct = round(((kwh / kwh_prev) - 1) * 100, 1) if kwh_prev > 0 else None
+    costs = period_costs(*ranges[0], kwh=kwh)
     
-    return jsonify({
+    return {
         "kwh": round(kwh, 2),
-        "cost": round(kwh * PRICE_KWH, 2),
+        "cost": costs["cost"],
+        "cost_bands": costs["bands"],
         "period": period,
         "change_pct": change_pct,
         "prev_label": prev_labels.get(period, 'Vorzeitraum')
-    })
+    }
+
 
 
+# Panels des Dashboards: (Name in der Antwort, Cache-Endpoint, build, kWh-Zeiträume, nutzt den Zeitraum)
+DASHBOARD_PANELS = [
+    ("stats", "stats", lambda *_: stats_payload(), lambda *_: stats_ranges(plan().now), False),
+    ("history", "history", history_payload, history_ranges, True),
+    ("range", "stats-range", stats_range_payload, stats_range_ranges, True),
+]
+
+
+@app.route("/api/dashboard")
+def api_dashboard():
+    """Alle Panels in einer Antwort. Die kWh-Zeiträume der Panels, die nicht im Cache liegen, werden
+    gesammelt und in einem Durchgang berechnet; die Einzel-Endpoints nutzen dieselben Funktionen."""
+    try:
+        selected = parse_period()
+        history = history_build(history_args())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    cache = current_meter().cache
+    panels = [(name, *(history if name == "history" else (endpoint, build)), ranges, selected if ranged else ("today",))
+              for name, endpoint, build, ranges, ranged in DASHBOARD_PANELS]
+    for _, endpoint, _, ranges, args in panels:
+        if not cache.fresh(cache_key(endpoint, *args)[0]):
+            plan().want(ranges(*args))
+    plan().resolve()
+    payload, hits = {"latest": latest_payload(), "gauge": gauge_payload()}, []
+    for name, endpoint, build, _, args in panels:
+        body, hit = cached(endpoint, build, *args)
+        payload[name] = body.payload
+        hits.append(hit)
+    resp = jsonify(payload)
+    resp.headers["X-Cache"] = "HIT" if all(hits) else "MISS" if not any(hits) else "PARTIAL"
+    return resp
+
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
+    # Standard-Zähler immer, weitere Zähler mit vorhandener Datenbank vorab öffnen
+    for meter_id in [DEFAULT_METER] + [m for m in meters.ids() if m != DEFAULT_METER]:
+        meters.get(meter_id, create=True)
+    meters.start()
+    atexit.register(meters.close)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     
     if MQTT_AVAILABLE:
-        threading.Thread(target=start_mqtt, daemon=True).start()
+        threading.Thread(target=run_mqtt, args=(on_message,), daemon=True).start()
     
     app.run(
         host=os.getenv("FLASK_HOST", "0.0.0.0"),
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Archiv (Cold Storage) für Smart Energy Pi
+
+Tageswerte (measurement_day, energy_daily) bleiben für immer, Stundenwerte
+90 Tage. Statt in der Haupt-DB liegen abgeschlossene Jahre (oder Monate)
+dieser Tabellen als Segmentdateien im Verzeichnis `<db>.archive/`:
+
+- eine Datei je Tabelle und Zeitraum (`energy_daily.2023.seg`), Spalten als
+  Arrays fester Breite (Zeitstempel als Epoch-Sekunden, Differenzen zum
+  Vorgänger; Werte als double bzw. int64), je Block von BLOCK_ROWS Zeilen
+  und Spalte mit zlib komprimiert
+- ein kleiner Zeitindex im Kopf (erster/letzter Zeitstempel je Block), gelesen
+  wird per mmap nur, was ein Zeitraum braucht
+- manifest.json mit der Grenze `until`: alles davor kommt aus dem Archiv,
+  Zeilen der archivierten Tabellen vor `until` in der DB werden ignoriert
+
+energy.py (kWh, Stunden-Zeitreihe) und der Export lesen
+das Archiv transparent mit. Archiviert wird nur, was aggregate.py schon zu
+Tages- bzw. Tageszusammenfassungs-Werten verarbeitet hat; Minuten- und
+Rohdaten gibt es in diesen Zeiträumen nicht mehr. baseload_daily bleibt in
+der DB.
+
+Zeilen, die backfill.py später in einen archivierten Zeitraum schreibt,
+übernimmt der nächste Lauf ins Segment (die DB-Zeile gewinnt). `--restore`
+schreibt alles zurück in die DB und entfernt das Archiv.
+
+Läuft mit ARCHIVE_AFTER_DAYS > 0 am Ende jedes aggregate.py-Laufs, oder von
+Hand:
+
+    python archive.py --older-than 400 [--by month] [--meter ID] [--vacuum]
+    python archive.py --restore
+"""
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+import argparse, json, logging, math, mmap, os, struct, sys, threading, time, zlib
+
+from sqlalchemy import Integer, delete, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import schema
+from schema import from_epoch, to_epoch
+from storage import DB_PATH, db_file, writer_engine
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 0))
+ARCHIVE_BY = os.getenv("ARCHIVE_BY", "year")
+TABLES = ("energy_daily", "measurement_day", "measurement_hour")
+BLOCK_ROWS = 1024
+MAGIC = b"SEPSEG01"
+MANIFEST = "manifest.json"
+NULL_INT = -(2 ** 63)
+
+
+def folder(path):
+    return path + ".archive"
+
+
+def period_start(dt, by):
+    return datetime(dt.year, 1, 1) if by == "year" else datetime(dt.year, dt.month, 1)
+
+
+def period_name(dt, by):
+    return f"{dt:%Y}" if by == "year" else f"{dt:%Y-%m}"
+
+
+def _columns(table):
+    """(Name, Typecode) der Wertespalten: int64 für Ganzzahlen, sonst double."""
+    return [(c.name, "q" if isinstance(c.type, Integer) else "d")
+            for c in table.columns if c.name not in ("id", "timestamp")]
+
+
+def _pack(value, code):
+    if value is None:
+        return NULL_INT if code == "q" else math.nan
+    return value
+
+
+def _unpack(value, code):
+    if code == "q":
+        return None if value == NULL_INT else value
+    return None if value != value else value
+
+
+def write_segment(path, table, rows):
+    """Schreibt `rows` [(datetime, *werte)], nach Zeit sortiert, atomar als Segment nach `path`."""
+    cols = _columns(table)
+    blocks, chunks, offset = [], [], 0
+    for i in range(0, len(rows), BLOCK_ROWS):
+        part = rows[i:i + BLOCK_ROWS]
+        ts = [to_epoch(r[0]) for r in part]
+        arrays = [array("q", [ts[0]] + [b - a for a, b in zip(ts, ts[1:])])]
+        arrays += [array(code, (_pack(r[j], code) for r in part)) for j, (_, code) in enumerate(cols, 1)]
+        spans = []
+        for a in arrays:
+            data = zlib.compress(a.tobytes(), 6)
+            spans.append([offset, len(data)])
+            chunks.append(data)
+            offset += len(data)
+        blocks.append([ts[0], ts[-1], len(part), spans])
+    header = json.dumps({"table": table.name, "columns": [["timestamp", "q"]] + [list(c) for c in cols],
+                         "rows": len(rows), "byteorder": sys.byteorder, "blocks": blocks}).encode()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for data in chunks:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Segment:
+    """Eine Segmentdatei, per mmap gelesen; entpackte Blöcke bleiben im Speicher (Segmente ändern sich nie)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not an archive segment: {path}")
+        (size,) = struct.unpack_from("<I", self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.mm[start:start + size])
+        self.base = start + size
+        self.name = os.path.basename(path)
+        self.table = header["table"]
+        self.columns = [c for c, _ in header["columns"]]
+        self.codes = [code for _, code in header["columns"]]
+        self.swap = header["byteorder"] != sys.byteorder
+        self.blocks = header["blocks"]
+        self.rows = header["rows"]
+        self.first, self.last = self.blocks[0][0], self.blocks[-1][1]
+        self._decoded = {}
+
+    def block(self, i):
+        """Spalten von Block `i` als Arrays (Zeitstempel absolut)."""
+        cols = self._decoded.get(i)
+        if cols is None:
+            cols = []
+            for (offset, length), code in zip(self.blocks[i][3], self.codes):
+                a = array(code, zlib.decompress(self.mm[self.base + offset:self.base + offset + length]))
+                if self.swap:
+                    a.byteswap()
+                cols.append(a)
+            cols[0] = array("q", accumulate(cols[0]))
+            cols = self._decoded[i] = cols
+        return cols
+
+    def read(self, lo, hi, columns):
+        """Zeilen mit lo <= ts < hi (Epoch-Sekunden): (Zeitstempel, [Arrays je Spalte aus `columns`])."""
+        idx = [self.columns.index(c) for c in columns]
+        ts, out = array("q"), [array(self.codes[i]) for i in idx]
+        for i, (first, last, _, _) in enumerate(self.blocks):
+            if last < lo or first >= hi:
+                continue
+            cols = self.block(i)
+            a, b = bisect_left(cols[0], lo), bisect_left(cols[0], hi)
+            ts += cols[0][a:b]
+            for o, j in zip(out, idx):
+                o += cols[j][a:b]
+        return ts, out
+
+    def records(self):
+        """Alle Zeilen als (datetime, *werte) wie aus der DB."""
+        for i in range(len(self.blocks)):
+            cols = self.block(i)
+            for row in zip(*cols):
+                yield (from_epoch(row[0]), *(_unpack(v, c) for v, c in zip(row[1:], self.codes[1:])))
+
+
+class Archive:
+    """Archiv einer Datenbank; lädt Segmente neu, sobald sich das Manifest ändert (z.B. durch aggregate.py)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = folder(path)
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.until = None
+        self.by = None
+        self.segments = {}
+
+    def refresh(self):
+        try:
+            st = os.stat(os.path.join(self.folder, MANIFEST))
+        except FileNotFoundError:
+            self.stamp, self.until, self.segments = None, None, {}
+            return self
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp != self.stamp:
+            with self.lock:
+                with open(os.path.join(self.folder, MANIFEST)) as f:
+                    manifest = json.load(f)
+                self.segments = {table: sorted((Segment(os.path.join(self.folder, name)) for name in names),
+                                               key=lambda s: s.first)
+                                 for table, names in manifest["segments"].items()}
+                self.until, self.by = from_epoch(manifest["until"]), manifest["by"]
+                self.stamp = stamp
+        return self
+
+    def rows(self, table, lo, hi, *columns):
+        """Zeilen von `table` mit lo <= ts < hi (Epoch-Sekunden) über alle Segmente."""
+        ts, out = array("q"), None
+        for seg in self.segments.get(table, ()):
+            if seg.last < lo or seg.first >= hi:
+                continue
+            t, cols = seg.read(lo, hi, columns)
+            ts += t
+            out = cols if out is None else [o + c for o, c in zip(out, cols)]
+        return ts, out or [array("d") for _ in columns]
+
+    def points(self, table, column, start, end):
+        """[(datetime, wert)] für [start, end), Nullwerte ausgelassen (wie die Tier-Abfragen in app.py)."""
+        ts, (values,) = self.rows(table, to_epoch(start), to_epoch(min(end, self.until)), column)
+        return [(from_epoch(t), v) for t, v in zip(ts, values) if v == v]
+
+    def records(self, table, start, end):
+        """Zeilen (datetime, *werte) von `table` in [start, end) vor `until`, für den Export."""
+        lo, hi = to_epoch(start), to_epoch(min(end, self.until))
+        for seg in self.segments.get(table, ()):
+            if seg.last >= lo and seg.first < hi:
+                yield from (r for r in seg.records() if lo <= to_epoch(r[0]) < hi)
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def of(bind):
+    """Archiv zur Datenbank einer Verbindung oder Engine; None, solange nichts archiviert ist."""
+    path = db_file(getattr(bind, "engine", bind))
+    store = _archives.get(path)
+    if store is None:
+        with _archives_lock:
+            store = _archives.setdefault(path, Archive(path))
+    store.refresh()
+    return store if store.until is not None else None
+
+
+def _write_manifest(store, until, by, segments):
+    tmp = os.path.join(store.folder, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": 1, "until": to_epoch(until), "by": by, "segments": segments}, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(store.folder, MANIFEST))
+
+
+def archive(engine, now=None, older_than=ARCHIVE_AFTER_DAYS, by=ARCHIVE_BY, report=None):
+    """Verschiebt abgeschlossene Zeiträume vor `now - older_than` Tagen aus der DB ins Archiv.
+
+    Die Grenze liegt höchstens bei den Watermarks von Tages-Tier und
+    energy_daily. Gibt (Zeilen, gelöscht, Sekunden, Lock-Sekunden, max. Lock)
+    wie aggregate_tier zurück.
+    """
+    t0 = time.perf_counter()
+    now = now or datetime.now()
+    store = Archive(db_file(engine)).refresh()
+    by = store.by or by
+    with engine.connect() as conn:
+        wm = dict(conn.execute(text("SELECT tier, watermark FROM aggregate_state WHERE tier IN ('day', 'daily')")).fetchall())
+    if len(wm) < 2 or None in wm.values():
+        return 0, 0, time.perf_counter() - t0, 0.0, 0.0
+    limit = min(now - timedelta(days=older_than), *(from_epoch(w) if isinstance(w, int) else datetime.fromisoformat(w)
+                                                    for w in wm.values()))
+    until = max(period_start(limit, by), store.until or datetime.min)
+    os.makedirs(store.folder, exist_ok=True)
+
+    segments = {table: [s.name for s in segs] for table, segs in store.segments.items()}
+    written = 0
+    for name in TABLES:
+        table = schema.metadata.tables[name]
+        cols = [table.c.timestamp] + [table.c[c] for c, _ in _columns(table)]
+        with engine.connect() as conn:
+            rows = conn.execute(select(*cols).where(table.c.timestamp < until).order_by(table.c.timestamp)).fetchall()
+        periods = {}
+        for row in rows:
+            periods.setdefault(period_name(row[0], by), []).append(tuple(row))
+        for period, part in periods.items():
+            file = f"{name}.{period}.seg"
+            merged = {}
+            if file in segments.get(name, []):
+                merged = {r[0]: r for r in Segment(os.path.join(store.folder, file)).records()}
+            merged.update((r[0].replace(microsecond=0), r) for r in part)
+            write_segment(os.path.join(store.folder, file), table, [merged[k] for k in sorted(merged)])
+            if file not in segments.setdefault(name, []):
+                segments[name].append(file)
+            written += len(part)
+            if report:
+                report(f"    archive {file}: {len(part)} rows from the database, {len(merged)} in the segment")
+    _write_manifest(store, until, by, segments)
+
+    # erst jetzt löschen: ab dem neuen Manifest ignorieren die Leser diese Zeilen ohnehin
+    deleted = 0
+    lock_total = lock_max = 0.0
+    for name in TABLES:
+        table = schema.metadata.tables[name]
+        t_lock = time.perf_counter()
+        with engine.begin() as conn:
+            deleted += max(conn.execute(delete(table).where(table.c.timestamp < until)).rowcount, 0)
+        held = time.perf_counter() - t_lock
+        lock_total += held
+        lock_max = max(lock_max, held)
+    return written, deleted, time.perf_counter() - t0, lock_total, lock_max
+
+
+def restore(engine):
+    """Schreibt alle archivierten Zeilen zurück in die DB (vorhandene Zeilen gewinnen) und entfernt das Archiv."""
+    store = Archive(db_file(engine)).refresh()
+    if store.until is None:
+        return 0
+    restored = 0
+    for name, segs in store.segments.items():
+        table = schema.metadata.tables[name]
+        names = ["timestamp"] + [c for c, _ in _columns(table)]
+        insert = sqlite_insert(table).on_conflict_do_nothing(index_elements=["timestamp"])
+        for seg in segs:
+            rows = [dict(zip(names, r)) for r in seg.records()]
+            with engine.begin() as conn:
+                conn.execute(insert, rows)
+            restored += len(rows)
+    # Manifest zuerst: ab hier lesen alle wieder aus der DB
+    os.remove(os.path.join(store.folder, MANIFEST))
+    for name in os.listdir(store.folder):
+        os.remove(os.path.join(store.folder, name))
+    os.rmdir(store.folder)
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Energy Pi: alte Tages- und Stundenwerte archivieren")
+    parser.add_argument("--older-than", type=int, default=ARCHIVE_AFTER_DAYS or 365,
+                        help="nur Zeiträume, die so viele Tage zurückliegen (Standard: ARCHIVE_AFTER_DAYS bzw. 365)")
+    parser.add_argument("--by", choices=("year", "month"), default=ARCHIVE_BY,
+                        help="ein Segment je Jahr oder Monat (gilt für ein neues Archiv)")
+    parser.add_argument("--restore", action="store_true", help="Archiv in die DB zurückschreiben und entfernen")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="danach VACUUM (verkleinert die Datei, blockiert den Ingest so lange)")
+    parser.add_argument("--meter", help="nur dieser Zähler (Standard: alle vorhandenen)")
+    args = parser.parse_args()
+    # erst hier: aggregate.py und meters.py importieren dieses Modul
+    from aggregate import ensure_schema, run_lock
+    from meters import db_path, known_meters
+
+    ids = [args.meter] if args.meter else known_meters()
+    for path in [db_path(i) for i in ids] or [DB_PATH]:
+        if not os.path.exists(path):
+            print(f"DB not found: {path}")
+            continue
+        with run_lock(path) as acquired:
+            if not acquired:
+                print(f"Aggregation of {path} is running, skipped")
+                continue
+            engine = writer_engine(path)
+            with engine.begin() as conn:
+                ensure_schema(conn.connection.cursor())
+            if args.restore:
+                print(f"{path}: {restore(engine)} rows restored")
+            else:
+                lines = []
+                rows, deleted, secs, _, lock_max = archive(engine, older_than=args.older_than, by=args.by,
+                                                           report=lines.append)
+                until = Archive(path).refresh().until
+                print("\n".join([f"{path}: {rows} rows archived, {deleted} deleted from the database in {secs:.1f} s "
+                                 f"(archive until {until:%Y-%m-%d})" if until else f"{path}: nothing to archive"]
+                                + lines))
+            if args.vacuum:
+                size = os.path.getsize(path)
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("VACUUM")
+                print(f"{path}: vacuumed, {size / 1e6:.1f} -> {os.path.getsize(path) / 1e6:.1f} MB")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
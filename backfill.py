@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Import historischer Zählerdaten für Smart Energy Pi
+
+Liest CSV- oder JSONL-Exporte (optional .gz) mit denselben OBIS-Schlüsseln
+wie der MQTT-Payload und schreibt sie direkt in die passende Stufe:
+
+    python backfill.py export-2024.csv.gz export-2025.jsonl
+
+Jede Zeile braucht einen Zeitstempel (Spalte/Feld `timestamp`, `time` oder
+`Time`; ISO-8601 oder Unix-Sekunden) sowie OBIS_POWER und OBIS_ENERGY.
+Die Werte müssen chronologisch sortiert sein (über alle Dateien hinweg).
+
+Die Datensätze laufen als Generator-Kette durch denselben Rollup wie der
+Live-Ingest. Gespeichert wird, was nach der Retention von aggregate.py
+noch vorhanden wäre: Rohwerte der letzten 48 h, Minuten der letzten 7 Tage,
+Stunden der letzten 90 Tage, Tageswerte, energy_daily und baseload_daily
+immer. Geschrieben wird in Batches zu je einer Transaktion, der
+Speicherbedarf bleibt auch bei zig Millionen Zeilen konstant.
+
+Bestehende Aggregate bleiben erhalten (`--replace` überschreibt sie), Rohwerte
+im Zeitraum bereits vorhandener Rohdaten werden übersprungen. Archivierte
+Zeiträume (archive.py) sieht der Import nicht: dort geschriebene Zeilen
+ersetzen beim nächsten Archivlauf die archivierten.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import archive, schema
+from aggregate import TIERS, TS_FORMAT, ensure_schema, floor_ts
+from ingest import OBIS_ENERGY, OBIS_POWER, Rollup, decode_reading
+from meters import DEFAULT_METER, db_path
+from storage import checkpoint, writer_engine
+
+BATCH_SIZE = 20000
+PROGRESS_EVERY = 1000000
+TIME_FIELDS = ("timestamp", "time", "Time")
+
+TIER_TABLES = {"minute": schema.measurement_minute, "hour": schema.measurement_hour,
+               "day": schema.measurement_day, "daily": schema.energy_daily, "baseload": schema.baseload_daily}
+TIER_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1),
+              "day": timedelta(days=1), "daily": timedelta(days=1), "baseload": timedelta(days=1)}
+
+
+def open_text(path):
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+def read_records(path):
+    """Datensätze einer Datei als dicts (CSV mit Kopfzeile oder eine JSON-Zeile je Wert)."""
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_text(path) as f:
+        if name.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_time(value):
+    """ISO-8601 oder Unix-Sekunden als lokale, naive Zeit."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            dt = datetime.fromisoformat(value)
+            return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+    return datetime.fromtimestamp(value)
+
+
+def readings(records, stats):
+    """Datensätze -> (ts, watt, kwh); Ungültige und nicht aufsteigende Zeilen werden gezählt und verworfen."""
+    last = None
+    for rec in records:
+        stats["read"] += 1
+        try:
+            ts = parse_time(next(rec[k] for k in TIME_FIELDS if rec.get(k) not in (None, "")))
+            if OBIS_POWER not in rec or OBIS_ENERGY not in rec:
+                raise KeyError(OBIS_POWER)
+            watt, kwh = decode_reading(rec)
+        except (StopIteration, KeyError, TypeError, ValueError, OverflowError):
+            stats["invalid"] += 1
+            continue
+        if last is not None and ts <= last:
+            stats["unordered"] += 1
+            continue
+        last = ts
+        yield ts, watt, kwh
+
+
+def retention_cutoffs(now):
+    """Frühester Zeitstempel, den aggregate.py je Quelltabelle noch aufbewahrt."""
+    return {source: floor_ts(now - age, step) for _, source, _, step, age, *_ in TIERS}
+
+
+class Importer:
+    """Sammelt Zeilen pro Tabelle und schreibt sie batchweise in je einer Transaktion."""
+
+    def __init__(self, engine, now, batch_size=BATCH_SIZE, replace=False):
+        self.engine = engine
+        self.now = now
+        self.batch_size = batch_size
+        self.cutoffs = retention_cutoffs(now)
+        table = schema.measurement
+        # wie im Ingest: im kompakten Layout gewinnt der letzte Wert je Sekunde
+        self.raw_insert = table.insert() if "id" in table.c else table.insert().prefix_with("OR REPLACE")
+        self.tier_inserts = {tier: self._tier_insert(t, replace) for tier, t in TIER_TABLES.items()}
+        with engine.connect() as conn:
+            self.raw_range = conn.execute(select(func.min(table.c.timestamp), func.max(table.c.timestamp))).one()
+        self.pending = {name: [] for name in ("raw", *TIER_TABLES)}
+        self.size = 0
+        self.written = dict.fromkeys(self.pending, 0)
+        self.skipped = {"overlap": 0, "retention": 0, "open": 0}
+
+    @staticmethod
+    def _tier_insert(table, replace):
+        stmt = sqlite_insert(table)
+        if not replace:
+            return stmt.on_conflict_do_nothing(index_elements=["timestamp"])
+        cols = [c.name for c in table.columns if c.name not in ("id", "timestamp")]
+        return stmt.on_conflict_do_update(index_elements=["timestamp"], set_={c: stmt.excluded[c] for c in cols})
+
+    def add_raw(self, ts, watt, kwh):
+        lo, hi = self.raw_range
+        if ts < self.cutoffs["measurement"]:
+            return
+        if lo is not None and lo <= ts <= hi:
+            self.skipped["overlap"] += 1
+            return
+        self._add("raw", {"timestamp": ts, "power_watt": watt, "total_kwh": kwh})
+
+    def add_closed(self, closed):
+        keep = {"minute": self.cutoffs["measurement_minute"], "hour": self.cutoffs["measurement_hour"]}
+        for tier, row in closed:
+            if row["timestamp"] + TIER_STEPS[tier] > self.now:
+                self.skipped["open"] += 1
+            elif tier in keep and row["timestamp"] < keep[tier]:
+                self.skipped["retention"] += 1
+            else:
+                self._add(tier, row)
+
+    def _add(self, name, row):
+        self.pending[name].append(row)
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        with self.engine.begin() as conn:
+            for name, rows in self.pending.items():
+                if rows:
+                    result = conn.execute(self.raw_insert if name == "raw" else self.tier_inserts[name], rows)
+                    self.written[name] += max(result.rowcount, 0)
+                    rows.clear()
+        self.size = 0
+
+
+def backfill(paths, engine, now=None, batch_size=BATCH_SIZE, replace=False, progress=True):
+    now = now or datetime.now()
+    stats = {"read": 0, "invalid": 0, "unordered": 0}
+    importer = Importer(engine, now, batch_size, replace)
+    rollup = Rollup()
+    t0 = time.perf_counter()
+    records = (rec for path in paths for rec in read_records(path))
+    for ts, watt, kwh in readings(records, stats):
+        importer.add_closed(rollup.add(ts, watt, kwh))
+        importer.add_raw(ts, watt, kwh)
+        if progress and stats["read"] % PROGRESS_EVERY == 0:
+            rate = stats["read"] / (time.perf_counter() - t0)
+            print(f"  {stats['read']:,} rows read ({rate:,.0f} rows/s), at {ts:%Y-%m-%d %H:%M}", file=sys.stderr)
+    importer.add_closed(rollup.close_all())
+    importer.flush()
+    with engine.begin() as conn:
+        # neuer Stand in aggregate_state: laufende Apps verwerfen ihren Cache
+        conn.execute(text("""INSERT INTO aggregate_state (tier, watermark, updated_at) VALUES ('backfill', NULL, :u)
+            ON CONFLICT(tier) DO UPDATE SET updated_at = excluded.updated_at"""),
+                     {"u": datetime.now().strftime(TS_FORMAT)})
+    with engine.connect() as conn:
+        checkpoint(conn, optimize=True)
+    return stats, importer.written, importer.skipped, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Energy Pi: Import historischer Zählerdaten")
+    parser.add_argument("files", nargs="+", help="CSV- oder JSONL-Dateien (auch .gz), chronologisch")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Zeilen pro Transaktion")
+    parser.add_argument("--replace", action="store_true", help="bestehende Aggregate überschreiben")
+    parser.add_argument("--meter", default=DEFAULT_METER, help="Ziel-Zähler (Standard: DEFAULT_METER)")
+    args = parser.parse_args()
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            return
+    path = db_path(args.meter)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    engine = writer_engine(path)
+    with engine.begin() as conn:
+        ensure_schema(conn.connection.cursor())
+
+    cold = archive.of(engine)
+    if cold is not None:
+        print(f"Note: data before {cold.until:%Y-%m-%d} is archived; imported rows before that date replace the "
+              f"archived ones on the next archive run (run `python archive.py --restore` first to keep them)")
+
+    stats, written, skipped, secs = backfill(args.files, engine, batch_size=args.batch, replace=args.replace)
+    print(f"Backfill done: {stats['read']:,} rows in {secs:.1f} s ({stats['read'] / max(secs, 1e-9):,.0f} rows/s)")
+    print(f"  invalid: {stats['invalid']:,}, out of order: {stats['unordered']:,}, "
+          f"overlapping raw data: {skipped['overlap']:,}")
+    labels = {"raw": "measurement", **{tier: t.name for tier, t in TIER_TABLES.items()}}
+    for name, rows in written.items():
+        print(f"  + {labels[name]}: {rows:,}")
+    print(f"  not stored: {skipped['retention']:,} aggregates beyond retention, {skipped['open']:,} open periods")
+
+
+if __name__ == "__main__":
+    main()
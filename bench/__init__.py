@@ -0,0 +1 @@
+"""Benchmarks für Smart Energy Pi (Aufruf jeweils mit `python -m bench.<name>`)."""
@@ -0,0 +1,227 @@
+"""
+MQTT-Broker als Stand-in für Lasttests
+
+    python -m bench.broker --port 1883
+
+Minimaler MQTT-3.1.1-Broker in einem Thread je Verbindung: CONNECT,
+PUBLISH (QoS 0 und 1), SUBSCRIBE/UNSUBSCRIBE mit `+` und `#`, PINGREQ,
+DISCONNECT. Weitergeleitet wird immer mit QoS 0 und ohne Sessions; was
+ankommt, während kein Abonnent passt, ist verloren (wie bei einem echten
+Broker mit Clean Session). Reicht für subscriber.py (paho-mqtt) und die
+Publisher aus bench.mqttload, ersetzt aber keinen Mosquitto im Betrieb.
+
+`kick()` trennt alle Abonnenten, um Reconnects zu testen.
+"""
+import argparse, socket, socketserver, struct, threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 10, 11, 12, 13, 14
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        n, digit = n >> 7, n & 0x7F
+        out.append(digit | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def packet(kind, body, flags=0):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def string(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def publish_packet(topic, payload):
+    return packet(PUBLISH, string(topic) + payload)
+
+
+def connect_packet(client_id, keepalive=60):
+    """CONNECT für MQTT 3.1.1 mit Clean Session."""
+    return packet(CONNECT, string("MQTT") + bytes([4, 0x02]) + struct.pack("!H", keepalive) + string(client_id))
+
+
+def read_packet(f):
+    """(Typ, Flags, Body) aus einem Datei-Objekt, None bei geschlossener Verbindung."""
+    first = f.read(1)
+    if not first:
+        return None
+    length, shift = 0, 0
+    while True:
+        b = f.read(1)
+        if not b:
+            return None
+        length |= (b[0] & 0x7F) << shift
+        shift += 7
+        if not b[0] & 0x80:
+            break
+    body = f.read(length)
+    if len(body) < length:
+        return None
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+def matches(pattern, topic):
+    p, t = pattern.split("/"), topic.split("/")
+    for i, level in enumerate(p):
+        if level == "#":
+            return True
+        if i >= len(t) or (level != "+" and level != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+class Session:
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.filters = set()
+
+    def send(self, data):
+        with self.lock:
+            self.sock.sendall(data)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = Session(self.request)
+        broker.add(session)
+        try:
+            while (p := read_packet(self.rfile)) is not None:
+                kind, flags, body = p
+                if kind == CONNECT:
+                    session.send(packet(CONNACK, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    (n,) = struct.unpack_from("!H", body)
+                    topic, pos = body[2:2 + n].decode(), 2 + n
+                    if flags & 0x06:
+                        session.send(packet(PUBACK, body[pos:pos + 2]))
+                        pos += 2
+                    broker.route(topic, body[pos:])
+                elif kind == SUBSCRIBE:
+                    pid, pos, granted = body[:2], 2, bytearray()
+                    while pos < len(body):
+                        (n,) = struct.unpack_from("!H", body, pos)
+                        session.filters.add(body[pos + 2:pos + 2 + n].decode())
+                        pos += 3 + n
+                        granted.append(0)
+                    broker.subscribed.set()
+                    session.send(packet(SUBACK, pid + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        (n,) = struct.unpack_from("!H", body, pos)
+                        session.filters.discard(body[pos + 2:pos + 2 + n].decode())
+                        pos += 2 + n
+                    session.send(packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    session.send(packet(PINGRESP, b""))
+                elif kind == DISCONNECT:
+                    break
+        except OSError:
+            pass
+        finally:
+            broker.remove(session)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Broker:
+    """Broker auf 127.0.0.1:`port` (0 = freier Port) in Hintergrund-Threads."""
+
+    def __init__(self, port=0, host="127.0.0.1"):
+        self.server = _Server((host, port), _Handler)
+        self.server.broker = self
+        self.port = self.server.server_address[1]
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.subscribed = threading.Event()
+        self.counters = {"received": 0, "delivered": 0, "unrouted": 0, "kicked": 0}
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="mqtt-broker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            sessions = list(self.sessions)
+        for s in sessions:
+            self._close(s)
+
+    def add(self, session):
+        with self.lock:
+            self.sessions.add(session)
+
+    def remove(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def route(self, topic, payload):
+        data = None
+        delivered = 0
+        with self.lock:
+            targets = [s for s in self.sessions if any(matches(f, topic) for f in s.filters)]
+        for s in targets:
+            data = data or publish_packet(topic, payload)
+            try:
+                s.send(data)
+                delivered += 1
+            except OSError:
+                pass
+        with self.lock:
+            self.counters["received"] += 1
+            self.counters["delivered"] += delivered
+            if not delivered:
+                self.counters["unrouted"] += 1
+
+    def subscribers(self):
+        with self.lock:
+            return sum(1 for s in self.sessions if s.filters)
+
+    def kick(self):
+        """Trennt alle Abonnenten (sie verbinden sich selbst neu und abonnieren erneut)."""
+        with self.lock:
+            targets = [s for s in self.sessions if s.filters]
+            self.counters["kicked"] += len(targets)
+            self.subscribed.clear()
+        for s in targets:
+            self._close(s)
+        return len(targets)
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimaler MQTT-Broker für Tests (QoS 0/1, keine Sessions)")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = Broker(args.port, host="0.0.0.0").start()
+    print(f"MQTT stand-in broker on :{broker.port}, Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: Lese-Latenz während Ingest und Aggregation schreiben
+
+    python -m bench.concurrency [--seconds 20] [--readers 4] [--rate 50] [--days 14]
+
+Führt dieselbe Last zweimal auf einer frischen synthetischen DB aus:
+
+  legacy  Rollback-Journal, Standard-Engine, sqlite3.connect für die Aggregation
+  tuned   storage.py (WAL, Pragmas, eine Schreib-Verbindung, Lese-Pool)
+
+Parallel laufen: der gepufferte Ingest-Writer mit `rate` Messwerten/s und
+`readers` Threads mit Dashboard-Abfragen im selben Prozess (wie in app.py),
+dazu die Aggregation als eigener Prozess wie der Cronjob (simulierte Zeit
+läuft pro Durchgang 2 h weiter, damit jeder Durchgang echte Arbeit hat).
+"""
+import argparse, math, multiprocessing, os, random, sqlite3, tempfile, threading, time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import schema, storage
+from aggregate import TIERS, aggregate_tier, ensure_schema
+from energy import kwh_for_buckets, minute_series
+from ingest import IngestWriter
+
+STEP = timedelta(seconds=10)
+
+
+def create_db(path, days, journal):
+    """Rohdaten alle 10 s über `days` Tage bis jetzt."""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA journal_mode = {journal}")
+        ensure_schema(conn.connection.cursor())
+    rnd = random.Random(1)
+    now = datetime.now()
+    t = (now - timedelta(days=days)).replace(second=0, microsecond=0)
+    start, kwh, rows = t, 1000.0, []
+    while t < now:
+        watt = 300 + 200 * math.sin(t.hour / 24 * 2 * math.pi) + rnd.random() * 600
+        kwh += watt * STEP.total_seconds() / 3600000
+        rows.append({"timestamp": t, "power_watt": watt, "total_kwh": kwh})
+        t += STEP
+    with engine.begin() as conn:
+        conn.execute(schema.measurement.insert(), rows)
+    engine.dispose()
+    return start, kwh
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def aggregate(mode, path, start, stop, results):
+    """Aggregation als eigener Prozess wie der Cronjob; simulierte Zeit +2 h je Durchgang."""
+    conn = storage.connect(path) if mode == "tuned" else sqlite3.connect(path, timeout=30)
+    agg = {"runs": 0, "errors": 0, "lock_max": 0.0}
+    sim_now = start + timedelta(hours=49)
+    while not stop.is_set() and sim_now < datetime.now():
+        try:
+            for tier, *spec in TIERS:
+                *_, held_max = aggregate_tier(conn, tier, *spec, now=sim_now)
+                agg["lock_max"] = max(agg["lock_max"], held_max)
+            agg["runs"] += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            agg["errors"] += 1
+        sim_now += timedelta(hours=2)
+        stop.wait(0.05)
+    conn.close()
+    results.put(agg)
+
+
+def run(mode, args):
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    path = os.path.join(tmp, "energy.db")
+    start, kwh = create_db(path, args.days, "WAL" if mode == "tuned" else "DELETE")
+    if mode == "tuned":
+        write, read = storage.writer_engine(path), storage.reader_engine(path)
+    else:
+        write = read = create_engine(f"sqlite:///{path}")
+
+    stop = threading.Event()
+    latencies, read_errors = [], [0]
+    lock = threading.Lock()
+
+    writer = IngestWriter(schema.measurement,
+                          flush_seconds=0.5, batch_size=100)
+    writer.start(write)
+
+    def produce():
+        nonlocal kwh
+        interval = 1.0 / args.rate
+        due = time.monotonic()
+        while not stop.is_set():
+            watt = random.uniform(200, 3000)
+            kwh += watt * interval / 3600000
+            writer.submit(datetime.now(), watt, kwh)
+            due += interval
+            time.sleep(max(0.0, due - time.monotonic()))
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            now = datetime.now()
+            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            t0 = time.perf_counter()
+            try:
+                with read.connect() as conn:
+                    if rnd.random() < 0.5:
+                        days = [(today - timedelta(days=i), today - timedelta(days=i - 1)) for i in range(30, 0, -1)]
+                        kwh_for_buckets(conn, days + [(today, now)])
+                    else:
+                        minute_series(conn, today, now)
+            except OperationalError:
+                with lock:
+                    read_errors[0] += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    agg_stop, results = multiprocessing.Event(), multiprocessing.Queue()
+    agg_proc = multiprocessing.Process(target=aggregate, args=(mode, path, start, agg_stop, results))
+    agg_proc.start()
+    threads = [threading.Thread(target=produce)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    agg_stop.set()
+    for t in threads:
+        t.join()
+    writer.stop()
+    agg = results.get()
+    agg_proc.join()
+    s = writer.stats()
+    return {
+        "mode": mode, "reads": len(latencies), "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0), "read_errors": read_errors[0],
+        "written": s["written"], "failed_batches": s["failed_batches"], "max_flush_ms": s["max_flush_ms"],
+        "agg_runs": agg["runs"], "agg_errors": agg["errors"], "agg_lock_max_ms": agg["lock_max"] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lese-Latenz unter Schreiblast (legacy vs. tuned)")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=50, help="Messwerte pro Sekunde")
+    parser.add_argument("--days", type=int, default=14, help="Tage synthetischer Rohdaten")
+    parser.add_argument("--mode", choices=["both", "legacy", "tuned"], default="both")
+    args = parser.parse_args()
+
+    modes = ["legacy", "tuned"] if args.mode == "both" else [args.mode]
+    print(f"{'mode':8s} {'reads':>7s} {'p50':>7s} {'p95':>7s} {'p99':>8s} {'max':>8s} {'errors':>6s} "
+          f"{'written':>8s} {'failed':>6s} {'flush':>8s} {'agg':>5s} {'agg err':>7s} {'agg lock':>9s}")
+    for mode in modes:
+        r = run(mode, args)
+        print(f"{r['mode']:8s} {r['reads']:7d} {r['p50']:6.1f}ms {r['p95']:6.1f}ms {r['p99']:7.1f}ms "
+              f"{r['max']:7.1f}ms {r['read_errors']:6d} {r['written']:8d} {r['failed_batches']:6d} "
+              f"{r['max_flush_ms']:6.1f}ms {r['agg_runs']:5d} {r['agg_errors']:7d} {r['agg_lock_max_ms']:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Synthetische Datenbanken für Benchmarks
+
+    python -m bench.fixtures --years 2 -o /tmp/energy-2y.db
+
+Erzeugt Messwerte mit realistischem Verlauf bis jetzt: Grundlast mit
+Kühlschrank-Zyklen, Morgen-, Mittags- und Abendspitzen, mehr Verbrauch im
+Winter und am Wochenende, kurze Lastspitzen (Wasserkocher, Herd) und
+Rauschen. Die letzten `raw_days` Tage haben 1 Hz, davor ein Messwert alle
+`history_step` Sekunden, damit auch zehn Jahre in Minuten entstehen.
+
+Minuten-, Stunden- und Tageswerte sowie energy_daily und baseload_daily
+erzeugt anschließend das echte aggregate.py mit seinen Retention-Regeln,
+in Wochenschritten über den ganzen Zeitraum. Die Datei sieht danach aus wie
+eine lange laufende Installation.
+"""
+import argparse, contextlib, io, math, os, random, time
+from datetime import datetime, timedelta
+
+import schema
+from aggregate import aggregate, ensure_schema
+from storage import writer_engine
+
+RAW_DAYS = 8
+HISTORY_STEP = 60
+BATCH = 50000
+AGGREGATE_EVERY = timedelta(days=7)
+
+
+class LoadProfile:
+    """Leistung in Watt zu einem Zeitpunkt; deterministisch über `seed`.
+
+    Der Verlauf wird je Minute berechnet, pro Messwert kommt nur Rauschen dazu.
+    """
+
+    def __init__(self, seed=1):
+        self.seed = seed
+        self.minute = None
+        self.level = 0.0
+        self.rnd = random.Random(seed)
+
+    def _level(self, t, minute):
+        h = t.hour + t.minute / 60
+        shape = (350 * math.exp(-((h - 7) ** 2) / 1.5) + 450 * math.exp(-((h - 12.5) ** 2) / 1.0)
+                 + 700 * math.exp(-((h - 19.5) ** 2) / 4.0))
+        if t.weekday() >= 5:
+            shape *= 1.2
+        season = 1 + 0.3 * math.cos(2 * math.pi * (t.timetuple().tm_yday - 15) / 365)
+        fridge = 90 if minute % 45 < 15 else 0
+        # einige Minuten pro Tag mit Wasserkocher, Herd oder Waschmaschine (Hash statt Zufallsfolge,
+        # damit der Verlauf nicht von der Schrittweite abhängt)
+        r = ((minute * 2654435761 + self.seed * 40503) % 4294967296) / 4294967296
+        spike = 2000.0 if r < 0.004 else 1200.0 if r < 0.012 else 0.0
+        return 110 + fridge + shape * season + spike
+
+    def __call__(self, t):
+        minute = t.toordinal() * 1440 + t.hour * 60 + t.minute
+        if minute != self.minute:
+            self.minute, self.level = minute, self._level(t, minute)
+        return self.level * (0.95 + 0.1 * self.rnd.random())
+
+
+def readings(start, end, raw_since, step, profile):
+    """(ts, watt, kwh) von `start` bis `end`; ab `raw_since` im Sekundentakt."""
+    t, kwh = start, 1000.0
+    while t < end:
+        dt = 1 if t >= raw_since else step
+        watt = profile(t)
+        kwh += watt * dt / 3600000
+        yield t, watt, kwh
+        t += timedelta(seconds=dt)
+
+
+def generate(path, years=1, raw_days=RAW_DAYS, history_step=HISTORY_STEP, seed=1, now=None, verbose=False):
+    """Legt `path` neu an und füllt die Datei; gibt Zeilen je Tabelle und Sekunden zurück."""
+    now = (now or datetime.now()).replace(microsecond=0)
+    start = (now - timedelta(days=round(365.25 * years))).replace(hour=0, minute=0, second=0)
+    raw_since = now - timedelta(days=raw_days)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    t0 = time.perf_counter()
+    engine = writer_engine(path)
+    with engine.begin() as conn:
+        ensure_schema(conn.connection.cursor())
+    insert = schema.measurement.insert()
+    batch, total = [], 0
+    for ts, watt, kwh in readings(start, now, raw_since, history_step, LoadProfile(seed)):
+        batch.append({"timestamp": ts, "power_watt": watt, "total_kwh": kwh})
+        if len(batch) >= BATCH:
+            with engine.begin() as conn:
+                conn.execute(insert, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(insert, batch)
+        total += len(batch)
+    engine.dispose()
+    if verbose:
+        print(f"  {total:,} readings written in {time.perf_counter() - t0:.1f} s")
+
+    # wie der Cronjob über die Jahre: Aggregation in Wochenschritten, damit energy_daily und
+    # baseload_daily jeden Tag noch aus feinen Daten berechnen
+    t1 = time.perf_counter()
+    out = io.StringIO()
+    sim_now = start + AGGREGATE_EVERY
+    with contextlib.redirect_stdout(out):
+        while sim_now < now:
+            aggregate(now=sim_now, path=path)
+            sim_now += AGGREGATE_EVERY
+        aggregate(now=now, path=path)
+    if verbose:
+        print(f"  aggregated in {time.perf_counter() - t1:.1f} s, last run:")
+        print(out.getvalue().rstrip().split("\n[")[-1].join(["  [", ""]))
+    engine = writer_engine(path)
+    with engine.connect() as conn:
+        # Platz der aggregierten Rohwerte freigeben, Dateigröße wie im Betrieb
+        conn.exec_driver_sql("VACUUM")
+        counts = table_counts(conn)
+    engine.dispose()
+    return counts, time.perf_counter() - t0
+
+
+def table_counts(conn):
+    return {name: conn.exec_driver_sql(f"SELECT COUNT(*) FROM {name}").scalar() for name in schema.metadata.tables}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetische Datenbank für Benchmarks erzeugen")
+    parser.add_argument("-o", "--output", required=True, help="Ziel-DB (wird überschrieben)")
+    parser.add_argument("--years", type=float, default=1, help="Zeitraum in Jahren (1-10)")
+    parser.add_argument("--raw-days", type=float, default=RAW_DAYS, help="letzte Tage mit 1 Hz")
+    parser.add_argument("--history-step", type=int, default=HISTORY_STEP, help="Sekunden zwischen älteren Werten")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Generating {args.years:g} years into {args.output}")
+    counts, secs = generate(args.output, args.years, args.raw_days, args.history_step, args.seed, verbose=True)
+    print(f"Done in {secs:.1f} s, {os.path.getsize(args.output) / 1e6:.1f} MB")
+    for name, rows in counts.items():
+        print(f"  {name}: {rows:,}")
+
+
+if __name__ == "__main__":
+    main()
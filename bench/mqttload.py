@@ -0,0 +1,344 @@
+"""
+Lasttest: MQTT-Ingest von der Nachricht bis zur sichtbaren Zeile
+
+    python -m bench.mqttload --meters 20 --rates 100,500,1000,2000 -o mqttload.json
+    python -m bench.mqttload --meters 5 --burst 500 --burst-every 5 --reconnect-every 10
+    python -m bench.mqttload --replay export.csv --rates 200 --require 200
+
+Startet den Stand-in-Broker aus bench.broker und subscriber.py als eigenen
+Prozess (Abonnement `bench/+/SENSOR`, ein Zähler je `--meters`) auf frischen
+Datenbanken in einem temporären Verzeichnis. Die Nachrichten sind OBIS-
+Payloads wie vom Lesekopf: synthetisch oder mit `--replay` aus einer Datei
+im Format von backfill.py (CSV oder JSON-Zeilen), reihum über alle Zähler.
+
+Je Rate in `--rates` (Nachrichten/s über alle Zähler) wird `--seconds`
+lang gesendet, optional mit Bursts (`--burst` Nachrichten auf einmal alle
+`--burst-every` s) und getrennten Abonnenten (`--reconnect-every`, paho
+verbindet sich selbst neu). Ein Poller liest die Zähler-DBs alle POLL
+Sekunden und ordnet neue Zeilen über (Watt, kWh) den gesendeten Nachrichten
+zu. Gemessen werden:
+
+- Latenz vom Senden bis die Zeile für Leser sichtbar ist (p50/p95/p99/max
+  in ms); enthält das Sammeln der Batches, also bis INGEST_FLUSH_SECONDS
+- verlorene Nachrichten (nach `--drain` s nicht sichtbar), davon beim
+  Broker ohne Abonnent (während eines Reconnects)
+- verworfene Werte und fehlgeschlagene Batches des IngestWriters
+  (aus /metrics von subscriber.py)
+
+Eine Rate gilt als gehalten, wenn sie erreicht wurde, nichts außer während
+eines Reconnects verloren ging und p99 unter `--max-latency` ms bleibt. Die
+höchste gehaltene Rate steht als `max_sustainable_rate` im Ergebnis; mit
+`--require` endet der Lauf mit Exit-Code 1, wenn sie darunter liegt.
+
+Broker und Publisher laufen zusammen in diesem Prozess; ab etwa 10 000
+Nachrichten/s (je nach CPU) begrenzen sie selbst, das Ergebnis zeigt das
+als `publisher_limited`.
+
+Gemessen wird immer im Text-Layout: im kompakten Layout bleibt je Zähler
+nur ein Messwert pro Sekunde, die übrigen wären nicht zu unterscheiden.
+"""
+import argparse, http.client, itertools, json, os, re, shutil, socket, sqlite3, subprocess, sys, tempfile
+import threading, time
+from collections import deque
+from datetime import datetime
+
+from bench.broker import Broker, connect_packet, publish_packet
+from bench.suite import ROOT, summarize
+from bench.workers import free_port
+
+TOPIC = "bench/+/SENSOR"
+POLL = 0.02
+WARMUP_TIMEOUT = 60
+
+
+def synthetic(meter_index, rate):
+    """Endlose OBIS-Payloads eines Zählers; der Zählerstand steigt mit jeder Nachricht."""
+    from ingest import OBIS_ENERGY, OBIS_POWER
+    wh = 1000000.0 * (meter_index + 1)
+    for i in itertools.count(meter_index):
+        watt = 300 + (i * 37) % 2500
+        wh = round(wh + max(watt / 3600 / rate, 0.001), 3)
+        yield {OBIS_POWER: watt, OBIS_ENERGY: wh}
+
+
+def replay(path, meter_index, meters):
+    """Datensätze aus `path` (Format wie backfill.py), jeder `meters`-te ab `meter_index`, im Kreis."""
+    from backfill import read_records
+    from ingest import OBIS_ENERGY, OBIS_POWER
+    records = [{OBIS_POWER: float(r[OBIS_POWER]), OBIS_ENERGY: float(r[OBIS_ENERGY])}
+               for r in read_records(path) if r.get(OBIS_POWER) not in (None, "") and
+               r.get(OBIS_ENERGY) not in (None, "")]
+    if not records:
+        raise SystemExit(f"No OBIS records in {path}")
+    own = records[meter_index::meters] or records
+    return itertools.cycle(own)
+
+
+class Tracker:
+    """Gesendete, noch nicht sichtbare Nachrichten je Zähler, zugeordnet über (Watt, kWh)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.outstanding = 0
+        self.latencies = []
+        self.unmatched = 0
+
+    def sent(self, meter, key, t):
+        with self.lock:
+            self.pending.setdefault(meter, {}).setdefault(key, deque()).append(t)
+            self.outstanding += 1
+
+    def visible(self, meter, key, t):
+        with self.lock:
+            times = self.pending.get(meter, {}).get(key)
+            if not times:
+                self.unmatched += 1
+                return
+            self.latencies.append((t - times.popleft()) * 1000)
+            self.outstanding -= 1
+
+    def take(self):
+        """Latenzen seit dem letzten Aufruf und Anzahl noch unsichtbarer Nachrichten (verworfen)."""
+        with self.lock:
+            latencies, self.latencies = self.latencies, []
+            lost, self.outstanding = self.outstanding, 0
+            unmatched, self.unmatched = self.unmatched, 0
+            self.pending = {}
+        return latencies, lost, unmatched
+
+
+def poll(paths, tracker, stop):
+    """Liest neue Zeilen aller Zähler-DBs (Text-Layout, über die id) und meldet sie dem Tracker."""
+    conns, last = {}, {}
+    while not stop.is_set():
+        for meter, path in paths.items():
+            conn = conns.get(meter)
+            if conn is None:
+                if not os.path.exists(path):
+                    continue
+                conn = conns[meter] = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+                last[meter] = 0
+            try:
+                rows = conn.execute("SELECT id, power_watt, total_kwh FROM measurement WHERE id > ? ORDER BY id",
+                                    (last[meter],)).fetchall()
+            except sqlite3.OperationalError:
+                # Schema wird gerade angelegt
+                continue
+            now = time.perf_counter()
+            for row_id, watt, kwh in rows:
+                tracker.visible(meter, (watt, kwh), now)
+            if rows:
+                last[meter] = rows[-1][0]
+        stop.wait(POLL)
+    for conn in conns.values():
+        conn.close()
+
+
+class Publisher:
+    """Eine MQTT-Verbindung je Zähler, QoS 0, Nachrichten reihum in fester Rate."""
+
+    def __init__(self, port, meters, sources, tracker):
+        from ingest import decode_payload
+        self.decode = decode_payload
+        self.meters = meters
+        self.sources = sources
+        self.tracker = tracker
+        self.socks = []
+        for m in meters:
+            s = socket.create_connection(("127.0.0.1", port))
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.sendall(connect_packet(f"bench-{m}"))
+            if s.recv(4)[:1] != b"\x20":
+                raise RuntimeError("Broker did not acknowledge CONNECT")
+            self.socks.append(s)
+        self.next = 0
+        self.published = 0
+
+    def send(self, n=1):
+        for _ in range(n):
+            i = self.next
+            self.next = (i + 1) % len(self.meters)
+            payload = json.dumps(next(self.sources[i])).encode()
+            watt, kwh = self.decode(payload)
+            self.tracker.sent(self.meters[i], (watt, kwh), time.perf_counter())
+            self.socks[i].sendall(publish_packet(TOPIC.replace("+", self.meters[i]), payload))
+            self.published += 1
+
+    def close(self):
+        for s in self.socks:
+            s.close()
+
+
+def scrape(port):
+    """Ingest-Zähler aus /metrics von subscriber.py, summiert über alle Zähler."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", "/metrics")
+    text = conn.getresponse().read().decode()
+    out = {"dropped": 0, "written": 0, "failed_batches": 0, "queue_high_water": 0}
+    for line in text.splitlines():
+        if m := re.match(r'ingest_readings_total\{meter="[^"]+",status="(dropped|written)"\} (\S+)', line):
+            out[m[1]] += int(float(m[2]))
+        elif m := re.match(r"ingest_failed_batches_total\{[^}]*\} (\S+)", line):
+            out["failed_batches"] += int(float(m[1]))
+        elif m := re.match(r"ingest_queue_high_water\{[^}]*\} (\S+)", line):
+            out["queue_high_water"] = max(out["queue_high_water"], int(float(m[1])))
+    return out
+
+
+def wait_for(check, timeout, proc, what):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"subscriber.py exited with {proc.returncode}")
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def step(rate, args, broker, publisher, tracker, metrics_port):
+    """Sendet `rate` Nachrichten/s für args.seconds, wartet auf die Zeilen und wertet aus."""
+    before, broker_before = scrape(metrics_port), broker.stats()
+    published = publisher.published
+    start = time.perf_counter()
+    next_burst = args.burst_every if args.burst else None
+    next_kick = args.reconnect_every or None
+    sent = bursts = 0
+    while (elapsed := time.perf_counter() - start) < args.seconds:
+        due = int(elapsed * rate) - sent
+        if due > 0:
+            publisher.send(due)
+            sent += due
+        if next_burst is not None and elapsed >= next_burst:
+            publisher.send(args.burst)
+            bursts += args.burst
+            next_burst += args.burst_every
+        if next_kick is not None and elapsed >= next_kick:
+            broker.kick()
+            next_kick += args.reconnect_every
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    published = publisher.published - published
+    deadline = time.perf_counter() + args.drain
+    while tracker.outstanding and time.perf_counter() < deadline:
+        time.sleep(POLL)
+    latencies, lost, unmatched = tracker.take()
+    after, broker_after = scrape(metrics_port), broker.stats()
+    unrouted = broker_after["unrouted"] - broker_before["unrouted"]
+    # Bursts kommen obendrauf und zählen nicht zur erreichten Rate
+    achieved = (published - bursts) / elapsed
+    result = {"rate": rate, "published": published, "burst_messages": bursts, "achieved_rate": round(achieved, 1),
+              "visible": len(latencies), "lost": lost, "lost_unrouted": min(unrouted, lost), "unmatched": unmatched,
+              "ingest_dropped": after["dropped"] - before["dropped"],
+              "ingest_failed_batches": after["failed_batches"] - before["failed_batches"],
+              "queue_high_water": after["queue_high_water"],
+              "reconnects": broker_after["kicked"] - broker_before["kicked"],
+              "publisher_limited": achieved < rate * 0.95}
+    if latencies:
+        result["latency_ms"] = summarize(latencies)
+    result["ok"] = (not result["publisher_limited"] and lost - result["lost_unrouted"] == 0
+                    and result["ingest_dropped"] == 0 and bool(latencies)
+                    and result["latency_ms"]["p99"] <= args.max_latency)
+    return result
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="bench-mqttload-")
+    meter_dir = os.path.join(tmp, "meters")
+    meters = [f"m{i:03d}" for i in range(args.meters)]
+    paths = {m: os.path.join(meter_dir, f"{m}.db") for m in meters}
+    broker = Broker().start()
+    metrics_port = free_port()
+    env = {**os.environ, "DB_PATH": os.path.join(tmp, "energy.db"), "METER_DB_DIR": meter_dir, "DB_SCHEMA": "text",
+           "MQTT_HOST": "127.0.0.1", "MQTT_PORT": str(broker.port), "MQTT_TOPIC": TOPIC, "PYTHONPATH": ROOT}
+    log = open(os.path.join(tmp, "subscriber.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "subscriber.py"), "--metrics-port", str(metrics_port)],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    tracker, stop = Tracker(), threading.Event()
+    poller = threading.Thread(target=poll, args=(paths, tracker, stop), name="poller", daemon=True)
+    publisher = None
+    try:
+        wait_for(broker.subscribed.is_set, WARMUP_TIMEOUT, proc, "subscription")
+        wait_for(lambda: scrape(metrics_port) is not None, WARMUP_TIMEOUT, proc, "metrics")
+        per_meter = max(args.rates) / args.meters
+        sources = [replay(args.replay, i, args.meters) if args.replay else synthetic(i, per_meter)
+                   for i in range(args.meters)]
+        publisher = Publisher(broker.port, meters, sources, tracker)
+        poller.start()
+        # erste Nachricht je Zähler legt dessen DB an; nicht mitmessen
+        publisher.send(args.meters)
+        wait_for(lambda: tracker.outstanding == 0, WARMUP_TIMEOUT, proc, "meter databases")
+        tracker.take()
+
+        steps, best = [], None
+        for rate in args.rates:
+            r = step(rate, args, broker, publisher, tracker, metrics_port)
+            steps.append(r)
+            lat = r.get("latency_ms", {})
+            print(f"  {rate:7g} msg/s  sent {r['achieved_rate']:9.1f}/s  visible {r['visible']:7d}  "
+                  f"lost {r['lost']:5d} ({r['lost_unrouted']} unrouted)  dropped {r['ingest_dropped']:5d}  "
+                  f"p50 {lat.get('p50', 0):8.1f} ms  p99 {lat.get('p99', 0):8.1f} ms  "
+                  f"{'ok' if r['ok'] else 'FAIL'}{' (publisher-limited)' if r['publisher_limited'] else ''}")
+            if not r["ok"]:
+                break
+            best = rate
+        import ingest
+        return {"meta": {"created": datetime.now().isoformat(timespec="seconds"), "cpus": os.cpu_count(),
+                         "meters": args.meters, "seconds": args.seconds, "source": args.replay or "synthetic",
+                         "burst": args.burst, "burst_every": args.burst_every,
+                         "reconnect_every": args.reconnect_every, "max_latency_ms": args.max_latency,
+                         "batch_size": ingest.BATCH_SIZE, "flush_seconds": ingest.FLUSH_SECONDS,
+                         "queue_size": ingest.QUEUE_SIZE},
+                "steps": steps, "broker": broker.stats(), "max_sustainable_rate": best}
+    finally:
+        stop.set()
+        if publisher:
+            publisher.close()
+        proc.terminate()
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+        broker.stop()
+        if args.keep:
+            print(f"Kept {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest des MQTT-Ingests (subscriber.py) über einen lokalen Broker")
+    parser.add_argument("--meters", type=int, default=10, help="Zähler (je ein Topic und eine DB)")
+    parser.add_argument("--rates", default="100,200,500,1000,2000", help="Nachrichten/s über alle Zähler, kommagetrennt")
+    parser.add_argument("--seconds", type=float, default=10, help="Sendedauer je Rate")
+    parser.add_argument("--replay", help="Payloads aus Datei (CSV/JSON-Zeilen wie backfill.py) statt synthetisch")
+    parser.add_argument("--burst", type=int, default=0, help="zusätzliche Nachrichten je Burst")
+    parser.add_argument("--burst-every", type=float, default=5, help="Sekunden zwischen Bursts")
+    parser.add_argument("--reconnect-every", type=float, default=0, help="Abonnenten alle N s trennen (0 = nie)")
+    parser.add_argument("--drain", type=float, default=15, help="Sekunden Wartezeit auf ausstehende Zeilen je Rate")
+    parser.add_argument("--max-latency", type=float, default=5000, help="p99-Grenze in ms für eine gehaltene Rate")
+    parser.add_argument("--require", type=float, help="Exit-Code 1, wenn die gehaltene Rate darunter liegt")
+    parser.add_argument("--keep", action="store_true", help="temporäres Verzeichnis (DBs, Log) behalten")
+    parser.add_argument("-o", "--output", help="Ergebnis als JSON")
+    args = parser.parse_args()
+    args.rates = [float(r) for r in args.rates.split(",")]
+
+    print(f"MQTT ingest load test ({args.meters} meters, {args.seconds:g} s per rate):")
+    result = run(args)
+    best = result["max_sustainable_rate"]
+    print(f"Max sustainable rate: {best:g} msg/s" if best else "Max sustainable rate: none of the tested rates")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.require and (best or 0) < args.require:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Benchmark-Suite: API-Endpunkte, Ingest und Aggregation
+
+    python -m bench.suite --years 2 -o bench-$(git rev-parse --short HEAD).json
+    python -m bench.suite --db /tmp/energy-5y.db --runs 50
+    python -m bench.suite --compare bench-old.json bench-new.json
+
+Arbeitet in einem temporären Verzeichnis auf einer Kopie von `--db` oder
+auf einer frisch erzeugten Datenbank (bench.fixtures, `--years` Jahre bis
+jetzt). Gemessen wird im Prozess über den Flask-Test-Client:
+
+endpoints    jeder Endpunkt `runs`-mal mit geleertem Ergebnis-Cache,
+             p50/p95/p99/max in ms und SQL-Abfragen pro Aufruf
+ingest       `messages` MQTT-Nachrichten über on_message bis in die DB
+             (Durchsatz, Latenz von on_message in µs, verworfene Werte)
+aggregation  aggregate.py auf einer Kopie: inkrementeller Lauf einen Tag
+             nach Ende der Daten, danach --rebuild
+
+Das Ergebnis (mit Commit, Python-/SQLite-Version, Layout und Zeilenzahlen)
+geht als JSON nach `-o`, `--compare` stellt zwei Läufe gegenüber.
+"""
+import argparse, contextlib, io, json, os, platform, shutil, sqlite3, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERIODS = ("today", "yesterday", "week", "month", "lastmonth", "year")
+
+
+def endpoints(first_day):
+    urls = ["/api/latest", "/api/stats", "/api/gauge-range"]
+    urls += [f"/api/history?period={p}" for p in PERIODS]
+    urls += [f"/api/history?period=custom&start={first_day:%Y-%m-%d}&end={datetime.now():%Y-%m-%d}"]
+    urls += [f"/api/stats-range?period={p}" for p in PERIODS]
+    urls += ["/api/baseload?period=year"]
+    return urls
+
+
+def summarize(values):
+    from energy import percentile
+    return {"p50": round(percentile(values, 50), 3), "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3), "max": round(max(values), 3),
+            "mean": round(sum(values) / len(values), 3)}
+
+
+def copy_db(src, dst):
+    """Konsistente Kopie über die Backup-API (auch bei laufender App mit WAL)."""
+    with sqlite3.connect(src) as s, sqlite3.connect(dst) as d:
+        s.backup(d)
+
+
+def data_range(path):
+    with sqlite3.connect(path) as conn:
+        last = conn.execute("SELECT MAX(timestamp) FROM measurement").fetchone()[0]
+        first = conn.execute("SELECT MIN(timestamp) FROM energy_daily").fetchone()[0]
+    from energy import from_db
+    return (from_db(first) if first is not None else None), (from_db(last) if last is not None else None)
+
+
+def bench_endpoints(app, meter, urls, runs):
+    from sqlalchemy import event
+    queries = [0]
+    event.listen(meter.read_engine, "before_cursor_execute", lambda *_: queries.__setitem__(0, queries[0] + 1))
+    client = app.app.test_client()
+    results = {}
+    for url in urls:
+        client.get(url)  # Aufwärmen: Verbindungen und Page-Cache
+        times, counts = [], []
+        for _ in range(runs):
+            meter.cache.clear()
+            queries[0] = 0
+            t0 = time.perf_counter()
+            resp = client.get(url)
+            times.append((time.perf_counter() - t0) * 1000)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{url}: HTTP {resp.status_code}")
+            counts.append(queries[0])
+        results[url] = {**summarize(times), "queries": max(counts)}
+        print(f"  {url:72s} p50 {results[url]['p50']:8.2f} ms  p95 {results[url]['p95']:8.2f} ms  "
+              f"{results[url]['queries']:3d} queries")
+    return results
+
+
+def bench_ingest(app, meter, messages):
+    from ingest import OBIS_ENERGY, OBIS_ENERGY_DIVISOR, OBIS_POWER
+    from meters import DEFAULT_METER
+    from energy import percentile
+    topic = app.MQTT_TOPIC.replace("+", DEFAULT_METER)
+    with sqlite3.connect(meter.path) as conn:
+        kwh = conn.execute("SELECT MAX(total_kwh) FROM measurement").fetchone()[0] or 0.0
+    payloads = []
+    for i in range(messages):
+        watt = 300 + (i * 37) % 2500
+        kwh += watt / 3600000
+        payloads.append(SimpleNamespace(topic=topic, payload=json.dumps(
+            {OBIS_POWER: watt, OBIS_ENERGY: round(kwh * OBIS_ENERGY_DIVISOR, 3)}).encode()))
+    before = meter.writer.stats()
+    latencies = []
+    t0 = time.perf_counter()
+    for msg in payloads:
+        t = time.perf_counter()
+        app.on_message(None, None, msg)
+        latencies.append((time.perf_counter() - t) * 1e6)
+    submitted = time.perf_counter() - t0
+    dropped = meter.writer.stats()["dropped"] - before["dropped"]
+    target = before["written"] + messages - dropped
+    while meter.writer.stats()["written"] < target and time.perf_counter() - t0 < 120:
+        time.sleep(0.01)
+    total = time.perf_counter() - t0
+    after = meter.writer.stats()
+    result = {
+        "messages": messages, "dropped": dropped, "written": after["written"] - before["written"],
+        "submit_per_s": round(messages / submitted), "written_per_s": round(messages / total),
+        "on_message_us": {"p50": round(percentile(latencies, 50), 1), "p95": round(percentile(latencies, 95), 1),
+                          "p99": round(percentile(latencies, 99), 1)},
+        "batches": after["batches"] - before["batches"], "max_flush_ms": after["max_flush_ms"],
+    }
+    print(f"  {messages:,} messages: {result['submit_per_s']:,}/s accepted, {result['written_per_s']:,}/s written, "
+          f"on_message p99 {result['on_message_us']['p99']} µs, {dropped} dropped")
+    return result
+
+
+def bench_aggregation(path, now, workers):
+    from aggregate import aggregate
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+        pool = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+    results = {}
+    try:
+        for name, rebuild in (("incremental", False), ("rebuild", True)):
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                tiers = aggregate(rebuild=rebuild, now=now, path=path, pool=pool)
+            results[name] = {"seconds": round(time.perf_counter() - t0, 3), "tiers": {
+                tier: {"rows": rows, "deleted": deleted, "seconds": round(secs, 3),
+                       "lock_max_ms": round(lock_max * 1000, 2)}
+                for tier, (rows, deleted, secs, _, lock_max) in tiers.items()}}
+            print(f"  {name:12s} {results[name]['seconds']:7.2f} s  " + ", ".join(
+                f"{tier} {t['rows']}" for tier, t in results[name]["tiers"].items()))
+    finally:
+        if pool:
+            pool.shutdown()
+    return results
+
+
+def metadata(path, args):
+    def git(*cmd):
+        out = subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() if out.returncode == 0 else ""
+    import schema
+    from bench.fixtures import table_counts
+    from storage import reader_engine
+    engine = reader_engine(path)
+    with engine.connect() as conn:
+        rows = table_counts(conn)
+    engine.dispose()
+    commit = git("rev-parse", "--short", "HEAD")
+    try:
+        import numpy  # noqa: F401
+        has_numpy = True
+    except ImportError:
+        has_numpy = False
+    return {
+        "commit": commit + ("-dirty" if commit and git("status", "--porcelain", "--untracked-files=no") else ""),
+        "created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version, "numpy": has_numpy, "schema": "compact" if schema.COMPACT else "text",
+        "machine": platform.machine(), "cpus": os.cpu_count(), "db": args.db or f"generated, {args.years:g} years",
+        "db_mb": round(os.path.getsize(path) / 1e6, 1), "rows": rows, "runs": args.runs,
+    }
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="bench-suite-")
+    path = os.path.join(tmp, "energy.db")
+    # vor dem ersten Import der App-Module: storage/meters lesen die Pfade beim Import
+    os.environ["DB_PATH"] = path
+    os.environ["METER_DB_DIR"] = os.path.join(tmp, "meters")
+    try:
+        if args.db:
+            copy_db(args.db, path)
+        else:
+            from bench.fixtures import generate
+            print(f"Generating fixture ({args.years:g} years) ...")
+            _, secs = generate(path, args.years)
+            print(f"  done in {secs:.1f} s")
+        first, last = data_range(path)
+        if last is None:
+            raise SystemExit("Fixture has no raw readings")
+        if last < datetime.now() - timedelta(hours=1):
+            print(f"Warning: data ends {last:%Y-%m-%d %H:%M}, periods like 'today' will be mostly empty. "
+                  "Regenerate the fixture for comparable results.")
+        snapshot = os.path.join(tmp, "aggregate.db")
+        copy_db(path, snapshot)
+        out = {"meta": metadata(path, args)}
+
+        import logging
+        import app
+        from meters import DEFAULT_METER
+        logging.getLogger().setLevel(logging.WARNING)
+        meter = app.meters.get(DEFAULT_METER, create=True)
+        meter.writer.ready.wait(120)
+
+        print(f"Endpoints ({args.runs} runs each, cache cleared):")
+        out["endpoints"] = bench_endpoints(app, meter, endpoints(first or last), args.runs)
+        if hasattr(app, "on_message"):
+            print("Ingest via on_message:")
+            out["ingest"] = bench_ingest(app, meter, args.messages)
+        app.meters.close()
+        print("Aggregation:")
+        out["aggregation"] = bench_aggregation(snapshot, last + timedelta(days=1), args.workers)
+        return out
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(a, b):
+    """Gegenüberstellung zweier JSON-Ergebnisse (p50/p95 je Endpunkt, Ingest, Aggregation)."""
+    def delta(x, y):
+        return f"{(y / x - 1) * 100:+6.1f}%" if x else "     -"
+    print(f"{a['meta']['commit'] or '?'} -> {b['meta']['commit'] or '?'}")
+    for url, r in b["endpoints"].items():
+        o = a["endpoints"].get(url)
+        if o:
+            print(f"  {url:72s} p50 {o['p50']:8.2f} -> {r['p50']:8.2f} ms {delta(o['p50'], r['p50'])}  "
+                  f"p95 {o['p95']:8.2f} -> {r['p95']:8.2f} ms {delta(o['p95'], r['p95'])}  "
+                  f"queries {o['queries']} -> {r['queries']}")
+    if "ingest" in a and "ingest" in b:
+        o, r = a["ingest"]["written_per_s"], b["ingest"]["written_per_s"]
+        print(f"  ingest written/s {o:,} -> {r:,} {delta(o, r)}")
+    for name, r in b.get("aggregation", {}).items():
+        o = a.get("aggregation", {}).get(name)
+        if o:
+            print(f"  aggregation {name:12s} {o['seconds']:7.2f} -> {r['seconds']:7.2f} s "
+                  f"{delta(o['seconds'], r['seconds'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Energy Pi: Benchmark-Suite")
+    parser.add_argument("--db", help="bestehende DB als Fixture (wird kopiert, nicht verändert)")
+    parser.add_argument("--years", type=float, default=1, help="ohne --db: Jahre synthetischer Daten")
+    parser.add_argument("--runs", type=int, default=20, help="Aufrufe je Endpunkt")
+    parser.add_argument("--messages", type=int, default=20000, help="MQTT-Nachrichten für den Ingest-Test")
+    parser.add_argument("--workers", type=int, default=1, help="Worker-Prozesse für die Aggregation")
+    parser.add_argument("-o", "--output", help="Ergebnis als JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="zwei JSON-Ergebnisse vergleichen")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            compare(json.load(a), json.load(b))
+        return
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    result = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
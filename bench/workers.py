@@ -0,0 +1,185 @@
+"""
+Benchmark: Durchsatz der Web-Worker (wsgi.py unter gunicorn)
+
+    python -m bench.workers --years 1 --workers 1,2,4 --clients 8 -o workers.json
+    python -m bench.workers --db /tmp/energy-5y.db --seconds 30
+
+Startet für jede Worker-Zahl gunicorn mit wsgi:app (gthread) auf einer Kopie
+von `--db` oder einer frisch erzeugten Datenbank (bench.fixtures). Last
+kommt aus `clients` eigenen Prozessen, jeder mit einer Keep-Alive-Verbindung
+und einem Request nach dem anderen über die Dashboard-Endpunkte aus
+bench.suite. Der Ergebnis-Cache ist aus (CACHE_SIZE=0), gemessen wird die
+Berechnung, nicht der Cache. Daneben schreibt ein Ingest-Prozess wie
+subscriber.py `rate` Messwerte pro Sekunde, die Worker lesen sie über ihren
+Follower.
+
+Ausgabe je Worker-Zahl: Requests/s, Skalierung gegenüber einem Worker und
+p50/p95/p99 in ms. Mehr Worker als CPU-Kerne bringen keinen Durchsatz mehr,
+nur längere Latenzen.
+"""
+import argparse, http.client, importlib.util, json, multiprocessing, os, random, shutil, socket, subprocess, sys
+import tempfile, time
+from datetime import datetime
+
+from bench.suite import ROOT, copy_db, data_range, endpoints, summarize
+
+WARMUP = 3.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def client(port, urls, measure_from, until, seed, out):
+    """Lastprozess: Requests nacheinander bis `until`, gezählt ab `measure_from` (Epoch-Sekunden)."""
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    times, errors = [], 0
+    while (now := time.time()) < until:
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", rnd.choice(urls))
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        if now >= measure_from:
+            if ok:
+                times.append((time.perf_counter() - t0) * 1000)
+            else:
+                errors += 1
+    out.put((times, errors))
+
+
+def produce(path, rate, until):
+    """Ingest-Prozess wie subscriber.py, nur ohne Broker: `rate` Messwerte/s über den IngestWriter."""
+    from meters import DEFAULT_METER, Meter
+    meter = Meter(DEFAULT_METER, path).open()
+    last = meter.live.latest()
+    kwh = last[2] if last else 0.0
+    rnd = random.Random(1)
+    try:
+        while time.time() < until:
+            watt = 200 + rnd.random() * 800
+            kwh += watt / rate / 3600000
+            meter.writer.submit(datetime.now(), watt, kwh)
+            time.sleep(1 / rate)
+    finally:
+        meter.close()
+
+
+def wait_ready(port, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/meters")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def bench_workers(workers, env, urls, args, log):
+    port = free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gthread", "--threads", str(args.threads),
+           "-b", f"127.0.0.1:{port}", "wsgi:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_ready(port, proc)
+        start = time.time()
+        measure_from, until = start + WARMUP, start + WARMUP + args.seconds
+        out = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(port, urls, measure_from, until, i, out))
+                   for i in range(args.clients)]
+        for p in clients:
+            p.start()
+        results = [out.get() for _ in clients]
+        for p in clients:
+            p.join()
+    finally:
+        proc.terminate()
+        proc.wait(30)
+    times = [t for ts, _ in results for t in ts]
+    if not times:
+        raise RuntimeError(f"No successful requests with {workers} workers")
+    return {"requests": len(times), "errors": sum(e for _, e in results),
+            "rps": round(len(times) / args.seconds, 1), **summarize(times)}
+
+
+def run(args):
+    if importlib.util.find_spec("gunicorn") is None:
+        raise SystemExit("gunicorn is not installed (pip install gunicorn)")
+    tmp = tempfile.mkdtemp(prefix="bench-workers-")
+    path = os.path.join(tmp, "energy.db")
+    env = {**os.environ, "DB_PATH": path, "METER_DB_DIR": os.path.join(tmp, "meters"), "CACHE_SIZE": "0",
+           "PYTHONPATH": ROOT}
+    os.environ.update(DB_PATH=env["DB_PATH"], METER_DB_DIR=env["METER_DB_DIR"])
+    try:
+        if args.db:
+            copy_db(args.db, path)
+        else:
+            from bench.fixtures import generate
+            print(f"Generating fixture ({args.years:g} years) ...")
+            _, secs = generate(path, args.years)
+            print(f"  done in {secs:.1f} s")
+        first, last = data_range(path)
+        urls = endpoints(first or last)
+        results = {}
+        with open(os.path.join(tmp, "gunicorn.log"), "w") as log:
+            for n in args.workers:
+                until = time.time() + WARMUP + args.seconds + 60
+                ingest = multiprocessing.Process(target=produce, args=(path, args.rate, until), daemon=True) \
+                    if args.rate > 0 else None
+                if ingest:
+                    ingest.start()
+                try:
+                    r = results[n] = bench_workers(n, env, urls, args, log)
+                finally:
+                    if ingest:
+                        ingest.terminate()
+                        ingest.join()
+                base = results[args.workers[0]]["rps"]
+                r["scaling"] = round(r["rps"] / base, 2) if base else None
+                print(f"  {n:3d} workers  {r['rps']:8.1f} req/s  x{r['scaling']:<5}  p50 {r['p50']:8.2f} ms  "
+                      f"p95 {r['p95']:8.2f} ms  p99 {r['p99']:8.2f} ms  {r['errors']} errors")
+        return {"meta": {"created": datetime.now().isoformat(timespec="seconds"), "cpus": os.cpu_count(),
+                         "db": args.db or f"generated, {args.years:g} years", "clients": args.clients,
+                         "threads": args.threads, "seconds": args.seconds, "rate": args.rate},
+                "workers": results}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durchsatz von wsgi.py unter gunicorn je Worker-Zahl")
+    parser.add_argument("--db", help="bestehende DB als Fixture (wird kopiert, nicht verändert)")
+    parser.add_argument("--years", type=float, default=1, help="ohne --db: Jahre synthetischer Daten")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+                        help="Worker-Zahlen, kommagetrennt (Standard: 1, 2 und Anzahl CPUs)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads je Worker (gthread)")
+    parser.add_argument("--clients", type=int, default=8, help="gleichzeitige Lastprozesse")
+    parser.add_argument("--seconds", type=float, default=15, help="Messdauer je Worker-Zahl")
+    parser.add_argument("--rate", type=float, default=1, help="Messwerte/s des Ingest-Prozesses (0 = aus)")
+    parser.add_argument("-o", "--output", help="Ergebnis als JSON")
+    args = parser.parse_args()
+    args.workers = [int(n) for n in args.workers.split(",")]
+
+    print(f"Throughput by worker count ({args.clients} clients, {args.seconds:g} s each, cache off):")
+    result = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
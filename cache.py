@@ -0,0 +1,96 @@
+"""
+Ergebnis-Cache für Smart Energy Pi
+
+LRU-Cache für berechnete API-Antworten. Abgeschlossene Zeiträume ändern
+sich nicht mehr und bleiben ohne Ablauf im Cache; Antworten für offene
+Zeiträume bekommen eine kurze TTL und werden zusätzlich verworfen, sobald
+der Ingest eine Minute abschließt. Ändert das Aggregations-Script Daten
+(neuer Stand in aggregate_state), wird der gesamte Cache geleert.
+"""
+from collections import OrderedDict
+import os, threading, time
+
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 256))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 60))
+CACHE_CHECK_SECONDS = float(os.getenv("CACHE_CHECK_SECONDS", 30))
+
+_UNSET = object()
+
+
+class ResultCache:
+    """Thread-sicherer LRU-Cache mit optionaler TTL pro Eintrag.
+
+    `generation` ist eine Funktion, die einen Datenstand liefert (z.B. den
+    letzten Aggregationslauf); sie wird höchstens alle `check_seconds`
+    aufgerufen, bei einer Änderung wird alles verworfen.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL, check_seconds=CACHE_CHECK_SECONDS, generation=None):
+        self.size = size
+        self.ttl = ttl
+        self.check_seconds = check_seconds
+        self.generation = generation
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self._gen = _UNSET
+        self._checked = float("-inf")
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, compute, closed=False):
+        """Wert zu `key` oder neu berechnet. Gibt (wert, hit) zurück."""
+        self._check_generation()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0], True
+            self.counters["misses"] += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = (value, None if closed else now + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+        return value, False
+
+    def fresh(self, key):
+        """True, wenn `key` ohne Neuberechnung geliefert würde (zählt nicht als Zugriff)."""
+        self._check_generation()
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def invalidate_open(self):
+        """Verwirft alle Einträge mit TTL (offene Zeiträume)."""
+        with self.lock:
+            for key in [k for k, (_, expires) in self.entries.items() if expires is not None]:
+                del self.entries[key]
+            self.counters["invalidations"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counters["invalidations"] += 1
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counters)
+            out["size"] = len(self.entries)
+            out["closed"] = sum(1 for _, expires in self.entries.values() if expires is None)
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = round(out["hits"] / lookups, 3) if lookups else 0.0
+        out["max_size"] = self.size
+        return out
+
+    def _check_generation(self):
+        if self.generation is None or time.monotonic() - self._checked < self.check_seconds:
+            return
+        self._checked = time.monotonic()
+        gen = self.generation()
+        if gen != self._gen:
+            if self._gen is not _UNSET:
+                self.clear()
+            self._gen = gen
@@ -0,0 +1,84 @@
+"""
+Formerhaltendes Downsampling für Smart Energy Pi
+
+Reduziert Zeitreihen auf eine exakte Punktzahl, ohne Lastspitzen zu
+verlieren (Wasserkocher, Wärmepumpe, Wallbox):
+
+lttb    Largest-Triangle-Three-Buckets: je Bucket der Punkt, der mit dem
+        zuletzt gewählten Punkt und dem Mittel des nächsten Buckets das
+        größte Dreieck bildet (Steinarsson 2013); Anfang und Ende bleiben
+minmax  Minimum und Maximum je Bucket in zeitlicher Reihenfolge
+
+Die Funktionen liefern Indizes der gewählten Punkte (aufsteigend), damit
+Aufrufer beliebige Spalten (Zeitstempel, Labels, Werte) daraus auswählen.
+Mit NumPy werden die Buckets vektorisiert berechnet, sonst in reinem Python.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MODES = ("lttb", "minmax")
+
+
+def downsample(x, y, n, mode="lttb"):
+    """Indizes von höchstens `n` Punkten; bei len(y) <= n alle."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+    size = len(y)
+    if n >= size:
+        return list(range(size))
+    if n <= 2:
+        return [0, size - 1][-n:] if n > 0 else []
+    return lttb(x, y, n) if mode == "lttb" else minmax(y, n)
+
+
+def _edges(size, n):
+    """Grenzen der n - 2 Buckets über die inneren Punkte 1..size-2, danach `size`."""
+    return [1 + (size - 2) * i // (n - 2) for i in range(n - 1)] + [size]
+
+
+def lttb(x, y, n):
+    size = len(y)
+    edges = _edges(size, n)
+    picked = [0]
+    if np is not None:
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        a = 0
+        for i in range(n - 2):
+            lo, hi, nxt = edges[i], edges[i + 1], edges[i + 2]
+            cx, cy = x[hi:nxt].mean(), y[hi:nxt].mean()
+            area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+            a = lo + int(area.argmax())
+            picked.append(a)
+    else:
+        a = 0
+        for i in range(n - 2):
+            lo, hi, nxt = edges[i], edges[i + 1], edges[i + 2]
+            cx = sum(x[hi:nxt]) / (nxt - hi)
+            cy = sum(y[hi:nxt]) / (nxt - hi)
+            ax, ay = x[a], y[a]
+            a = max(range(lo, hi), key=lambda j: abs((ax - cx) * (y[j] - ay) - (ax - x[j]) * (cy - ay)))
+            picked.append(a)
+    picked.append(size - 1)
+    return picked
+
+
+def minmax(y, n):
+    """Min und Max je Bucket; bei ungeradem `n` kommt der erste Punkt dazu."""
+    size = len(y)
+    first = n % 2
+    buckets = n // 2
+    bounds = [first + (size - first) * i // buckets for i in range(buckets + 1)]
+    picked = [0] if first else []
+    if np is not None:
+        y = np.asarray(y, dtype=float)
+    for s, e in zip(bounds, bounds[1:]):
+        if np is not None:
+            lo, hi = s + int(y[s:e].argmin()), s + int(y[s:e].argmax())
+        else:
+            lo = min(range(s, e), key=y.__getitem__)
+            hi = max(range(s, e), key=y.__getitem__)
+        # konstanter Bucket: erster und letzter Punkt, damit es genau zwei bleiben
+        picked += sorted((lo, hi)) if lo != hi else [s, e - 1]
+    return picked
@@ -0,0 +1,419 @@
+"""
+Energie-Engine für Smart Energy Pi
+
+Berechnet kWh für beliebig viele Buckets [start, end) mit einer festen
+Anzahl mengenbasierter Abfragen (eine pro Tier), unabhängig von der Anzahl
+der Buckets. Die Quellenlogik entspricht der bisherigen Kaskade:
+Tage -> Stunden ab letztem Tag -> Minuten ab letzter Stunde -> Rohdaten
+ab letzter Minute.
+
+Vollständige Tage kommen aus der Zusammenfassung energy_daily (eine Zeile
+pro Kalendertag); nur der Rest eines Buckets läuft durch die Kaskade.
+
+Zeitreihen für Charts werden einmal pro Tier als Spalten geladen (NumPy,
+falls installiert) und in einem Durchgang auf Buckets verteilt.
+
+Zeiträume vor der Grenze des Archivs (archive.py) kommen aus dessen
+Segmenten: gleiche Rechnung, nur über Arrays statt SQL.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import math
+from sqlalchemy import text
+
+import archive
+from schema import COMPACT, KEY, to_epoch, from_epoch, bucket, bucket_key, epoch, hour_of_day, watt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bucket-Grenzen pro Statement (bis zu 4 Parameter je Bucket, SQLite-Limit 999)
+CHUNK = 240
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+DAY = timedelta(days=1)
+HOUR = timedelta(hours=1)
+
+
+def to_db(dt):
+    """Zeitstempel im Speicherformat (SQLAlchemy-DateTime-Text bzw. Epoch im kompakten Schema)."""
+    return to_epoch(dt) if COMPACT else dt.strftime(TS_FORMAT)
+
+
+def from_db(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, int):
+        return from_epoch(value)
+    return datetime.fromisoformat(value)
+
+
+def _values(bounds, idx):
+    """VALUES-Liste (i, s, e) bzw. (i, s, e, p) für die gegebenen Bucket-Indizes."""
+    rows, params = [], {}
+    for n, i in enumerate(idx):
+        names = [f"{c}{n}" for c in "sep"[:len(bounds[i])]]
+        rows.append(f"(:i{n}, {', '.join(':' + x for x in names)})")
+        params[f"i{n}"] = i
+        params.update({x: to_db(v) for x, v in zip(names, bounds[i])})
+    return ", ".join(rows), params
+
+
+def _run(conn, sql, bounds):
+    """Führt eine Tier-Abfrage für alle nicht-leeren Buckets aus."""
+    idx = [i for i, b in enumerate(bounds) if b[0] < b[1]]
+    for off in range(0, len(idx), CHUNK):
+        values, params = _values(bounds, idx[off:off + CHUNK])
+        yield from conn.execute(text(sql.format(values=values)), params)
+
+
+def _sum_last(conn, table, bounds):
+    return _run(conn, f"""
+        WITH b(i, s, e) AS (VALUES {{values}})
+        SELECT b.i, SUM(t.kwh_used), MAX(t.timestamp)
+        FROM b JOIN {table} t ON t.timestamp >= b.s AND t.timestamp < b.e
+        GROUP BY b.i
+    """, bounds)
+
+
+def _first_last(conn, table, column, bounds, lead=False):
+    """Erste und letzte Zeile je Bucket; mit `lead` statt der ersten die letzte Zeile der Stunde
+    vor dem Bucket, falls vorhanden (wie die Stunden-kWh in ingest.Rollup und aggregate.py)."""
+    first = f"""(SELECT {KEY} FROM {table} WHERE timestamp >= b.s AND timestamp < b.e
+                 ORDER BY timestamp ASC LIMIT 1)"""
+    if lead:
+        first = f"""COALESCE((SELECT {KEY} FROM {table} WHERE timestamp >= b.p AND timestamp < b.s
+                 ORDER BY timestamp DESC LIMIT 1), {first})"""
+        bounds = [(s, e, s - HOUR) for s, e in bounds]
+    return _run(conn, f"""
+        WITH b(i, s, e{", p" if lead else ""}) AS (VALUES {{values}})
+        SELECT x.i, x.fid, x.lid, f.{column}, l.{column}, f.timestamp, l.timestamp FROM (
+            SELECT b.i AS i,
+                {first} AS fid,
+                (SELECT {KEY} FROM {table} WHERE timestamp >= b.s AND timestamp < b.e
+                 ORDER BY timestamp DESC LIMIT 1) AS lid
+            FROM b
+        ) x
+        LEFT JOIN {table} f ON f.{KEY} = x.fid
+        LEFT JOIN {table} l ON l.{KEY} = x.lid
+    """, bounds)
+
+
+def _daily(conn, bounds):
+    """kWh vollständig enthaltener Tage aus energy_daily.
+
+    Gibt (kWh je Bucket, Restintervalle, Bucket-Index je Restintervall) zurück.
+    Im Normalfall sind die Tage lückenlos und eine Summenabfrage genügt; nur
+    Buckets mit Lücken laden zusätzlich ihre Tagesliste.
+    """
+    total = [0.0] * len(bounds)
+    # Tag t liegt vollständig im Bucket, wenn s <= t und t + 1 Tag <= e
+    # (Tageszeilen liegen auf Mitternacht, +1 s bleibt auch mit Epoch-Sekunden exakt)
+    inner = [(s, e - DAY + timedelta(seconds=1)) for s, e in bounds]
+    runs = {}
+    holes = []
+    for i, kwh, n, first, last in _run(conn, """
+        WITH b(i, s, e) AS (VALUES {values})
+        SELECT b.i, SUM(t.kwh_used), COUNT(*), MIN(t.timestamp), MAX(t.timestamp)
+        FROM b JOIN energy_daily t ON t.timestamp >= b.s AND t.timestamp < b.e
+        GROUP BY b.i
+    """, inner):
+        total[i] = kwh or 0
+        first, last = from_db(first), from_db(last)
+        if (last - first).days + 1 == n:
+            runs[i] = [(first, last + DAY)]
+        else:
+            holes.append(i)
+    if holes:
+        only = [inner[i] if i in holes else (s, s) for i, (s, _) in enumerate(inner)]
+        for i, ts in _run(conn, """
+            WITH b(i, s, e) AS (VALUES {values})
+            SELECT b.i, t.timestamp
+            FROM b JOIN energy_daily t ON t.timestamp >= b.s AND t.timestamp < b.e
+            ORDER BY b.i, t.timestamp
+        """, only):
+            day = from_db(ts)
+            r = runs.setdefault(i, [])
+            if r and r[-1][1] == day:
+                r[-1] = (r[-1][0], day + DAY)
+            else:
+                r.append((day, day + DAY))
+    rest, owner = [], []
+    for i, (s, e) in enumerate(bounds):
+        cursor = s
+        for lo, hi in runs.get(i, []) + [(e, e)]:
+            if cursor < lo:
+                rest.append((cursor, lo))
+                owner.append(i)
+            cursor = hi
+    return total, rest, owner
+
+
+def kwh_for_buckets(conn, bounds, summary=True, exact=False):
+    """Berechnet kWh für jeden Bucket [start, end) aus `bounds`.
+
+    Mit `summary` kommen volle Tage aus energy_daily (1-2 Abfragen), der Rest
+    aus der Tier-Kaskade (4 Abfragen). Ohne `summary` nur die Kaskade.
+
+    Minuten und Rohdaten zählt die Kaskade wie bisher vom ersten bis zum
+    letzten Zählerstand im Bucket. Mit `exact` zählt sie ab dem letzten
+    Zählerstand der Stunde davor, wie die Stunden-kWh; so entstehen die
+    Zeilen in energy_daily, und die Summe der Stunden eines Tages ist
+    gleich seiner Tageszeile.
+    """
+    cold = archive.of(conn)
+    if cold is not None:
+        hot = _kwh_db(conn, [(max(s, cold.until), e) for s, e in bounds], summary, exact)
+        past = _kwh_archive(cold, [(s, min(e, cold.until)) for s, e in bounds], summary)
+        return [a + b for a, b in zip(hot, past)]
+    return _kwh_db(conn, bounds, summary, exact)
+
+
+def _kwh_db(conn, bounds, summary, exact=False):
+    if not summary:
+        return _cascade(conn, bounds, exact)
+    total, rest, owner = _daily(conn, bounds)
+    for i, kwh in zip(owner, _cascade(conn, rest, exact)):
+        total[i] += kwh
+    return total
+
+
+def _cascade(conn, bounds, exact=False):
+    total = [0.0] * len(bounds)
+    cursor = [s for s, _ in bounds]
+    ends = [e for _, e in bounds]
+
+    for i, kwh, last in _sum_last(conn, "measurement_day", bounds):
+        total[i] += kwh or 0
+        cursor[i] = from_db(last) + timedelta(days=1)
+
+    for i, kwh, last in _sum_last(conn, "measurement_hour", list(zip(cursor, ends))):
+        total[i] += kwh or 0
+        cursor[i] = from_db(last) + timedelta(hours=1)
+
+    # letzter Zählerstand im Minuten-Tier vor den Rohdaten, für `exact`
+    minute_last = {}
+    for i, fid, lid, first, last, _, last_ts in _first_last(
+            conn, "measurement_minute", "total_kwh", list(zip(cursor, ends)), exact):
+        if lid is None:
+            if fid is not None:
+                minute_last[i] = first
+            continue
+        if fid != lid:
+            total[i] += last - first
+        cursor[i] = from_db(last_ts) + timedelta(minutes=1)
+        minute_last[i] = last
+
+    for i, fid, lid, first, last, first_ts, _ in _first_last(
+            conn, "measurement", "total_kwh", list(zip(cursor, ends)), exact):
+        if lid is None:
+            continue
+        if exact and i in minute_last and from_db(first_ts) >= cursor[i]:
+            # kein Rohwert davor (schon aggregiert): ab dem letzten Minutenwert
+            first, fid = minute_last[i], None
+        if fid != lid:
+            total[i] += last - first
+
+    return total
+
+
+def _ceil_epoch(dt):
+    """Epoch-Sekunden, aufgerundet: für ganzzahlige t gilt t >= dt genau dann, wenn t >= _ceil_epoch(dt)."""
+    return to_epoch(dt) + (dt.microsecond > 0)
+
+
+def _kwh_archive(cold, bounds, summary):
+    """kWh der Buckets aus dem Archiv: wie _daily und _cascade, nur Tages- und Stunden-Tier
+    (Minuten und Rohdaten sind in archivierten Zeiträumen längst aggregiert)."""
+    spans = [(_ceil_epoch(s), _ceil_epoch(e)) if s < e else None for s, e in bounds]
+    if not any(spans):
+        return [0.0] * len(bounds)
+    lo, hi = min(s for s, _ in filter(None, spans)), max(e for _, e in filter(None, spans))
+    tiers = {t: cold.rows(t, lo, hi, "kwh_used") for t in ("energy_daily", "measurement_day", "measurement_hour")}
+
+    def window(table, s, e):
+        ts, (kwh,) = tiers[table]
+        a, b = bisect_left(ts, s), bisect_left(ts, e)
+        return ts[a:b], sum(v for v in kwh[a:b] if v == v)
+
+    def cascade(s, e):
+        days, kwh = window("measurement_day", s, e)
+        cursor = days[-1] + 86400 if days else s
+        return kwh + window("measurement_hour", cursor, e)[1]
+
+    total = []
+    for span in spans:
+        if span is None:
+            total.append(0.0)
+            continue
+        s, e = span
+        kwh, cursor = 0.0, s
+        if summary:
+            # volle Tage aus energy_daily, zusammenhängende Tage als Läufe
+            days, kwh = window("energy_daily", s, e - 86399)
+            for day in days:
+                if cursor < day:
+                    kwh += cascade(cursor, day)
+                cursor = day + 86400
+        if cursor < e:
+            kwh += cascade(cursor, e)
+        total.append(kwh)
+    return total
+
+
+# Tier: (Tabelle, Mittel, Minimum, Maximum), von fein nach grob
+_POWER = [
+    ("measurement", "power_watt", "power_watt", "power_watt"),
+    ("measurement_minute", "power_avg", "power_min", "power_max"),
+    ("measurement_hour", "power_avg", "power_min", "power_max"),
+    ("measurement_day", "power_avg", "power_min", "power_max"),
+]
+
+
+def summarize_days(conn, first, last, baseload_hours):
+    """Zeilen für energy_daily für die Tage [first, last) (jeweils Mitternacht).
+
+    kWh über die Tier-Kaskade ab dem Zählerstand vor dem Tag (`exact`, wie der
+    Live-Rollup), Leistung aus dem gröbsten Tier mit Daten für den
+    Tag, Grundlast als Minimum in `baseload_hours` (Stunden inklusive),
+    samples = Anzahl Rohwerte (None, wenn die Rohdaten schon aggregiert sind).
+    Tage ohne Daten werden ausgelassen.
+    """
+    days = []
+    d = first
+    while d < last:
+        days.append((d, d + DAY))
+        d += DAY
+    if not days:
+        return []
+    params = {"s": to_db(first), "e": to_db(last)}
+    power, samples = {}, {}
+    for table, avg, lo, hi in _POWER:
+        for day, a, mn, mx, n in conn.execute(text(f"""
+            SELECT {bucket("timestamp", 86400)}, {watt(f"AVG({avg})")}, {watt(f"MIN({lo})")},
+                   {watt(f"MAX({hi})")}, COUNT(*)
+            FROM {table} WHERE timestamp >= :s AND timestamp < :e GROUP BY 1
+        """), params):
+            power[day] = (a, mn, mx)
+            if table == "measurement":
+                samples[day] = n
+            else:
+                # Tag teilweise aggregiert: Anzahl Rohwerte nicht mehr bekannt
+                samples.pop(day, None)
+    baseload = dict(conn.execute(text(f"""
+        SELECT {bucket("timestamp", 86400)}, {watt("MIN(v)")} FROM (
+            SELECT timestamp, power_watt AS v FROM measurement WHERE timestamp >= :s AND timestamp < :e
+            UNION ALL
+            SELECT timestamp, power_min FROM measurement_minute WHERE timestamp >= :s AND timestamp < :e
+            UNION ALL
+            SELECT timestamp, power_min FROM measurement_hour WHERE timestamp >= :s AND timestamp < :e
+        ) WHERE {hour_of_day("timestamp")} BETWEEN :a AND :b
+        GROUP BY 1
+    """), {**params, "a": baseload_hours[0], "b": baseload_hours[1]}).fetchall())
+    rows = []
+    for (start, _), kwh in zip(days, kwh_for_buckets(conn, days, summary=False, exact=True)):
+        key = bucket_key(start, 86400)
+        if key not in power:
+            continue
+        avg, mn, mx = power[key]
+        rows.append({"timestamp": start, "kwh_used": kwh, "power_avg": avg, "power_min": mn,
+                     "power_max": mx, "baseload_watt": baseload.get(key), "samples": samples.get(key)})
+    return rows
+
+
+def percentile(values, p):
+    """Perzentil `p` (0-100) nach dem Nearest-Rank-Verfahren, None ohne Werte."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)] if values else None
+
+
+def summarize_baseload(conn, first, last, baseload_hours, percent):
+    """Zeilen für baseload_daily für die Tage [first, last): Minimum und Perzentil im Zeitfenster.
+
+    Grundlage sind die Rohwerte, für bereits aggregierte Zeiträume die Minuten-
+    bzw. Stunden-Minima. Tage ohne Werte im Zeitfenster werden ausgelassen.
+    """
+    values = {}
+    for day, v in conn.execute(text(f"""
+        SELECT {bucket("timestamp", 86400)}, {watt("v")} FROM (
+            SELECT timestamp, power_watt AS v FROM measurement WHERE timestamp >= :s AND timestamp < :e
+            UNION ALL
+            SELECT timestamp, power_min FROM measurement_minute WHERE timestamp >= :s AND timestamp < :e
+            UNION ALL
+            SELECT timestamp, power_min FROM measurement_hour WHERE timestamp >= :s AND timestamp < :e
+        ) WHERE {hour_of_day("timestamp")} BETWEEN :a AND :b AND v IS NOT NULL
+    """), {"s": to_db(first), "e": to_db(last), "a": baseload_hours[0], "b": baseload_hours[1]}):
+        values.setdefault(day, []).append(v)
+    rows = []
+    d = first
+    while d < last:
+        vals = values.get(bucket_key(d, 86400))
+        if vals:
+            rows.append({"timestamp": d, "min_watt": min(vals), "percentile_watt": percentile(vals, percent),
+                         "samples": len(vals)})
+        d += DAY
+    return rows
+
+
+def _columns(rows):
+    """Zeilen (epoch, wert) -> Spalten, als NumPy-Arrays falls verfügbar."""
+    if np is not None:
+        # über Tupel: Row-Objekte direkt an NumPy zu geben ist um ein Vielfaches langsamer
+        arr = np.array([tuple(r) for r in rows], dtype=float).reshape(-1, 2)
+        return arr[:, 0].astype(np.int64), arr[:, 1]
+    return [r[0] for r in rows], [r[1] for r in rows]
+
+
+def minute_series(conn, start, end):
+    """Minutenwerte [start, end) als Spalten (epoch, watt).
+
+    Minuten-Tier plus erster Rohwert je Minute nach der letzten aggregierten
+    Minute, mit zwei Abfragen für den ganzen Zeitraum.
+    """
+    rows = conn.execute(text(f"""
+        SELECT {epoch("timestamp")}, {watt("power_avg")}
+        FROM measurement_minute WHERE timestamp >= :s AND timestamp < :e
+        ORDER BY timestamp
+    """), {"s": to_db(start), "e": to_db(end)}).fetchall()
+    cursor = from_epoch(rows[-1][0]) + timedelta(minutes=1) if rows else start
+    rows += conn.execute(text(f"""
+        SELECT {epoch("MIN(timestamp)")}, {watt("power_watt")}
+        FROM measurement WHERE timestamp >= :s AND timestamp < :e
+        GROUP BY {bucket("timestamp", 60)}
+    """), {"s": to_db(max(cursor, start)), "e": to_db(end)}).fetchall()
+    return _columns(rows)
+
+
+def hour_series(conn, start, end):
+    """Stunden-Tier [start, end) als Spalten (epoch, watt), archivierte Stunden zuerst."""
+    rows = []
+    cold = archive.of(conn)
+    if cold is not None:
+        rows = [(to_epoch(t), v) for t, v in cold.points("measurement_hour", "power_avg", start, end)]
+        start = max(start, cold.until)
+    rows += conn.execute(text(f"""
+        SELECT {epoch("timestamp")}, {watt("power_avg")}
+        FROM measurement_hour WHERE timestamp >= :s AND timestamp < :e
+        ORDER BY timestamp
+    """), {"s": to_db(start), "e": to_db(end)}).fetchall() if start < end else []
+    return _columns(rows)
+
+
+def bucket_means(ts, values, origin, width, n):
+    """Mittelwert je Bucket [origin + i*width, +width) in einem Durchgang, 0 für leere."""
+    base = to_epoch(origin)
+    if np is not None:
+        idx = (ts - base) // width
+        ok = (idx >= 0) & (idx < n)
+        sums = np.bincount(idx[ok], weights=values[ok], minlength=n)
+        counts = np.bincount(idx[ok], minlength=n)
+        return np.divide(sums, counts, out=np.zeros(n), where=counts > 0).tolist()
+    sums, counts = [0.0] * n, [0] * n
+    for t, v in zip(ts, values):
+        i = (t - base) // width
+        if 0 <= i < n:
+            sums[i] += v
+            counts[i] += 1
+    return [s / c if c else 0 for s, c in zip(sums, counts)]
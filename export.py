@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Export von Roh- und Aggregatdaten für Smart Energy Pi
+
+Streamt eine Stufe (raw, minute, hour, day, daily, baseload) für einen
+Zeitraum als CSV oder NDJSON, optional gzip-komprimiert. Gelesen wird mit
+`yield_per` in Blöcken von CHUNK_ROWS Zeilen über eine einzelne
+Lese-Verbindung, der Speicherbedarf bleibt unabhängig von der Länge des
+Zeitraums konstant.
+
+Verwendet von /api/export und als CLI:
+
+    python export.py minute --start 2025-01-01 --end 2025-12-31 --gzip -o minute-2025.csv.gz
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import select
+
+import archive, schema
+from meters import DEFAULT_METER, db_path
+from storage import reader_engine
+
+CHUNK_ROWS = 5000
+
+TIERS = {"raw": schema.measurement, "minute": schema.measurement_minute, "hour": schema.measurement_hour,
+         "day": schema.measurement_day, "daily": schema.energy_daily, "baseload": schema.baseload_daily}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def resolve(tier):
+    """Tabelle zu einem Stufen- oder Tabellennamen."""
+    for name, table in TIERS.items():
+        if tier in (name, table.name):
+            return table
+    raise ValueError(f"Unknown tier: {tier}")
+
+
+def filename(table, start, end, fmt, compress=False):
+    last = end - timedelta(microseconds=1)
+    return f"{table.name}-{start:%Y%m%d}-{last:%Y%m%d}.{fmt}" + (".gz" if compress else "")
+
+
+def _partitions(engine, table, start, end, chunk):
+    cols = [c for c in table.columns if c.name != "id"]
+    yield [c.name for c in cols]
+    cold = archive.of(engine) if table.name in archive.TABLES else None
+    if cold is not None:
+        # archivierte Zeiträume liegen vor allen Zeilen der DB
+        rows = cold.records(table.name, start, end)
+        while part := list(islice(rows, chunk)):
+            yield part
+        start = max(start, cold.until)
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk).execute(
+            select(*cols).where(table.c.timestamp >= start, table.c.timestamp < end).order_by(table.c.timestamp))
+        yield from result.partitions()
+
+
+def _csv(parts):
+    names = next(parts)
+    buf = io.StringIO()
+    out = csv.writer(buf, lineterminator="\n")
+    out.writerow(names)
+    for rows in parts:
+        out.writerows((ts.isoformat(), *values) for ts, *values in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _ndjson(parts):
+    names = next(parts)
+    for rows in parts:
+        yield "".join(json.dumps(dict(zip(names, (ts.isoformat(), *values)))) + "\n" for ts, *values in rows)
+
+
+def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def stream(engine, table, start, end, fmt="csv", compress=False, chunk=CHUNK_ROWS):
+    """Zeilen [start, end) als Bytes-Blöcke im gewünschten Format."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    encode = _csv if fmt == "csv" else _ndjson
+    chunks = (text.encode() for text in encode(_partitions(engine, table, start, end, chunk)))
+    return _gzip(chunks) if compress else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Energy Pi: Export von Roh- und Aggregatdaten")
+    parser.add_argument("tier", choices=list(TIERS), help="Stufe")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="Beginn (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat,
+                        help="Ende (YYYY-MM-DD: einschließlich dieses Tags, mit Uhrzeit: exklusiv)")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip-komprimiert ausgeben")
+    parser.add_argument("-o", "--output", help="Zieldatei (Standard: stdout)")
+    parser.add_argument("--meter", default=DEFAULT_METER, help="Zähler (Standard: DEFAULT_METER)")
+    args = parser.parse_args()
+
+    end = args.end if args.end.time() != datetime.min.time() else args.end + timedelta(days=1)
+    engine = reader_engine(db_path(args.meter))
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream(engine, TIERS[args.tier], args.start, end, args.format, args.gzip):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+HTTP-Caching für Smart Energy Pi
+
+Antwortschicht zwischen Ergebnis-Cache (cache.py) und Browser:
+
+- Body: fertig serialisierte Antwort mit starkem ETag aus dem Inhalt und
+  komprimierten Fassungen (gzip, Brotli falls installiert), die einmal je
+  Cache-Eintrag entstehen. Der Ergebnis-Cache baut einen Eintrag neu, sobald
+  der Ingest eine Minute abschließt oder aggregate.py läuft; der ETag ändert
+  sich also genau mit dem Datenstand.
+- Bedingte Anfragen: passt If-None-Match, antwortet der Server mit 304 ohne
+  Body. Jede Kodierung hat ihren eigenen ETag (`"<hash>-gzip"`), verglichen
+  wird über den Hash.
+- Cache-Control: IMMUTABLE für Inhalte, deren URL sich mit dem Inhalt ändert
+  (Assets, i18n mit Version, abgeschlossene Zeiträume mit festen Daten),
+  sonst `no-cache` (immer nachfragen, meist 304).
+- Assets: Dateien aus static/ unter inhaltsbasierten Namen
+  (`/assets/js/app.<hash>.js`), aus dem Speicher ausgeliefert.
+
+Antworten ohne eigenen Body (z.B. /api/latest) bekommen ETag und
+Kompression über finalize() im after_request-Hook.
+"""
+import gzip, hashlib, mimetypes, os
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+IMMUTABLE = "public, max-age=31536000, immutable"
+# abgeschlossene Zeiträume: Daten ändern sich nur noch durch einen Import (backfill.py)
+CLOSED = "public, max-age=86400, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("application/json", "application/javascript", "text/javascript", "text/css", "text/html",
+                "text/plain", "image/svg+xml")
+
+
+def encode(data, coding):
+    if coding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+class Body:
+    """Antwort-Bytes mit ETag; komprimierte Fassungen werden bei Bedarf erzeugt und behalten."""
+
+    def __init__(self, data, mimetype="application/json", payload=None, cache_control=REVALIDATE):
+        self.data = data
+        self.mimetype = mimetype
+        self.payload = payload
+        self.cache_control = cache_control
+        self.etag = hashlib.blake2b(data, digest_size=12).hexdigest()
+        self._encoded = {}
+
+    @classmethod
+    def json(cls, payload, dumps, **kw):
+        return cls(dumps(payload).encode(), payload=payload, **kw)
+
+    def encoded(self, coding):
+        data = self._encoded.get(coding)
+        if data is None:
+            data = self._encoded[coding] = encode(self.data, coding)
+        return data
+
+
+def negotiate(body):
+    """Kodierung laut Accept-Encoding (Brotli vor gzip), None für kleine oder nicht komprimierbare Antworten."""
+    if len(body.data) < MIN_BYTES or body.mimetype not in COMPRESSIBLE:
+        return None
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def _not_modified(etag):
+    tags = request.if_none_match
+    return tags.star_tag or any(t.split("-")[0] == etag for t in tags.as_set(include_weak=True))
+
+
+def apply(response, body):
+    """Setzt ETag, Vary und Body (komprimiert oder 304) auf `response`."""
+    coding = negotiate(body)
+    response.headers["ETag"] = f'"{body.etag}-{coding}"' if coding else f'"{body.etag}"'
+    response.headers["Vary"] = "Accept-Encoding"
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = body.cache_control
+    if request.method in ("GET", "HEAD") and _not_modified(body.etag):
+        response.status_code = 304
+        response.set_data(b"")
+        return response
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    response.set_data(body.encoded(coding) if coding else body.data)
+    return response
+
+
+def respond(body, cache_control=None):
+    resp = Response(mimetype=body.mimetype)
+    if cache_control:
+        resp.headers["Cache-Control"] = cache_control
+    return apply(resp, body)
+
+
+def finalize(response):
+    """after_request: ETag/304 und Kompression für alle übrigen 200-Antworten (nicht gestreamt)."""
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "ETag" in response.headers or response.mimetype not in COMPRESSIBLE):
+        return response
+    return apply(response, Body(response.get_data(), response.mimetype))
+
+
+class Assets:
+    """Statische Dateien unter inhaltsbasierten Namen; geänderte Dateien (mtime) werden neu eingelesen."""
+
+    def __init__(self, folder, prefix="/assets/"):
+        self.folder = folder
+        self.prefix = prefix
+        self.files = {}
+        self.names = {}
+
+    def _load(self, path):
+        full = os.path.join(self.folder, path)
+        mtime = os.path.getmtime(full)
+        entry = self.files.get(path)
+        if entry is None or entry[0] != mtime:
+            with open(full, "rb") as f:
+                body = Body(f.read(), mimetypes.guess_type(path)[0] or "application/octet-stream",
+                            cache_control=IMMUTABLE)
+            root, ext = os.path.splitext(path)
+            name = f"{root}.{body.etag[:12]}{ext}"
+            entry = self.files[path] = (mtime, name, body)
+            self.names[name] = body
+        return entry
+
+    def url(self, path):
+        """URL mit Inhalts-Hash für eine Datei relativ zu static/ (für Templates)."""
+        return self.prefix + self._load(path)[1]
+
+    def get(self, name):
+        return self.names.get(name)
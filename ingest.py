@@ -0,0 +1,378 @@
+"""
+Ingest-Pipeline für Smart Energy Pi
+
+MQTT-Messwerte landen zuerst in einer begrenzten Queue. Ein eigener
+Writer-Thread schreibt sie gebündelt (executemany, eine Transaktion pro
+Batch), sobald BATCH_SIZE Werte anliegen oder FLUSH_SECONDS vergangen sind.
+Beim Beenden wird die Queue garantiert geleert.
+
+Live-Rollups: der Writer führt laufende Minuten-, Stunden- und Tages-Buckets
+mit und schreibt jeden abgeschlossenen Bucket in derselben Transaktion in
+measurement_minute/_hour/_day, abgeschlossene Tage zusätzlich in die
+Zusammenfassung energy_daily. Minimum und Perzentil der Leistung im
+Grundlast-Fenster (BASELOAD_HOURS) gehen mit jeder Minute im Fenster nach
+baseload_daily. Nach einem Neustart werden die Buckets aus den Rohdaten
+wiederhergestellt.
+"""
+import json, logging, os, queue, threading, time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from energy import percentile
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+except ImportError:
+    pass
+
+log = logging.getLogger(__name__)
+
+OBIS_POWER = os.getenv("OBIS_POWER", "1.7.0")
+OBIS_ENERGY = os.getenv("OBIS_ENERGY", "1.8.0")
+OBIS_ENERGY_DIVISOR = float(os.getenv("OBIS_ENERGY_DIVISOR", 1000))
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", 2.0))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10000))
+PUT_TIMEOUT = float(os.getenv("INGEST_PUT_TIMEOUT", 0.5))
+LIVE_ROLLUPS = os.getenv("LIVE_ROLLUPS", "true").lower() == "true"
+BASELOAD_HOURS = (int(os.getenv("BASELOAD_HOUR_START", 2)), int(os.getenv("BASELOAD_HOUR_END", 5)))
+BASELOAD_PERCENTILE = float(os.getenv("BASELOAD_PERCENTILE", 10))
+MINUTE, HOUR, DAY = timedelta(minutes=1), timedelta(hours=1), timedelta(days=1)
+
+
+def decode_reading(data):
+    """OBIS-Werte eines Datensatzes (dict aus JSON oder CSV) zu (watt, kwh)."""
+    watt = float(data.get(OBIS_POWER, 0))
+    kwh = float(data.get(OBIS_ENERGY, 0)) / OBIS_ENERGY_DIVISOR
+    return watt, kwh
+
+
+def decode_payload(payload):
+    """Dekodiert einen OBIS-JSON-Payload zu (watt, kwh)."""
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    return decode_reading(json.loads(payload))
+
+
+class _Bucket:
+    __slots__ = ("start", "end", "count", "sum", "max", "min", "first_kwh", "last_kwh", "kwh")
+
+    def __init__(self, start, step, first_kwh=None):
+        self.start = start
+        self.end = start + step
+        self.count = 0
+        self.sum = 0.0
+        self.max = self.min = None
+        self.first_kwh = self.last_kwh = first_kwh
+        self.kwh = 0.0
+
+    def add(self, avg, mx, mn):
+        self.count += 1
+        self.sum += avg
+        self.max = mx if self.max is None else max(self.max, mx)
+        self.min = mn if self.min is None else min(self.min, mn)
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class Rollup:
+    """Laufende Aggregate für die offenen Minuten-, Stunden- und Tages-Buckets.
+
+    Formeln wie in aggregate.py (Minute aus Rohwerten, Stunde aus Minuten,
+    Tag aus Stunden). Stunden-kWh zählen ab dem letzten Zählerstand vor der
+    Stunde, damit Stunden- und Tagessummen lückenlos sind.
+    """
+
+    def __init__(self, progress=False):
+        self.minute = self.hour = self.day = None
+        self.last_kwh = None
+        self.last_start = None
+        # Rohwert-Anzahl und Werte im Grundlast-Fenster des laufenden Kalendertags
+        # (für energy_daily und baseload_daily)
+        self.sample_day = None
+        self.samples = 0
+        self.night = []
+        self.night_closed = False
+        # Live-Ingest: Grundlast schon während des Fensters mit jeder Minute melden
+        self.progress = progress
+
+    def add(self, ts, watt, kwh):
+        """Verarbeitet einen Messwert, gibt abgeschlossene Buckets als [(tier, row)] zurück."""
+        closed = []
+        if self.minute and ts >= self.minute.end:
+            self._close_minute(closed)
+        if self.hour and ts >= self.hour.end:
+            self._close_hour(closed)
+        if self.day and ts >= self.day.end:
+            self._close_day(closed)
+        if self.minute is None:
+            self.minute = _Bucket(ts.replace(second=0, microsecond=0), MINUTE, kwh)
+        self.minute.add(watt, watt, watt)
+        self.minute.last_kwh = kwh
+        if self.sample_day != ts.date():
+            self._close_night(closed)
+            self.sample_day, self.samples, self.night, self.night_closed = ts.date(), 0, [], False
+        self.samples += 1
+        if BASELOAD_HOURS[0] <= ts.hour <= BASELOAD_HOURS[1]:
+            self.night.append(watt)
+        elif ts.hour > BASELOAD_HOURS[1]:
+            self._close_night(closed)
+        return closed
+
+    def close_all(self):
+        """Schließt alle offenen Buckets (Ende eines Imports), gibt [(tier, row)] zurück."""
+        closed = []
+        if self.minute:
+            self._close_minute(closed)
+        if self.hour:
+            self._close_hour(closed)
+        if self.day:
+            self._close_day(closed)
+        self._close_night(closed)
+        return closed
+
+    def _baseload(self):
+        d = self.sample_day
+        return {"timestamp": datetime(d.year, d.month, d.day), "min_watt": min(self.night),
+                "percentile_watt": percentile(self.night, BASELOAD_PERCENTILE), "samples": len(self.night)}
+
+    def _close_night(self, closed):
+        """Grundlast-Fenster des Tages abgeschlossen: Zeile für baseload_daily (einmal pro Tag)."""
+        if self.night and not self.night_closed:
+            closed.append(("baseload", self._baseload()))
+            self.night_closed = True
+
+    def _close_minute(self, closed):
+        m, self.minute = self.minute, None
+        closed.append(("minute", {"timestamp": m.start, "power_avg": m.avg, "power_max": m.max,
+                                  "power_min": m.min, "total_kwh": m.last_kwh}))
+        if self.hour is None:
+            start = m.start.replace(minute=0)
+            recent = self.last_start is not None and self.last_start >= start - timedelta(hours=1)
+            self.hour = _Bucket(start, HOUR, self.last_kwh if recent else m.first_kwh)
+        self.hour.add(m.avg, m.max, m.min)
+        self.hour.last_kwh = m.last_kwh
+        self.last_kwh, self.last_start = m.last_kwh, m.start
+        if self.progress and self.night and not self.night_closed and m.start.date() == self.sample_day:
+            closed.append(("baseload", self._baseload()))
+
+    def _close_hour(self, closed):
+        h, self.hour = self.hour, None
+        kwh = max(h.last_kwh - h.first_kwh, 0.0)
+        closed.append(("hour", {"timestamp": h.start, "power_avg": h.avg, "power_max": h.max,
+                                "power_min": h.min, "kwh_used": kwh}))
+        if self.day is None:
+            self.day = _Bucket(h.start.replace(hour=0), DAY)
+        self.day.add(h.avg, h.max, h.min)
+        self.day.kwh += kwh
+
+    def _close_day(self, closed):
+        d, self.day = self.day, None
+        closed.append(("day", {"timestamp": d.start, "power_avg": d.avg, "power_max": d.max,
+                               "power_min": d.min, "kwh_used": d.kwh}))
+        own = self.sample_day == d.start.date()
+        closed.append(("daily", {"timestamp": d.start, "kwh_used": d.kwh, "power_avg": d.avg,
+                                 "power_min": d.min, "power_max": d.max,
+                                 "baseload_watt": min(self.night) if own and self.night else None,
+                                 "samples": self.samples if own else None}))
+
+
+class IngestWriter:
+    """Gepufferter Writer: Queue -> Batch -> eine Transaktion."""
+
+    def __init__(self, table, tiers=None, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 queue_size=QUEUE_SIZE, put_timeout=PUT_TIMEOUT):
+        self.table = table
+        # Kompaktes Layout: Zeitstempel ist Primärschlüssel (1 s), der letzte Wert je Sekunde gewinnt;
+        # überschriebene Werte werden gezählt (`replaced`)
+        self.per_second = "id" not in table.c
+        self._insert = table.insert().prefix_with("OR REPLACE") if self.per_second else table.insert()
+        self._last_second = None
+        self.tiers = tiers if LIVE_ROLLUPS else None
+        self.rollup = Rollup(progress=True) if self.tiers else None
+        self._closed = []
+        self.listeners = []
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.engine = None
+        self._pending = []
+        self._stop = threading.Event()
+        # gesetzt, sobald die Live-Rollups wiederhergestellt sind und der Writer Werte annimmt
+        self.ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {
+            "received": 0, "written": 0, "dropped": 0, "replaced": 0, "failed_batches": 0,
+            "batches": 0, "queue_high_water": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+        }
+
+    def start(self, engine):
+        self.engine = engine
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, ts, watt, kwh):
+        """Nimmt einen Messwert an. Bei voller Queue wird kurz blockiert
+        (Backpressure Richtung Broker), danach verworfen."""
+        try:
+            self.queue.put((ts, watt, kwh), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+            return False
+        with self._lock:
+            self.counters["received"] += 1
+            depth = self.queue.qsize()
+            if depth > self.counters["queue_high_water"]:
+                self.counters["queue_high_water"] = depth
+        return True
+
+    def stop(self, timeout=10):
+        """Beendet den Writer und schreibt alle ausstehenden Werte."""
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        s = self.stats()
+        log.info(f"Ingest writer stopped: {s['written']} written, {s['dropped']} dropped, {s['pending']} pending")
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+        out["queue_depth"] = self.queue.qsize()
+        out["pending"] = len(self._pending)
+        out["avg_flush_ms"] = round(out["total_flush_ms"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
+
+    def _take(self, item):
+        self._pending.append(item)
+        if self.rollup:
+            self._closed += self.rollup.add(*item)
+
+    def _drain(self, limit):
+        while len(self._pending) < limit:
+            try:
+                self._take(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _warm(self):
+        """Offene Buckets aus den Rohdaten wiederherstellen und seit dem letzten
+        vollständigen Tag fehlende Tier-Zeilen nachtragen (bestehende bleiben)."""
+        t = self.table.c
+        since = (datetime.now() - timedelta(hours=48)).replace(hour=0, minute=0, second=0, microsecond=0)
+        since += timedelta(days=1)
+        closed = []
+        with self.engine.connect() as conn:
+            prev = conn.execute(select(t.timestamp, t.total_kwh).where(t.timestamp < since)
+                                .order_by(t.timestamp.desc()).limit(1)).first()
+            if prev:
+                self.rollup.last_start = prev.timestamp.replace(second=0, microsecond=0)
+                self.rollup.last_kwh = prev.total_kwh
+            rows = conn.execute(select(t.timestamp, t.power_watt, t.total_kwh)
+                                .where(t.timestamp >= since).order_by(t.timestamp))
+            for ts, watt, kwh in rows:
+                closed += self.rollup.add(ts, watt, kwh)
+        if closed:
+            with self.engine.begin() as conn:
+                self._write_closed(conn, closed, replace=False)
+        log.info(f"Live rollups warmed up: {len(closed)} closed buckets since {since:%Y-%m-%d}")
+
+    def _write_closed(self, conn, closed, replace=True):
+        for tier, table in self.tiers.items():
+            # je Zeitstempel nur die letzte Zeile (Grundlast wird im Fenster fortlaufend gemeldet)
+            rows = list({row["timestamp"]: row for t, row in closed if t == tier}.values())
+            if not rows:
+                continue
+            stmt = sqlite_insert(table)
+            if replace:
+                cols = [c for c in rows[0] if c != "timestamp"]
+                stmt = stmt.on_conflict_do_update(index_elements=["timestamp"],
+                                                  set_={c: stmt.excluded[c] for c in cols})
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=["timestamp"])
+            conn.execute(stmt, rows)
+
+    def _run(self):
+        if self.rollup:
+            try:
+                self._warm()
+            except Exception as e:
+                log.error(f"Live rollup warm-up failed: {e}")
+        self.ready.set()
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            wait = max(0.0, self.flush_seconds - (time.monotonic() - last_flush))
+            try:
+                self._take(self.queue.get(timeout=wait))
+            except queue.Empty:
+                pass
+            self._drain(self.batch_size)
+            due = time.monotonic() - last_flush >= self.flush_seconds
+            if self._pending and (len(self._pending) >= self.batch_size or due):
+                if not self._flush():
+                    self._stop.wait(1.0)
+                last_flush = time.monotonic()
+            elif due:
+                last_flush = time.monotonic()
+        # Shutdown: alles schreiben, was noch in der Queue liegt
+        while True:
+            self._drain(self.batch_size)
+            if not self._pending or not self._flush():
+                break
+
+    def _replaced(self, batch):
+        """Kompaktes Layout: Werte des Batches, die einen Wert derselben Sekunde überschreiben."""
+        seconds = {ts.replace(microsecond=0) for ts, _, _ in batch}
+        return len(batch) - len(seconds) + (self._last_second in seconds), max(seconds)
+
+    def _flush(self):
+        batch = self._pending
+        rows = [{"timestamp": ts, "power_watt": w, "total_kwh": k} for ts, w, k in batch]
+        t0 = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self._insert, rows)
+                if self._closed:
+                    self._write_closed(conn, self._closed)
+        except Exception as e:
+            # Batch behalten und beim nächsten Flush erneut versuchen
+            with self._lock:
+                self.counters["failed_batches"] += 1
+                overflow = len(batch) - self.queue.maxsize
+                if overflow > 0:
+                    del batch[:overflow]
+                    self.counters["dropped"] += overflow
+            log.error(f"Ingest flush failed ({len(batch)} rows pending): {e}")
+            return False
+        ms = (time.perf_counter() - t0) * 1000
+        closed, self._closed = self._closed, []
+        self._pending = []
+        replaced = 0
+        if self.per_second:
+            replaced, self._last_second = self._replaced(batch)
+            if replaced and not self.counters["replaced"]:
+                log.warning(f"{replaced} reading(s) replaced a reading of the same second: the compact layout "
+                            f"keeps one reading per second, further ones are only counted (replaced)")
+        with self._lock:
+            c = self.counters
+            c["written"] += len(batch)
+            c["replaced"] += replaced
+            c["batches"] += 1
+            c["last_flush_ms"] = round(ms, 2)
+            c["max_flush_ms"] = max(c["max_flush_ms"], round(ms, 2))
+            c["total_flush_ms"] += ms
+        for fn in self.listeners:
+            try:
+                fn(closed)
+            except Exception as e:
+                log.error(f"Ingest listener error: {e}")
+        return True
@@ -0,0 +1,320 @@
+"""
+Live-Daten für Smart Energy Pi
+
+Ringpuffer der letzten Messwerte im Speicher. Der MQTT-Thread schreibt,
+Request-Handler lesen ohne Lock: ein Slot wird erst beschrieben und danach
+über `count` veröffentlicht. Dazu Stunden-Spitzen der letzten 7 Tage und
+der erste Zählerstand des Tages, damit /api/latest und /api/gauge-range
+ohne SQLite auskommen. Beim Start wird der Puffer aus der DB vorgewärmt.
+
+Neue Messwerte und Statistik-Updates werden per Server-Sent Events an alle
+verbundenen Dashboards verteilt (Broadcaster), statt dass jeder Client pollt.
+Die Statistik-Updates berechnet ein eigener Thread (Publisher); der
+Ingest-Writer weckt ihn nur.
+
+Web-Worker ohne eigenen Ingest (wsgi.py) füllen den Puffer über einen
+Follower, der neue Rohwerte aus der DB liest.
+"""
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import json, logging, os, queue, threading
+
+from energy import to_db, from_db, to_epoch
+from schema import bucket, epoch, watt
+
+BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", 3600))
+PEAK_HOURS = 7 * 24
+CLIENT_QUEUE = int(os.getenv("SSE_CLIENT_QUEUE", 100))
+HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))
+RETRY_MS = 3000
+FOLLOW_SECONDS = float(os.getenv("LIVE_FOLLOW_SECONDS", 1))
+
+log = logging.getLogger(__name__)
+
+
+def _epoch(dt):
+    return to_epoch(dt) + dt.microsecond / 1e6
+
+
+def _from_epoch(sec):
+    return datetime(1970, 1, 1) + timedelta(seconds=sec)
+
+
+class LiveBuffer:
+    """Array-basierter Ringpuffer (ein Schreiber, beliebig viele Leser)."""
+
+    def __init__(self, capacity=BUFFER_SIZE):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.watt = array("d", bytes(8 * capacity))
+        self.kwh = array("d", bytes(8 * capacity))
+        self.count = 0
+        self.peak_hour = array("q", bytes(8 * PEAK_HOURS))
+        self.peak_watt = array("d", bytes(8 * PEAK_HOURS))
+        self.day_first = (None, 0.0)
+        self.ready = False
+
+    def push(self, ts, watt, kwh):
+        i = self.count % self.capacity
+        sec = _epoch(ts)
+        self.ts[i], self.watt[i], self.kwh[i] = sec, watt, kwh
+        self.count += 1
+        self._note_peak(int(sec) // 3600, watt)
+        day = ts.date()
+        if self.day_first[0] != day:
+            self.day_first = (day, kwh)
+
+    def _note_peak(self, hour, watt):
+        slot = hour % PEAK_HOURS
+        if self.peak_hour[slot] != hour:
+            self.peak_hour[slot] = hour
+            self.peak_watt[slot] = watt
+        elif watt > self.peak_watt[slot]:
+            self.peak_watt[slot] = watt
+
+    def latest(self):
+        """Letzter Messwert als (timestamp, watt, kwh) oder None."""
+        n = self.count
+        if not n:
+            return None
+        i = (n - 1) % self.capacity
+        return _from_epoch(self.ts[i]), self.watt[i], self.kwh[i]
+
+    def recent(self, seconds, now=None):
+        """Messwerte der letzten `seconds` Sekunden, älteste zuerst."""
+        n = self.count
+        since = _epoch(now or datetime.now()) - seconds
+        out = []
+        for k in range(n - 1, max(n - self.capacity, 0) - 1, -1):
+            i = k % self.capacity
+            if self.ts[i] < since:
+                break
+            out.append((_from_epoch(self.ts[i]), self.watt[i], self.kwh[i]))
+        return out[::-1]
+
+    def kwh_today(self, now=None):
+        last = self.latest()
+        day, first = self.day_first
+        if not last or day != (now or datetime.now()).date():
+            return 0.0
+        return last[2] - first
+
+    def peak_7d(self, now=None):
+        """Höchste Leistung seit jetzt - 7 Tagen (stundengenau), None ohne Daten."""
+        since = int(_epoch((now or datetime.now()) - timedelta(days=7))) // 3600
+        peaks = [w for h, w in zip(self.peak_hour, self.peak_watt) if h >= since and h]
+        return max(peaks, default=None)
+
+    def warm(self, conn, now=None):
+        """Vorwärmen aus der DB: letzte Rohwerte, erster Wert heute, Stunden-Spitzen."""
+        now = now or datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = conn.execute(text(
+            f"SELECT timestamp, {watt('power_watt')}, total_kwh FROM measurement ORDER BY timestamp DESC LIMIT :n"
+        ), {"n": self.capacity}).fetchall()
+        for ts, power, kwh in reversed(rows):
+            self.push(from_db(ts), power, kwh)
+        first = conn.execute(text(
+            "SELECT total_kwh FROM measurement WHERE timestamp >= :s ORDER BY timestamp ASC LIMIT 1"
+        ), {"s": to_db(today)}).scalar()
+        if first is not None:
+            self.day_first = (today.date(), first)
+        week_ago = to_db(now - timedelta(days=7))
+        for table, column in (("measurement_hour", "power_max"), ("measurement_minute", "power_max"),
+                              ("measurement", "power_watt")):
+            for hour, peak in conn.execute(text(
+                f"SELECT {epoch('MIN(timestamp)')} / 3600, {watt(f'MAX({column})')} "
+                f"FROM {table} WHERE timestamp >= :s GROUP BY {bucket('timestamp', 3600)}"
+            ), {"s": week_ago}):
+                if peak is not None:
+                    self._note_peak(hour, peak)
+        self.ready = True
+
+
+class Follower:
+    """Liest neue Rohwerte aus der DB in den Live-Puffer, alle `interval` Sekunden.
+
+    Ersetzt in Web-Workern den IngestWriter als Quelle: `listeners` bekommen
+    wie beim Writer die abgeschlossenen Minuten als [("minute", row)],
+    `on_readings` wird nach jedem Abruf mit neuen Werten aufgerufen.
+    Neue Werte sind sichtbar, sobald der Ingest-Prozess seinen Batch schreibt.
+    """
+
+    def __init__(self, live, interval=FOLLOW_SECONDS):
+        self.live = live
+        self.interval = interval
+        self.listeners = []
+        self.on_readings = []
+        self.engine = None
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, engine):
+        self.engine = engine
+        with engine.connect() as conn:
+            self.last = conn.execute(text("SELECT MAX(timestamp) FROM measurement")).scalar()
+        self._thread = threading.Thread(target=self._run, name="live-follower", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def poll(self, conn):
+        """Übernimmt alle Rohwerte nach dem zuletzt gesehenen; gibt die abgeschlossenen Minuten zurück."""
+        where = "" if self.last is None else "WHERE timestamp > :t"
+        rows = conn.execute(text(
+            f"SELECT timestamp, {watt('power_watt')}, total_kwh FROM measurement {where} "
+            "ORDER BY timestamp LIMIT :n"), {"t": self.last, "n": self.live.capacity}).fetchall()
+        closed = []
+        prev = self.live.latest()
+        minute = prev[0].replace(second=0, microsecond=0) if prev else None
+        for raw, power, kwh in rows:
+            ts = from_db(raw)
+            start = ts.replace(second=0, microsecond=0)
+            if minute is not None and start > minute:
+                closed.append(("minute", {"timestamp": minute}))
+            minute = start
+            self.live.push(ts, power, kwh)
+            self.last = raw
+        return rows, closed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.engine.connect() as conn:
+                    rows, closed = self.poll(conn)
+            except Exception as e:
+                log.error(f"Live follower failed: {e}")
+                continue
+            if rows:
+                for fn in self.on_readings:
+                    try:
+                        fn()
+                    except Exception as e:
+                        log.error(f"Live follower listener error: {e}")
+            if closed:
+                for fn in self.listeners:
+                    try:
+                        fn(closed)
+                    except Exception as e:
+                        log.error(f"Live follower listener error: {e}")
+
+
+class Publisher:
+    """Eigener Thread für die Statistik-Updates je abgeschlossener Minute.
+
+    Writer und Follower rufen nur notify() auf (ein Flag), Abfragen und
+    Serialisierung laufen hier. Schließen während eines Laufs weitere Minuten
+    ab, folgt genau ein weiterer Lauf - jeder Lauf liefert den aktuellen Stand.
+    """
+
+    def __init__(self, name="sse-publisher"):
+        self.name = name
+        self.fn = None
+        self.runs = 0
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, fn):
+        self.fn = fn
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        self._pending.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._pending.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            if self._stop.is_set():
+                return
+            self._pending.clear()
+            try:
+                self.fn()
+            except Exception as e:
+                log.error(f"SSE publisher error: {e}")
+            self.runs += 1
+
+
+class _Client:
+    __slots__ = ("queue", "closed", "variants")
+
+    def __init__(self, size, variants=None):
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = False
+        self.variants = variants or {}
+
+
+class Broadcaster:
+    """Fan-out für Server-Sent Events.
+
+    publish() kodiert jedes Event einmal und legt es in die begrenzte Queue
+    jedes Clients. Ist eine Queue voll, wird der Client getrennt (er verbindet
+    sich per EventSource neu), statt den Ingest aufzuhalten.
+
+    Ein Client kann je Event eine Variante wählen (z. B. den Verlauf als
+    reduzierte Linie); er bekommt nur Events mit seiner Variante, ohne Wahl
+    die mit variant=None.
+    """
+
+    def __init__(self, queue_size=CLIENT_QUEUE, heartbeat=HEARTBEAT):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.dropped_clients = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def variants(self, event):
+        """Varianten von `event`, die verbundene Clients gewählt haben (None für die Standardform)."""
+        with self.lock:
+            return {c.variants.get(event) for c in self.clients}
+
+    def publish(self, event, data, variant=None):
+        msg = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+        with self.lock:
+            clients = [c for c in self.clients if c.variants.get(event) == variant]
+        for c in clients:
+            try:
+                c.queue.put_nowait(msg)
+            except queue.Full:
+                c.closed = True
+                with self.lock:
+                    self.clients.discard(c)
+                    self.dropped_clients += 1
+        self.published += 1
+
+    def stream(self, initial=(), variants=None):
+        """Generator für eine SSE-Antwort; `initial` sind (event, data)-Paare für den Start,
+        `variants` die gewählten Varianten je Event."""
+        client = _Client(self.queue_size, variants)
+        with self.lock:
+            self.clients.add(client)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            for event, data in initial:
+                yield f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+            while not client.closed:
+                try:
+                    yield client.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+        finally:
+            with self.lock:
+                self.clients.discard(client)
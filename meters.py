@@ -0,0 +1,202 @@
+"""
+Mehrere Zähler für Smart Energy Pi
+
+Jeder Zähler hat eine eigene SQLite-Datei mit dem gewohnten Schema, damit
+Abfragen nie über fremde Zeitreihen laufen und jede Datei für sich
+aggregiert, gesichert oder gelöscht werden kann:
+
+- Standard-Zähler (DEFAULT_METER) -> DB_PATH, wie bisher
+- weitere Zähler                  -> METER_DB_DIR/<id>.db
+
+Die Zähler-ID kommt aus dem MQTT-Topic: MQTT_TOPIC darf ein `+` enthalten,
+die Topic-Ebene an dieser Stelle ist die ID (z.B. `meters/+/SENSOR`).
+Ohne Wildcard landet alles beim Standard-Zähler.
+
+Pro Zähler hält die Registry Schreib- und Lese-Engine, Ingest-Writer,
+Live-Puffer, SSE-Broadcaster und Ergebnis-Cache. Zähler werden beim ersten
+Messwert oder Request geöffnet; ein gemeinsamer Wartungs-Thread macht die
+Checkpoints für alle Dateien.
+
+Ohne `ingest` (Web-Worker, wsgi.py) schreibt ein Zähler nichts: statt des
+Writers liest ein Follower neue Messwerte des Ingest-Prozesses aus der DB.
+Solche Zähler öffnen nur die Lese-Engine, und erst wenn der Ingest-Prozess
+(oder aggregate.py) Datei und Schema angelegt hat; Web-Worker legen weder
+Dateien noch Tabellen an und migrieren nichts.
+"""
+import glob, logging, os, re, threading
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import schema
+from aggregate import ensure_schema
+from cache import ResultCache
+from ingest import IngestWriter
+from live import Broadcaster, Follower, LiveBuffer, Publisher
+from storage import DB_PATH, ROOT, Maintenance, connect, reader_engine, writer_engine
+
+log = logging.getLogger(__name__)
+
+DEFAULT_METER = os.getenv("DEFAULT_METER", "default")
+_dir_env = os.getenv("METER_DB_DIR", "instance/meters")
+METER_DB_DIR = _dir_env if os.path.isabs(_dir_env) else os.path.join(ROOT, _dir_env)
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def meter_from_topic(pattern, topic):
+    """Zähler-ID aus einem Topic (Ebene an der Stelle des ersten `+`), None wenn sie ungültig ist."""
+    levels = pattern.split("/")
+    if "+" not in levels:
+        return DEFAULT_METER
+    parts = topic.split("/")
+    i = levels.index("+")
+    meter_id = parts[i] if i < len(parts) else None
+    return meter_id if meter_id and _VALID_ID.match(meter_id) else None
+
+
+def db_path(meter_id):
+    if meter_id == DEFAULT_METER:
+        return DB_PATH
+    if not _VALID_ID.match(meter_id):
+        raise ValueError(f"Invalid meter id: {meter_id}")
+    return os.path.join(METER_DB_DIR, f"{meter_id}.db")
+
+
+def known_meters():
+    """IDs aller Zähler mit vorhandener Datenbank."""
+    ids = [DEFAULT_METER] if os.path.exists(DB_PATH) else []
+    ids += sorted(os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(METER_DB_DIR, "*.db")))
+    return [i for i in dict.fromkeys(ids) if _VALID_ID.match(i)]
+
+
+def schema_ready(path):
+    """Datei mit allen Tabellen und Indizes aus schema.py vorhanden (ensure_schema ist durchgelaufen)."""
+    if not os.path.exists(path):
+        return False
+    conn = connect(path, readonly=True)
+    try:
+        names = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    finally:
+        conn.close()
+    return {t.name for t in schema.metadata.sorted_tables} | {i.name for t in schema.metadata.sorted_tables
+                                                             for i in t.indexes} <= names
+
+
+class Meter:
+    """Alles, was zu einem Zähler gehört. `open()` legt Schema an, wärmt den Live-Puffer und startet den Writer
+    (ohne `ingest` den Follower)."""
+
+    def __init__(self, meter_id, path=None, ingest=True):
+        self.id = meter_id
+        self.path = path or db_path(meter_id)
+        self.write_engine = writer_engine(self.path) if ingest else None
+        self.read_engine = None
+        self.live = LiveBuffer()
+        self.writer = IngestWriter(schema.measurement, tiers={
+            "minute": schema.measurement_minute,
+            "hour": schema.measurement_hour,
+            "day": schema.measurement_day,
+            "daily": schema.energy_daily,
+            "baseload": schema.baseload_daily,
+        }) if ingest else None
+        self.follower = None if ingest else Follower(self.live)
+        self.broadcaster = Broadcaster()
+        self.publisher = Publisher(f"sse-publisher-{meter_id}")
+        self.cache = ResultCache(generation=self._generation)
+
+    def open(self):
+        if self.writer:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.write_engine.begin() as conn:
+                ensure_schema(conn.connection.cursor())
+        # erst nach dem Anlegen: die Lese-Engine öffnet die Datei read-only
+        self.read_engine = reader_engine(self.path)
+        with self.read_engine.connect() as conn:
+            self.live.warm(conn)
+        if self.writer:
+            self.writer.start(self.write_engine)
+        else:
+            self.follower.start(self.read_engine)
+        return self
+
+    def close(self):
+        if self.writer:
+            self.writer.stop()
+        else:
+            self.follower.stop()
+        self.publisher.stop()
+        if self.write_engine is not None:
+            self.write_engine.dispose()
+        if self.read_engine is not None:
+            self.read_engine.dispose()
+
+    def _generation(self):
+        """Letzter Lauf des Aggregations-Scripts (Cache wird dann geleert)."""
+        try:
+            with self.read_engine.connect() as conn:
+                return conn.execute(text("SELECT MAX(updated_at) FROM aggregate_state")).scalar()
+        except OperationalError:
+            return None
+
+
+class MeterRegistry:
+    """Geöffnete Zähler nach ID; `on_open(meter)` läuft für jeden neu geöffneten Zähler.
+
+    `ingest=False` öffnet Zähler nur lesend mit Follower (Web-Worker neben subscriber.py), und erst
+    wenn ihr Schema vollständig ist; bis dahin liefert get() None und pending() True.
+    """
+
+    def __init__(self, on_open=None, ingest=True):
+        self.on_open = on_open
+        self.ingest = ingest
+        self.meters = {}
+        self.lock = threading.Lock()
+        self.maintenance = Maintenance(self.engines)
+
+    def get(self, meter_id, create=False):
+        """Geöffneter Zähler; None, wenn er keine Datenbank hat und `create` nicht gesetzt ist.
+        Ohne `ingest` wird nie angelegt: None, solange Datei oder Schema fehlen."""
+        meter = self.meters.get(meter_id)
+        if meter is not None:
+            return meter
+        with self.lock:
+            meter = self.meters.get(meter_id)
+            if meter is None:
+                try:
+                    path = db_path(meter_id)
+                except ValueError:
+                    return None
+                if not self.ingest and not schema_ready(path):
+                    return None
+                if not create and not os.path.exists(path):
+                    return None
+                meter = Meter(meter_id, path, self.ingest).open()
+                if self.on_open:
+                    self.on_open(meter)
+                self.meters[meter_id] = meter
+                log.info(f"Meter {meter_id} opened ({path})")
+        return meter
+
+    def pending(self, meter_id):
+        """Ohne `ingest`: Zähler, dessen Datenbank der Ingest-Prozess noch nicht fertig angelegt hat."""
+        if self.ingest:
+            return False
+        try:
+            return meter_id == DEFAULT_METER or os.path.exists(db_path(meter_id))
+        except ValueError:
+            return False
+
+    def ids(self):
+        return sorted(set(known_meters()) | set(self.meters))
+
+    def engines(self):
+        return [m.write_engine for m in list(self.meters.values()) if m.write_engine is not None]
+
+    def start(self):
+        self.maintenance.start()
+        return self
+
+    def close(self):
+        self.maintenance.stop()
+        for meter in list(self.meters.values()):
+            meter.close()
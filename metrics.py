@@ -0,0 +1,267 @@
+"""
+Metriken für Smart Energy Pi
+
+Zähler und Histogramme im Textformat von Prometheus (GET /metrics), ohne
+zusätzliche Abhängigkeit:
+
+- Requests: Dauer, Anzahl SQL-Abfragen und SQL-Zeit je Endpoint
+- SQL: jede Abfrage der Zähler-Engines über die Engine-Events
+  before/after_cursor_execute, getrennt nach Lese- und Schreib-Engine
+- Slow-Query-Log: Abfragen ab SLOW_QUERY_MS Millisekunden landen mit
+  Endpoint im Log (0 = aus)
+
+Ingest, Cache und Aggregation zählen schon selbst (IngestWriter.stats,
+ResultCache.stats, Tabelle aggregate_runs); diese Werte werden erst beim
+Abruf von /metrics gelesen und nur ins Textformat gebracht.
+
+Viele Abfragen pro Request (N+1) zeigen sich in http_request_sql_queries,
+Wartezeiten auf den Schreib-Lock (aggregate.py) in der SQL-Zeit der
+Schreib-Engine, ingest_flush_seconds und aggregate_lock_max_seconds.
+"""
+from contextvars import ContextVar
+import bisect, logging, math, os, threading, time
+from sqlalchemy import event, select
+
+import schema
+
+log = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 0))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _num(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def family(name, kind, help, samples, labels=()):
+    """Textzeilen einer Metrik; `samples` sind (Label-Werte, Wert)."""
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    for values, value in samples:
+        yield f"{name}{_labels(labels, values)} {_num(value)}"
+
+
+class Counter:
+    """Monoton steigender Zähler je Label-Kombination."""
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def lines(self):
+        with self.lock:
+            samples = sorted(self.values.items())
+        return family(self.name, self.kind, self.help, samples, self.labels)
+
+
+class Histogram(Counter):
+    """Histogramm mit festen Bucket-Grenzen; gespeichert wird je Bucket, kumuliert erst bei der Ausgabe."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(values)
+            if entry is None:
+                entry = self.values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def lines(self):
+        with self.lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self.values.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for values, (counts, total) in items:
+            cumulative = 0
+            for le, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, values + (_num(float(le)),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {_num(total)}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {cumulative}"
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by endpoint, method and status.",
+                   ("endpoint", "method", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by endpoint.", ("endpoint",))
+REQUEST_QUERIES = Histogram("http_request_sql_queries", "SQL queries per request by endpoint.", ("endpoint",),
+                            buckets=QUERIES)
+REQUEST_SQL_SECONDS = Histogram("http_request_sql_seconds", "Time spent in SQL per request by endpoint.",
+                                ("endpoint",))
+SQL_SECONDS = Histogram("sql_query_duration_seconds", "SQL statement latency by meter and engine.",
+                        ("meter", "engine"))
+SLOW_QUERIES = Counter("sql_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.", ("meter", "engine"))
+
+_profile = ContextVar("request_profile", default=None)
+
+
+class Profile:
+    """SQL-Abfragen eines Requests (bzw. eines Kontexts), gesammelt von den Engine-Events."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.started = time.perf_counter()
+
+
+def start_request(endpoint):
+    """Beginnt das Profil für den aktuellen Kontext; gibt das Token für finish_request zurück."""
+    return _profile.set(Profile(endpoint or "unknown"))
+
+
+def finish_request(token, method, status):
+    """Schließt das Profil ab, verbucht die Metriken und gibt es zurück (für Server-Timing)."""
+    profile = _profile.get()
+    _profile.reset(token)
+    if profile is None:
+        return None
+    elapsed = time.perf_counter() - profile.started
+    REQUESTS.inc(profile.endpoint, method, str(status))
+    REQUEST_SECONDS.observe(elapsed, profile.endpoint)
+    REQUEST_QUERIES.observe(profile.queries, profile.endpoint)
+    REQUEST_SQL_SECONDS.observe(profile.sql_seconds, profile.endpoint)
+    profile.elapsed = elapsed
+    return profile
+
+
+def server_timing(profile):
+    """Wert für den Server-Timing-Header (Browser-Devtools zeigen ihn beim Request an)."""
+    return (f'sql;dur={profile.sql_seconds * 1000:.1f};desc="{profile.queries} queries", '
+            f"app;dur={profile.elapsed * 1000:.1f}")
+
+
+def instrument(engine, meter_id, role):
+    """Misst jede Abfrage von `engine` (role: read/write) und rechnet sie dem laufenden Request an."""
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started")
+        if not started:
+            # Listener wurde während der Abfrage registriert (Writer läuft schon)
+            return
+        secs = time.perf_counter() - started.pop()
+        SQL_SECONDS.observe(secs, meter_id, role)
+        profile = _profile.get()
+        if profile is not None:
+            profile.queries += 1
+            profile.sql_seconds += secs
+        if SLOW_QUERY_MS and secs * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc(meter_id, role)
+            where = profile.endpoint if profile else "background"
+            log.warning(f"Slow query ({secs * 1000:.1f} ms, meter {meter_id}, {role}, {where}): "
+                        f"{' '.join(statement.split())[:500]}")
+
+    def failed(ctx):
+        # after_cursor_execute fehlt bei Fehlern, Startzeit trotzdem entfernen
+        started = ctx.connection.info.get("query_started") if ctx.connection is not None else None
+        if started:
+            started.pop()
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    event.listen(engine, "handle_error", failed)
+
+
+def aggregate_runs(meter):
+    """Letzter Lauf von aggregate.py je Tier (tier, finished_at, seconds, rows, deleted, lock_seconds,
+    lock_max_seconds)."""
+    with meter.read_engine.connect() as conn:
+        return conn.execute(select(schema.aggregate_runs)).fetchall()
+
+
+def meter_lines(meters):
+    """Ingest-, Cache- und Aggregationsmetriken aller geöffneten Zähler (Ingest nur mit eigenem Writer)."""
+    ingest = {m.id: m.writer.stats() for m in meters if m.writer}
+    cache = {m.id: m.cache.stats() for m in meters}
+    aggregation = {}
+    for m in meters:
+        try:
+            aggregation[m.id] = aggregate_runs(m)
+        except Exception as e:
+            log.error(f"Reading aggregate_runs failed for meter {m.id}: {e}")
+            aggregation[m.id] = []
+    meter, status = ("meter",), ("meter", "status")
+
+    def per_meter(stats, key, scale=1):
+        return [((i,), s[key] * scale) for i, s in stats.items()]
+
+    yield from family("ingest_readings_total", "counter", "Readings accepted, written, dropped or replaced "
+                      "(compact layout, same second) by the ingest writer.",
+                      [((i, k), s[k]) for i, s in ingest.items()
+                       for k in ("received", "written", "dropped", "replaced")], status)
+    yield from family("ingest_batches_total", "counter", "Batches committed by the ingest writer.",
+                      per_meter(ingest, "batches"), meter)
+    yield from family("ingest_failed_batches_total", "counter", "Failed ingest commits (retried).",
+                      per_meter(ingest, "failed_batches"), meter)
+    yield from family("ingest_queue_depth", "gauge", "Readings waiting in the ingest queue.",
+                      per_meter(ingest, "queue_depth"), meter)
+    yield from family("ingest_queue_high_water", "gauge", "Highest ingest queue depth since start.",
+                      per_meter(ingest, "queue_high_water"), meter)
+    yield "# HELP ingest_flush_seconds Commit latency of ingest batches."
+    yield "# TYPE ingest_flush_seconds summary"
+    for i, s in ingest.items():
+        yield f"ingest_flush_seconds_sum{_labels(meter, (i,))} {_num(s['total_flush_ms'] / 1000)}"
+        yield f"ingest_flush_seconds_count{_labels(meter, (i,))} {s['batches']}"
+    yield from family("ingest_flush_max_seconds", "gauge", "Slowest ingest commit since start.",
+                      per_meter(ingest, "max_flush_ms", 0.001), meter)
+
+    yield from family("cache_lookups_total", "counter", "Result cache lookups by result.",
+                      [((i, r), s[k]) for i, s in cache.items() for r, k in (("hit", "hits"), ("miss", "misses"))], ("meter", "result"))
+    yield from family("cache_evictions_total", "counter", "Result cache LRU evictions.",
+                      per_meter(cache, "evictions"), meter)
+    yield from family("cache_invalidations_total", "counter", "Full result cache invalidations.",
+                      per_meter(cache, "invalidations"), meter)
+    yield from family("cache_entries", "gauge", "Entries in the result cache.", per_meter(cache, "size"), meter)
+
+    tier = ("meter", "tier")
+    columns = [("aggregate_last_run_timestamp_seconds", "gauge", "End of the last aggregation run per tier.", 1),
+               ("aggregate_duration_seconds", "gauge", "Duration of the last aggregation run per tier.", 2),
+               ("aggregate_rows", "gauge", "Rows written by the last aggregation run per tier.", 3),
+               ("aggregate_deleted_rows", "gauge", "Source rows deleted by the last aggregation run per tier.", 4),
+               ("aggregate_lock_seconds", "gauge", "Time the last aggregation run held the write lock per tier.", 5),
+               ("aggregate_lock_max_seconds", "gauge", "Longest single write lock of the last run per tier.", 6)]
+    for name, kind, help, col in columns:
+        samples = [((i, r[0]), r[col].timestamp() if col == 1 else r[col])
+                   for i, rows in aggregation.items() for r in rows if r[col] is not None]
+        yield from family(name, kind, help, samples, tier)
+
+
+def render(*extra):
+    """Alle Metriken dieses Moduls plus `extra` (Iterables von Zeilen) als Text."""
+    lines = []
+    for metric in (REQUESTS, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_SQL_SECONDS, SQL_SECONDS, SLOW_QUERIES):
+        lines += metric.lines()
+    for part in extra:
+        lines += part
+    return "\n".join(lines) + "\n"
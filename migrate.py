@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Migration ins kompakte Speicher-Layout (DB_SCHEMA=compact)
+
+Kopiert eine bestehende Datenbank im Text-Layout tabellenweise in eine
+neue Datei mit Epoch-Sekunden-Schlüsseln und Dezi-Watt-Werten (schema.py).
+Die Quelle wird nur gelesen, die App kann währenddessen weiterlaufen:
+
+    python migrate.py                      # DB_PATH -> <DB_PATH>.compact.db
+    python migrate.py --dst /data/energy-compact.db
+
+Gearbeitet wird in Zeitfenstern (--chunk-days) mit je einer kurzen
+Transaktion. Ein erneuter Aufruf setzt pro Tabelle beim letzten kopierten
+Zeitstempel fort und holt inzwischen hinzugekommene Zeilen nach. Zum
+Umstellen: App stoppen, Script ein letztes Mal laufen lassen, dann
+DB_SCHEMA=compact und DB_PATH auf die neue Datei setzen.
+
+Das kompakte Layout hält je Sekunde nur einen Rohwert. Liegen in der
+Quelle mehrere Werte in derselben Sekunde (Zähler schneller als 1 Hz),
+bricht das Script ab, bevor es etwas schreibt; mit --collapse wird
+trotzdem migriert und je Sekunde der letzte Wert behalten.
+"""
+import argparse
+import os
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from schema import build, layout
+from storage import DB_PATH, reader_engine, writer_engine
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+TABLES = ("measurement", "measurement_minute", "measurement_hour", "measurement_day", "energy_daily",
+          "baseload_daily")
+
+
+def copy_table(src, dst, name, source, target, chunk):
+    """Kopiert `name` ab dem letzten Zeitstempel im Ziel; gibt die Zeilenzahl zurück."""
+    s, d = source.tables[name], target.tables[name]
+    cols = [c.name for c in d.columns]
+    insert = d.insert().prefix_with("OR REPLACE")
+    with dst.connect() as conn:
+        lo = conn.execute(select(func.max(d.c.timestamp))).scalar()
+    with src.connect() as conn:
+        # Tabellen neuerer Versionen fehlen in älteren Quellen
+        if not conn.dialect.has_table(conn, name):
+            return 0
+        first, last = conn.execute(select(func.min(s.c.timestamp), func.max(s.c.timestamp))).one()
+    if first is None:
+        return 0
+    # Die Quelle hat Mikrosekunden, das Ziel volle Sekunden: ab Sekundenbeginn erneut kopieren
+    lo = first if lo is None else lo
+    copied = 0
+    while lo <= last:
+        hi = lo + chunk
+        with src.connect() as conn:
+            rows = conn.execute(select(*[s.c[c] for c in cols])
+                                .where(s.c.timestamp >= lo, s.c.timestamp < hi)
+                                .order_by(s.c.timestamp)).mappings().all()
+        if rows:
+            with dst.begin() as conn:
+                conn.execute(insert, [dict(r) for r in rows])
+        copied += len(rows)
+        lo = hi
+    return copied
+
+
+def collapsed_rows(src, dst, target):
+    """Rohwerte ab dem Fortsetzungspunkt, die im Ziel wegfallen (weitere Werte derselben Sekunde)."""
+    with dst.connect() as conn:
+        lo = conn.execute(select(func.max(target.tables["measurement"].c.timestamp))).scalar()
+    with src.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT COUNT(*) - COUNT(DISTINCT substr(timestamp, 1, 19)) FROM measurement WHERE timestamp >= ?",
+            (lo.strftime(TS_FORMAT) if lo else "",)).scalar()
+
+
+def copy_state(src, dst, source, target):
+    s, d = source.tables["aggregate_state"], target.tables["aggregate_state"]
+    with src.connect() as conn:
+        rows = conn.execute(select(s)).mappings().all()
+    if rows:
+        with dst.begin() as conn:
+            conn.execute(d.insert().prefix_with("OR REPLACE"), [dict(r) for r in rows])
+    return len(rows)
+
+
+def migrate(src_path, dst_path, chunk, collapse=False):
+    src = reader_engine(src_path)
+    with src.connect() as conn:
+        found = layout(conn.connection.cursor())
+    if found != "text":
+        raise SystemExit(f"{src_path}: expected a database in the text layout, found {found or 'no tables'}")
+
+    source, target = build(False), build(True)
+    dst = writer_engine(dst_path)
+    target.create_all(dst)
+
+    collapsed = collapsed_rows(src, dst, target)
+    if collapsed and not collapse:
+        raise SystemExit(f"{src_path}: {collapsed} raw readings share a second with another reading and would be "
+                         f"lost in the compact layout (one reading per second). Keep the text layout for meters "
+                         f"faster than 1 Hz, or pass --collapse to keep the last reading of each second")
+
+    t0 = time.monotonic()
+    counts = {name: copy_table(src, dst, name, source, target, chunk) for name in TABLES}
+    counts["measurement"] -= collapsed
+    counts["measurement (collapsed, same second)"] = collapsed
+    counts["aggregate_state"] = copy_state(src, dst, source, target)
+    with dst.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.exec_driver_sql("PRAGMA optimize")
+    src.dispose()
+    dst.dispose()
+    return counts, time.monotonic() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Energy Pi: Migration ins kompakte Layout")
+    parser.add_argument("--src", default=DB_PATH, help="Quell-DB im Text-Layout (Standard: DB_PATH)")
+    parser.add_argument("--dst", help="Ziel-DB (Standard: <src>.compact.db)")
+    parser.add_argument("--chunk-days", type=float, default=7, help="Zeitfenster pro Transaktion in Tagen")
+    parser.add_argument("--collapse", action="store_true",
+                        help="mehrere Rohwerte je Sekunde zulassen, nur der letzte bleibt erhalten")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.src):
+        print(f"DB not found: {args.src}")
+        return
+    dst_path = args.dst or os.path.splitext(args.src)[0] + ".compact.db"
+    counts, secs = migrate(args.src, dst_path, timedelta(days=args.chunk_days), args.collapse)
+
+    print(f"Migration {args.src} -> {dst_path} ({secs:.1f} s):")
+    for name, rows in counts.items():
+        print(f"  {name}: {rows} rows")
+    src_size, dst_size = os.path.getsize(args.src), os.path.getsize(dst_path)
+    print(f"  Size: {src_size / 1e6:.1f} MB -> {dst_size / 1e6:.1f} MB ({dst_size / src_size:.0%})")
+    print("Run again to copy newer rows. To switch: stop the app, run once more, "
+          f"then set DB_SCHEMA=compact and DB_PATH={dst_path}")
+
+
+if __name__ == "__main__":
+    main()
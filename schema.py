@@ -0,0 +1,166 @@
+"""
+Tabellen-Definitionen für Smart Energy Pi
+
+Zwei Speicher-Layouts mit denselben Tabellen- und Spaltennamen:
+
+text     (Standard) SQLAlchemy-DateTime als ISO-Text, Float-Leistung,
+         Surrogat-`id` plus Index auf timestamp
+compact  (DB_SCHEMA=compact) Epoch-Sekunden (lokale Zeit, naiv) als
+         INTEGER PRIMARY KEY in WITHOUT-ROWID-Tabellen, Leistung als
+         INTEGER in Dezi-Watt
+
+Die Typen rechnen beim Lesen und Schreiben über SQLAlchemy transparent um.
+Für Text-SQL liefern die Hilfsfunktionen unten die passenden Fragmente
+(Bucket-Bildung per Ganzzahl-Division statt strftime im kompakten Layout).
+Bestehende Datenbanken werden mit migrate.py konvertiert.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, Table, Text
+from sqlalchemy.types import TypeDecorator
+import calendar, os
+
+import storage  # noqa: F401  (lädt .env)
+
+COMPACT = os.getenv("DB_SCHEMA", "text").lower() == "compact"
+
+_EPOCH0 = datetime(1970, 1, 1)
+
+
+def to_epoch(dt):
+    """Lokale Zeit als Epoch-Sekunden (naiv, ohne Zeitzonen-Umrechnung)."""
+    return calendar.timegm(dt.timetuple())
+
+
+def from_epoch(sec):
+    return _EPOCH0 + timedelta(seconds=int(sec))
+
+
+class EpochSeconds(TypeDecorator):
+    """datetime <-> INTEGER Epoch-Sekunden (Mikrosekunden entfallen)."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_epoch(value)
+
+
+class DeciWatt(TypeDecorator):
+    """Watt (float) <-> INTEGER in 0,1 W."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(round(value * 10))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / 10
+
+
+def build(compact):
+    """MetaData mit allen Tabellen im gewünschten Layout."""
+    md = MetaData()
+    watt = DeciWatt if compact else Float
+    opts = {"sqlite_with_rowid": False} if compact else {}
+
+    def key(**kw):
+        if compact:
+            return [Column("timestamp", EpochSeconds, primary_key=True, autoincrement=False)]
+        return [Column("id", Integer, primary_key=True), Column("timestamp", DateTime, index=True, **kw)]
+
+    Table("measurement", md, *key(default=datetime.now),
+          Column("power_watt", watt), Column("total_kwh", Float), **opts)
+    Table("measurement_minute", md, *key(unique=True),
+          Column("power_avg", watt), Column("power_max", watt), Column("power_min", watt),
+          Column("total_kwh", Float), **opts)
+    for name in ("measurement_hour", "measurement_day"):
+        Table(name, md, *key(unique=True),
+              Column("power_avg", watt), Column("power_max", watt), Column("power_min", watt),
+              Column("kwh_used", Float), **opts)
+    Table("energy_daily", md, *key(unique=True),
+          Column("kwh_used", Float), Column("power_avg", watt), Column("power_min", watt),
+          Column("power_max", watt), Column("baseload_watt", watt), Column("samples", Integer), **opts)
+    Table("baseload_daily", md, *key(unique=True),
+          Column("min_watt", watt), Column("percentile_watt", watt), Column("samples", Integer), **opts)
+    Table("aggregate_state", md, Column("tier", Text, primary_key=True),
+          Column("watermark", EpochSeconds if compact else DateTime), Column("updated_at", DateTime))
+    # letzter Lauf von aggregate.py je Tier, für /metrics der App
+    Table("aggregate_runs", md, Column("tier", Text, primary_key=True), Column("finished_at", DateTime),
+          Column("seconds", Float), Column("rows", Integer), Column("deleted", Integer),
+          Column("lock_seconds", Float), Column("lock_max_seconds", Float))
+    return md
+
+
+metadata = build(COMPACT)
+measurement = metadata.tables["measurement"]
+measurement_minute = metadata.tables["measurement_minute"]
+measurement_hour = metadata.tables["measurement_hour"]
+measurement_day = metadata.tables["measurement_day"]
+energy_daily = metadata.tables["energy_daily"]
+baseload_daily = metadata.tables["baseload_daily"]
+aggregate_runs = metadata.tables["aggregate_runs"]
+
+# Spalte, über die first/last-Zeilen eindeutig adressiert werden
+KEY = "timestamp" if COMPACT else "id"
+
+_PREFIX = {60: 16, 3600: 13, 86400: 10}
+_FLOOR = {60: "%Y-%m-%d %H:%M:00.000000", 3600: "%Y-%m-%d %H:00:00.000000", 86400: "%Y-%m-%d 00:00:00.000000"}
+
+
+def epoch(expr):
+    """SQL: Zeitstempel-Ausdruck als Epoch-Sekunden."""
+    return expr if COMPACT else f"CAST(strftime('%s', {expr}) AS INTEGER)"
+
+
+def bucket(col, seconds):
+    """SQL: Gruppierungs-Schlüssel für Minuten-, Stunden- oder Tages-Buckets."""
+    return f"{col} / {seconds}" if COMPACT else f"substr({col}, 1, {_PREFIX[seconds]})"
+
+
+def bucket_key(dt, seconds):
+    """Python-Gegenstück zu bucket() für einen Zeitpunkt."""
+    if COMPACT:
+        return to_epoch(dt) // seconds
+    return dt.strftime(_FLOOR[seconds])[:_PREFIX[seconds]]
+
+
+def floor(col, seconds, shift=0):
+    """SQL: Bucket-Anfang im Speicherformat, mit `shift` um so viele Buckets verschoben."""
+    if COMPACT:
+        return f"({col} / {seconds} {'+-'[shift < 0]} {abs(shift)}) * {seconds}" if shift else f"{col} / {seconds} * {seconds}"
+    modifier = f", '{shift * seconds:+d} seconds'" if shift else ""
+    return f"strftime('{_FLOOR[seconds]}', {col}{modifier})"
+
+
+def hour_of_day(col):
+    return f"{col} % 86400 / 3600" if COMPACT else f"CAST(strftime('%H', {col}) AS INTEGER)"
+
+
+def watt(expr):
+    """SQL: gespeicherte Leistung als Watt."""
+    return f"({expr}) / 10.0" if COMPACT else expr
+
+
+def watt_avg(col):
+    """SQL: Mittelwert einer Leistungsspalte im Speicherformat."""
+    return f"CAST(ROUND(AVG({col})) AS INTEGER)" if COMPACT else f"AVG({col})"
+
+
+def layout(cur):
+    """Layout einer bestehenden DB ('text', 'compact') oder None für eine leere DB."""
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(measurement)").fetchall()]
+    if not cols:
+        return None
+    return "text" if "id" in cols else "compact"
+
+
+def check_layout(cur):
+    """Bricht ab, wenn die DB nicht zu DB_SCHEMA passt."""
+    found, expected = layout(cur), "compact" if COMPACT else "text"
+    if found and found != expected:
+        raise RuntimeError(f"Database uses the {found} layout but DB_SCHEMA={expected}; "
+                           f"convert it with `python migrate.py` or adjust DB_SCHEMA")
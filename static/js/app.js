@@ -2,9 +2,19 @@ let currentPeriod = 'today';
 let gauge = null;
 let chart = null;
 let gaugeConfig = { max: 7000, green: 300, yellow: 1000, orange: 2500 };
-let chartMeta = { type: 'bar', avgKwh: 0, isWeekend: [], barUnit: 'kwh', tooltips: [] };
+let chartMeta = { type: 'bar', avgKwh: 0, isWeekend: [], barUnit: 'kwh', tooltips: [], costs: [] };
 let priceKwh = 0.226;
+// Tagesverlauf als reduzierte Linie statt Stundenbalken (Umschalter am Chart, im Browser gemerkt)
+let lineView = localStorage.getItem('lineView') === '1';
+let stream = null;
 let T = {};
+// Zähler aus der Seiten-URL (/?meter=<id>), wird an alle API-Aufrufe gehängt
+const meterId = new URLSearchParams(location.search).get('meter');
+
+function api(url) {
+    if (!meterId) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'meter=' + encodeURIComponent(meterId);
+}
 
 function fmt_num(num, decimals = 2) {
     const locale = T.number_locale || 'en-US';
@@ -31,7 +41,8 @@ function getBarColors(data) {
     });
 }
 async function loadI18n() {
-    const r = await fetch('/api/i18n');
+    // versionierte URL: der Browser behält die Texte bis zum nächsten Neustart der App
+    const r = await fetch(api('/api/i18n?v=' + document.body.dataset.i18n));
     T = await r.json();
     document.title = T.title || 'Energy Monitor';
     document.getElementById('meterLabel').textContent = T.meter_reading;
@@ -46,10 +57,9 @@ async function loadI18n() {
     dowEl.innerHTML = T.calendar.weekdays_label.map(d => `<div class="cal-dow">${d}</div>`).join('');
 }
 
-async function initGauge() {
+async function initGauge(range) {
     try {
-        const r = await fetch('/api/gauge-range');
-        const d = await r.json();
+        const d = range || await (await fetch(api('/api/gauge-range'))).json();
         gaugeConfig = { max: d.gauge_max, green: d.zone_green, yellow: d.zone_yellow, orange: d.zone_orange };
     } catch (e) {}
 
@@ -101,10 +111,13 @@ const floatingTooltip = {
         const label = chartMeta.tooltips.length ? chartMeta.tooltips[nearest] : chart.data.labels[nearest];
         const pt = meta.data[nearest];
         const chartArea = chart.chartArea;
+        const barCost = chartMeta.costs[nearest];
         if (chartMeta.barUnit === 'watt') {
-            tt.innerHTML = `<strong>${label}</strong><br>${T.chart?.avg || 'Avg'} ${Math.round(val)} W`;
+            const costInfo = barCost !== undefined ? ` · ${fmt_num(barCost, 2)} ${T.currency || '€'}` : '';
+            const avg = chartMeta.type === 'line' ? '' : `${T.chart?.avg || 'Avg'} `;
+            tt.innerHTML = `<strong>${label}</strong><br>${avg}${Math.round(val)} W${costInfo}`;
         } else {
-            const cost = (val * priceKwh).toFixed(2);
+            const cost = (barCost !== undefined ? barCost : val * priceKwh).toFixed(2);
             const we = chartMeta.isWeekend[nearest] ? ' 🏠' : '';
             tt.innerHTML = `<strong>${label}${we}</strong><br>${fmt_num(val, 2)} kWh · ${fmt_num(parseFloat(cost))} ${T.currency || '€'}`;
         }
@@ -160,7 +173,34 @@ const avgLinePlugin = {
     }
 };
 
-function initChart() {
+// `points` für die Linie des Tagesverlaufs: etwa ein Punkt je 3 Pixel, auf 50 gerundet
+// (wenige Cache-Schlüssel); leer, solange die Stundenbalken gewählt sind
+function historyPoints() {
+    if (!lineView) return '';
+    const width = document.getElementById('history').clientWidth || 900;
+    return `points=${Math.max(50, Math.round(width / 150) * 50)}`;
+}
+
+function withPoints(url) {
+    const p = historyPoints();
+    return p ? url + (url.includes('?') ? '&' : '?') + p : url;
+}
+
+function toggleLineView() {
+    lineView = !lineView;
+    localStorage.setItem('lineView', lineView ? '1' : '0');
+    updateChart();
+    // die Linie kommt per Push nur an Clients, die sie beim Verbinden gewählt haben
+    if (stream) { stream.close(); initStream(); }
+}
+
+function renderLineToggle() {
+    const btn = document.getElementById('lineToggle');
+    btn.textContent = lineView ? (T.chart?.bars || 'Hours') : (T.chart?.line || 'Curve');
+    btn.classList.toggle('visible', chartMeta.barUnit === 'watt');
+}
+
+function initChart(type = 'bar') {
     const ctx = document.getElementById('history').getContext('2d');
     const isDesktop = window.innerWidth > 1000;
     const isMobile = window.innerWidth <= 500;
@@ -168,7 +208,7 @@ function initChart() {
     const titleFontSize = isDesktop ? 14 : 11;
     const maxTicks = isMobile ? 8 : isDesktop ? 15 : 10;
     chart = new Chart(ctx, {
-        type: 'bar',
+        type,
         data: { labels: [], datasets: [{ label: T.chart?.consumption || 'Consumption', data: [], borderRadius: 4, borderSkipped: 'bottom' }] },
         options: {
             responsive: true, maintainAspectRatio: false, animation: { duration: 400 },
@@ -185,32 +225,63 @@ function initChart() {
     });
 }
 
+// Alle Panels in einem Request (Seitenaufbau, Reconnect); null, solange der Zeitraum unvollständig ist
+async function fetchDashboard() {
+    let url = `/api/dashboard?period=${currentPeriod}`;
+    if (currentPeriod === 'custom') {
+        if (!calState.start || !calState.end) return null;
+        url += `&start=${fmt(calState.start)}&end=${fmt(calState.end)}`;
+    }
+    const r = await fetch(api(withPoints(url)));
+    return r.ok ? r.json() : null;
+}
+
+function renderDashboard(d) {
+    renderLive(d.latest);
+    renderStats(d.stats);
+    renderChart(d.history);
+    renderRangeStats(d.range);
+}
+
+async function updateDashboard() {
+    try {
+        const d = await fetchDashboard();
+        if (d) renderDashboard(d);
+    } catch (e) {}
+}
+
 async function updateLive() {
     try {
-        const r = await fetch('/api/latest');
-        const d = await r.json();
-        if (gauge) gauge.value = d.power_watt;
-        document.getElementById('totalKwh').textContent = fmt_num(d.total_kwh, 3);
-        document.getElementById('lastUpdate').textContent = (d.last_seen || '--:--:--') + (T.time_suffix || '');
-        const dot = document.getElementById('onlineDot');
-        const statusText = document.getElementById('statusText');
-        dot.classList.toggle('online', d.online);
-        statusText.textContent = d.online ? 'Online' : 'Offline';
+        const r = await fetch(api('/api/latest'));
+        renderLive(await r.json());
     } catch (e) {}
 }
 
+function renderLive(d) {
+    if (gauge) gauge.value = d.power_watt;
+    document.getElementById('totalKwh').textContent = fmt_num(d.total_kwh, 3);
+    document.getElementById('lastUpdate').textContent = (d.last_seen || '--:--:--') + (T.time_suffix || '');
+    const dot = document.getElementById('onlineDot');
+    const statusText = document.getElementById('statusText');
+    dot.classList.toggle('online', d.online);
+    statusText.textContent = d.online ? 'Online' : 'Offline';
+}
+
 async function updateStats() {
     try {
-        const r = await fetch('/api/stats');
-        const d = await r.json();
-        priceKwh = d.price_kwh || priceKwh;
-        document.getElementById('priceInfo').textContent = `@ ${fmt_num(d.price_kwh * 100, 1)} ${T.cent_unit || 'ct/kWh'}`;
-        const progBar = document.getElementById('prognoseBar');
-        progBar.innerHTML = `${T.prognosis_prefix} <strong>${fmt_num(d.prognosis_month, 0)} kWh</strong> = <strong>${fmt_num(d.prognosis_cost, 2)} ${T.currency || '€'}</strong>`;
-        document.getElementById('baseload').textContent = d.baseload_watt;
+        const r = await fetch(api('/api/stats'));
+        renderStats(await r.json());
     } catch (e) {}
 }
 
+function renderStats(d) {
+    priceKwh = d.price_kwh || priceKwh;
+    document.getElementById('priceInfo').textContent = `@ ${fmt_num(d.price_kwh * 100, 1)} ${T.cent_unit || 'ct/kWh'}`;
+    const progBar = document.getElementById('prognoseBar');
+    progBar.innerHTML = `${T.prognosis_prefix} <strong>${fmt_num(d.prognosis_month, 0)} kWh</strong> = <strong>${fmt_num(d.prognosis_cost, 2)} ${T.currency || '€'}</strong>`;
+    document.getElementById('baseload').textContent = d.baseload_watt;
+}
+
 async function updateChart() {
     let url = `/api/history?period=${currentPeriod}`;
     if (currentPeriod === 'custom') {
@@ -218,31 +289,49 @@ async function updateChart() {
         url += `&start=${fmt(calState.start)}&end=${fmt(calState.end)}`;
     }
     try {
-        const r = await fetch(url);
-        const d = await r.json();
-        chartMeta.type = 'bar';
-        chartMeta.avgKwh = d.avg_kwh || 0;
-        chartMeta.isWeekend = d.is_weekend || [];
-        chartMeta.barUnit = d.bar_unit || 'kwh';
-        chartMeta.tooltips = d.tooltips || [];
-        chart.config.type = 'bar';
-        chart.data.labels = d.labels;
-        chart.data.datasets[0].data = d.data;
-        const colors = getBarColors(d.data);
-        const borders = (d.is_weekend || []).map(we => we ? 'rgba(160,120,255,0.6)' : 'transparent');
-        const bw = (d.is_weekend || []).map(we => we ? 2 : 0);
-        Object.assign(chart.data.datasets[0], {
-            label: chartMeta.barUnit === 'watt' ? `${T.chart?.avg || 'Avg'} Watt` : 'kWh',
-            backgroundColor: colors, borderColor: borders, borderWidth: bw,
-            borderRadius: 4, borderSkipped: 'bottom',
-            hoverBackgroundColor: colors.map(c => c.replace(')', ',0.8)').replace('rgb', 'rgba'))
-        });
-        chart.options.scales.y.title.text = chartMeta.barUnit === 'watt' ? 'Watt' : 'kWh';
-        chart.update();
-        document.getElementById('chartTooltip').style.opacity = '0';
+        const r = await fetch(api(withPoints(url)));
+        renderChart(await r.json());
     } catch (e) {}
 }
 
+function renderChart(d) {
+    const type = d.chart_type || 'bar';
+    // Chart.js wechselt den Typ nicht im laufenden Chart
+    if (chart.config.type !== type) { chart.destroy(); initChart(type); }
+    chartMeta.type = type;
+    chartMeta.avgKwh = d.avg_kwh || 0;
+    chartMeta.isWeekend = d.is_weekend || [];
+    chartMeta.barUnit = d.bar_unit || 'kwh';
+    chartMeta.tooltips = d.tooltips || [];
+    chartMeta.costs = d.costs || [];
+    chart.data.labels = d.labels;
+    chart.data.datasets[0].data = d.data;
+    if (type === 'line') renderLine(); else renderBars(d);
+    chart.options.scales.y.title.text = chartMeta.barUnit === 'watt' ? 'Watt' : 'kWh';
+    chart.update();
+    renderLineToggle();
+    document.getElementById('chartTooltip').style.opacity = '0';
+}
+
+function renderLine() {
+    Object.assign(chart.data.datasets[0], {
+        label: 'Watt', borderColor: 'rgb(0,200,80)', backgroundColor: 'rgba(0,200,80,0.15)',
+        borderWidth: 1.5, fill: true, pointRadius: 0, pointHoverRadius: 3, tension: 0
+    });
+}
+
+function renderBars(d) {
+    const colors = getBarColors(d.data);
+    const borders = (d.is_weekend || []).map(we => we ? 'rgba(160,120,255,0.6)' : 'transparent');
+    const bw = (d.is_weekend || []).map(we => we ? 2 : 0);
+    Object.assign(chart.data.datasets[0], {
+        label: chartMeta.barUnit === 'watt' ? `${T.chart?.avg || 'Avg'} Watt` : 'kWh',
+        backgroundColor: colors, borderColor: borders, borderWidth: bw,
+        borderRadius: 4, borderSkipped: 'bottom',
+        hoverBackgroundColor: colors.map(c => c.replace(')', ',0.8)').replace('rgb', 'rgba'))
+    });
+}
+
 async function updateRangeStats() {
     let url = `/api/stats-range?period=${currentPeriod}`;
     if (currentPeriod === 'custom') {
@@ -250,21 +339,24 @@ async function updateRangeStats() {
         url += `&start=${fmt(calState.start)}&end=${fmt(calState.end)}`;
     }
     try {
-        const r = await fetch(url);
-        const d = await r.json();
-        document.getElementById('rangeKwh').textContent = fmt_num(d.kwh, 1);
-        document.getElementById('rangeCost').textContent = fmt_num(d.cost, 2);
-        const changeEl = document.getElementById('rangeChange');
-        if (d.change_pct !== null && d.change_pct !== undefined) {
-            const pct = d.change_pct;
-            const sign = pct > 0 ? '+' : '';
-            changeEl.textContent = `${sign}${pct.toFixed(0)}% vs. ${d.prev_label}`;
-            changeEl.className = 'change ' + (pct > 0 ? 'positive' : pct < 0 ? 'negative' : '');
-        } else {
-            changeEl.textContent = '';
-        }
+        const r = await fetch(api(url));
+        renderRangeStats(await r.json());
     } catch (e) {}
 }
+
+function renderRangeStats(d) {
+    document.getElementById('rangeKwh').textContent = fmt_num(d.kwh, 1);
+    document.getElementById('rangeCost').textContent = fmt_num(d.cost, 2);
+    const changeEl = document.getElementById('rangeChange');
+    if (d.change_pct !== null && d.change_pct !== undefined) {
+        const pct = d.change_pct;
+        const sign = pct > 0 ? '+' : '';
+        changeEl.textContent = `${sign}${pct.toFixed(0)}% vs. ${d.prev_label}`;
+        changeEl.className = 'change ' + (pct > 0 ? 'positive' : pct < 0 ? 'negative' : '');
+    } else {
+        changeEl.textContent = '';
+    }
+}
 let calState = { month: null, year: null, start: null, end: null };
 
 function renderCal() {
@@ -369,26 +461,63 @@ function initEventListeners() {
     initCal();
     const infoIcon = document.getElementById('baseloadInfo');
     const tooltip = document.getElementById('baseloadTooltip');
+    document.getElementById('lineToggle').addEventListener('click', toggleLineView);
     infoIcon.addEventListener('click', e => { e.stopPropagation(); tooltip.classList.toggle('visible'); });
     document.addEventListener('click', () => tooltip.classList.remove('visible'));
 }
 
+let pollTimers = [];
+
+function checkGauge(d) {
+    if (d.gauge_max !== gaugeConfig.max) location.reload();
+}
+
+function startPolling() {
+    if (pollTimers.length) return;
+    pollTimers = [
+        setInterval(updateLive, 5000),
+        setInterval(() => { if (currentPeriod === 'today') updateChart(); }, 30000),
+        setInterval(updateStats, 60000),
+        setInterval(async () => {
+            try {
+                const r = await fetch(api('/api/gauge-range'));
+                checkGauge(await r.json());
+            } catch (e) {}
+        }, 300000)
+    ];
+}
+
+function stopPolling() {
+    pollTimers.forEach(clearInterval);
+    pollTimers = [];
+}
+
+// Push-Updates per Server-Sent Events; bei Verbindungsabbruch wird bis zum
+// automatischen Reconnect wieder gepollt.
+function initStream() {
+    const es = stream = new EventSource(api(withPoints('/api/stream')));
+    const on = (event, fn) => es.addEventListener(event, e => fn(JSON.parse(e.data)));
+    on('reading', renderLive);
+    on('stats', renderStats);
+    on('gauge', checkGauge);
+    on('history', d => { if (currentPeriod === 'today') renderChart(d); });
+    on('range', d => { if (currentPeriod === 'today') renderRangeStats(d); });
+    es.onopen = () => {
+        if (pollTimers.length) { stopPolling(); updateDashboard(); }
+    };
+    es.onerror = startPolling;
+}
+
 async function init() {
-    await loadI18n();
-    await initGauge();
+    const [, dashboard] = await Promise.all([loadI18n(), fetchDashboard().catch(() => null)]);
+    await initGauge(dashboard && dashboard.gauge);
     initChart();
     initEventListeners();
     document.querySelector(`[data-period="${currentPeriod}"]`).classList.add('active');
     document.getElementById('rangeLabel').textContent = T.period?.[currentPeriod] || currentPeriod;
-    await Promise.all([updateLive(), updateStats(), updateChart(), updateRangeStats()]);
-    setInterval(updateLive, 5000);
-    setInterval(() => { if (currentPeriod === 'today') updateChart(); }, 30000);
-    setInterval(updateStats, 60000);
-    setInterval(async () => {
-        const r = await fetch('/api/gauge-range');
-        const d = await r.json();
-        if (d.gauge_max !== gaugeConfig.max) location.reload();
-    }, 300000);
+    if (dashboard) renderDashboard(dashboard);
+    else await Promise.all([updateLive(), updateStats(), updateChart(), updateRangeStats()]);
+    if (window.EventSource) initStream(); else startPolling();
     let resizeTimeout;
     window.addEventListener('resize', () => { clearTimeout(resizeTimeout); resizeTimeout = setTimeout(() => location.reload(), 300); });
 }
@@ -0,0 +1,146 @@
+"""
+Speicher-Schicht für Smart Energy Pi
+
+Gemeinsame SQLite-Konfiguration für App, Ingest und Aggregation:
+- WAL-Modus, damit Leser nie auf den Schreiber warten (und umgekehrt)
+- Pragmas (synchronous, cache_size, mmap_size, temp_store) und Busy-Timeout
+  für jede Verbindung
+- genau eine schreibende Verbindung pro Prozess, dazu ein Pool lesender
+  Verbindungen (mode=ro, query_only) für Requests
+- Wartungs-Thread für wal_checkpoint und PRAGMA optimize
+"""
+from urllib.parse import quote
+import logging, os, sqlite3, threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, ".env"))
+except ImportError:
+    pass
+
+log = logging.getLogger(__name__)
+
+_db_env = os.getenv("DB_PATH", "instance/energy.db")
+DB_PATH = _db_env if os.path.isabs(_db_env) else os.path.join(ROOT, _db_env)
+# Frühere Versionen der App legten relative Pfade unter Flasks instance-Ordner ab
+_LEGACY_PATH = os.path.join(ROOT, "instance", _db_env)
+if not os.path.isabs(_db_env) and not os.path.exists(DB_PATH) and os.path.exists(_LEGACY_PATH):
+    log.warning(f"Using legacy database location {_LEGACY_PATH}, consider moving it to {DB_PATH}")
+    DB_PATH = _LEGACY_PATH
+
+BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 30))
+CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", 16384))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL", 4))
+CHECKPOINT_SECONDS = float(os.getenv("SQLITE_CHECKPOINT_SECONDS", 300))
+OPTIMIZE_SECONDS = 6 * 3600
+
+
+def apply_pragmas(conn, readonly=False):
+    """Setzt die Pragmas auf einer DB-API-Verbindung (sqlite3)."""
+    cur = conn.cursor()
+    if readonly:
+        cur.execute("PRAGMA query_only = 1")
+    else:
+        cur.execute("PRAGMA journal_mode = WAL")
+        cur.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    cur.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+    cur.execute(f"PRAGMA cache_size = -{CACHE_KB}")
+    cur.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    cur.execute("PRAGMA temp_store = MEMORY")
+    cur.close()
+
+
+def connect(path=None, readonly=False):
+    """sqlite3-Verbindung mit Pragmas (für aggregate.py), schreibend oder mit mode=ro."""
+    if readonly:
+        conn = sqlite3.connect(f"file:{quote(path or DB_PATH)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    else:
+        conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT)
+    apply_pragmas(conn, readonly)
+    return conn
+
+
+def writer_engine(path=None):
+    """Engine mit genau einer Verbindung: alle Schreibzugriffe des Prozesses laufen nacheinander."""
+    engine = create_engine(f"sqlite:///{path or DB_PATH}", poolclass=QueuePool, pool_size=1, max_overflow=0,
+                           connect_args={"timeout": BUSY_TIMEOUT, "check_same_thread": False})
+    event.listen(engine, "connect", lambda dbapi_conn, _: apply_pragmas(dbapi_conn))
+    return engine
+
+
+def reader_url(path=None):
+    return f"sqlite:///file:{quote(path or DB_PATH)}?mode=ro&uri=true"
+
+
+def reader_options():
+    """Engine-Optionen für den Lese-Pool (auch als SQLALCHEMY_ENGINE_OPTIONS)."""
+    return {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE,
+            "connect_args": {"timeout": BUSY_TIMEOUT, "check_same_thread": False}}
+
+
+def tune_reader(engine):
+    """Pragmas für jede neue Verbindung einer lesenden Engine."""
+    event.listen(engine, "connect", lambda dbapi_conn, _: apply_pragmas(dbapi_conn, readonly=True))
+    return engine
+
+
+def db_file(engine):
+    """Dateipfad der Datenbank einer Engine (auch bei reader_url mit `file:`)."""
+    path = engine.url.database
+    return path[5:] if path.startswith("file:") else path
+
+
+def reader_engine(path=None):
+    return tune_reader(create_engine(reader_url(path), **reader_options()))
+
+
+def checkpoint(conn, optimize=False):
+    """PASSIVE-Checkpoint (blockiert weder Leser noch Schreiber); gibt (busy, wal, kopiert) zurück."""
+    result = tuple(conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+    if optimize:
+        conn.exec_driver_sql("PRAGMA optimize")
+    return result
+
+
+class Maintenance:
+    """Hintergrund-Thread: Checkpoint alle `interval` Sekunden, PRAGMA optimize alle 6 Stunden.
+
+    `engine` ist eine Engine oder eine Funktion, die die aktuellen Engines
+    liefert (ein Thread für alle Zähler-Datenbanken).
+    """
+
+    def __init__(self, engine, interval=CHECKPOINT_SECONDS, optimize_every=OPTIMIZE_SECONDS):
+        self.engines = engine if callable(engine) else lambda: [engine]
+        self.interval = interval
+        self.optimize_every = optimize_every
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sqlite-maintenance", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        since_optimize = 0.0
+        while not self._stop.wait(self.interval):
+            since_optimize += self.interval
+            optimize = since_optimize >= self.optimize_every
+            for engine in self.engines():
+                try:
+                    with engine.connect() as conn:
+                        busy, wal, copied = checkpoint(conn, optimize)
+                    log.debug(f"WAL checkpoint {engine.url.database}: {copied}/{wal} pages{' (busy)' if busy else ''}")
+                except Exception as e:
+                    log.error(f"SQLite maintenance failed for {engine.url.database}: {e}")
+            if optimize:
+                since_optimize = 0.0
@@ -0,0 +1,123 @@
+"""
+MQTT-Ingest für Smart Energy Pi
+
+Eigenständiger Ingest-Prozess für den Produktivbetrieb:
+
+    python subscriber.py [--metrics-port 9100]
+
+Abonniert MQTT_TOPIC, ordnet jede Nachricht ihrem Zähler zu (meters.py) und
+schreibt über dessen IngestWriter; Checkpoints macht der Wartungs-Thread.
+Genau ein solcher Prozess läuft neben den Web-Workern (wsgi.py), die selbst
+nie abonnieren: keine doppelten Messwerte, und Ingest und Requests teilen
+sich keinen GIL. Der Entwicklungsserver (python app.py) nutzt dieselben
+Funktionen in einem Thread.
+
+Mit --metrics-port liefert der Prozess Ingest-, SQL- und Aggregations-
+metriken unter /metrics (Format wie in der App, siehe metrics.py).
+"""
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse, atexit, logging, os, signal, sys, threading
+
+import metrics
+from ingest import decode_payload
+from meters import DEFAULT_METER, MeterRegistry, meter_from_topic
+
+log = logging.getLogger(__name__)
+
+MQTT_HOST = os.getenv("MQTT_HOST", "127.0.0.1")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "sensor")
+
+try:
+    import paho.mqtt.client as mqtt
+    MQTT_AVAILABLE = True
+except ImportError:
+    log.warning("paho-mqtt not installed, MQTT disabled")
+    MQTT_AVAILABLE = False
+
+
+def resolve(registry, msg):
+    """Zähler und Messwert einer Nachricht als (meter, watt, kwh); None, wenn sie verworfen wird."""
+    meter_id = meter_from_topic(MQTT_TOPIC, msg.topic)
+    if meter_id is None:
+        log.warning(f"MQTT message on {msg.topic} has no valid meter id, dropped")
+        return None
+    try:
+        watt, kwh = decode_payload(msg.payload)
+        meter = registry.get(meter_id, create=True)
+    except Exception as e:
+        log.error(f"MQTT message error ({msg.topic}): {e}")
+        return None
+    return meter, watt, kwh
+
+
+def submit(meter, now, watt, kwh):
+    if not meter.writer.submit(now, watt, kwh):
+        log.warning(f"Ingest queue full for meter {meter.id}, reading dropped")
+
+
+def run(on_message):
+    """Verbindet mit dem Broker und ruft `on_message(client, userdata, msg)` je Nachricht; blockiert."""
+    def on_connect(client, userdata, flags, rc, properties=None):
+        log.info(f"MQTT connected: {rc}")
+        client.subscribe(MQTT_TOPIC)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_HOST, MQTT_PORT, 60)
+    client.loop_forever()
+
+
+def serve_metrics(registry, port):
+    """/metrics des Ingest-Prozesses in einem Hintergrund-Thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render(metrics.meter_lines(list(registry.meters.values()))).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info(f"Metrics on :{port}/metrics")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT-Ingest ohne Webserver (neben wsgi.py)")
+    parser.add_argument("--metrics-port", type=int, help="Port für /metrics (ohne: keine Metriken per HTTP)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not MQTT_AVAILABLE:
+        sys.exit("paho-mqtt is required for the ingest process")
+
+    registry = MeterRegistry(on_open=lambda m: metrics.instrument(m.write_engine, m.id, "write"))
+    for meter_id in [DEFAULT_METER] + [m for m in registry.ids() if m != DEFAULT_METER]:
+        registry.get(meter_id, create=True)
+    registry.start()
+    atexit.register(registry.close)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if args.metrics_port:
+        serve_metrics(registry, args.metrics_port)
+
+    def on_message(client, userdata, msg):
+        reading = resolve(registry, msg)
+        if reading:
+            meter, watt, kwh = reading
+            submit(meter, datetime.now(), watt, kwh)
+
+    run(on_message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Tarife und Kosten für Smart Energy Pi
+
+Tarifkalender: je Stunde ein Preis und ein Band, zusammengesetzt aus
+
+- festen Zeitbändern (Time-of-Use) aus TARIFF_FILE, z.B.
+
+      {"bands": [{"name": "peak", "price": 0.31, "days": "mon-fri", "hours": "8-20"},
+                 {"name": "offpeak", "price": 0.18}]}
+
+  Das erste passende Band gilt; `days` und `hours` (Ende exklusiv, "22-6"
+  geht über Mitternacht) fehlen beim Auffang-Band. Für Preisänderungen eine
+  Liste `"tariffs": [{"from": "2025-01-01", "bands": [...]}, ...]`, jeder
+  Eintrag gilt ab `from` bis zum nächsten. Stunden ohne Band kosten PRICE_KWH.
+- stündlichen Spotpreisen aus SPOT_FILE (CSV oder JSON-Zeilen wie bei
+  backfill.py: Zeitstempel plus `price`, geteilt durch SPOT_PRICE_DIVISOR,
+  also 1000 für €/MWh, zuzüglich SPOT_MARKUP je kWh). Sie ersetzen die
+  Bänder in ihren Stunden (Band "spot").
+
+Ohne beide Dateien ist der Tarif flach (PRICE_KWH, Band "flat"). Der
+Kalender liegt je Jahr als fertiges Stunden-Array vor und wird neu gebaut,
+sobald sich eine der Dateien ändert.
+
+Kosten: kWh je Stunde mal Preis je Stunde, summiert je Balken und je Band.
+Die kWh je Tag kommen aus energy.py (dieselben Werte wie in der Anzeige),
+innerhalb des Tages werden sie nach der mittleren Leistung je Stunde
+verteilt (Minuten- und Stunden-Tier). Für Tage ohne Stundenwerte (älter als
+die 90 Tage des Stunden-Tiers) ist das nicht mehr möglich, dort wird
+gleichmäßig verteilt und die Menge als `kwh_estimated` ausgewiesen. Bei
+flachem Tarif spielt die Verteilung keine Rolle und entfällt.
+"""
+from datetime import datetime, timedelta
+import json, logging, os, threading, time
+
+from energy import bucket_means, hour_series, minute_series
+from schema import to_epoch
+from storage import ROOT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger(__name__)
+
+PRICE_KWH = float(os.getenv("PRICE_KWH", 0.226))
+SPOT_PRICE_DIVISOR = float(os.getenv("SPOT_PRICE_DIVISOR", 1))
+SPOT_MARKUP = float(os.getenv("SPOT_MARKUP", 0))
+HOUR = timedelta(hours=1)
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_BAND, FLAT_BAND, SPOT_BAND = "default", "flat", "spot"
+
+
+def _path(name):
+    value = os.getenv(name, "")
+    return value if not value or os.path.isabs(value) else os.path.join(ROOT, value)
+
+
+TARIFF_FILE = _path("TARIFF_FILE")
+SPOT_FILE = _path("SPOT_FILE")
+
+
+def _ranges(spec, names=None, size=24):
+    """'mon-fri,sun' bzw. '22-6,12-13' -> Menge der Indizes (Ende exklusiv bei Stunden, inklusiv bei Tagen)."""
+    if spec is None:
+        return set(range(size))
+    out = set()
+    for part in (spec if isinstance(spec, list) else str(spec).split(",")):
+        lo, _, hi = str(part).strip().lower().partition("-")
+        index = (lambda v: names.index(v)) if names else int
+        a = index(lo)
+        b = (index(hi) + (1 if names else 0)) if hi else a + 1
+        out.update(i % size for i in range(a, b if b > a else b + size))
+    return out
+
+
+def _hour_start(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_end(dt):
+    start = _hour_start(dt)
+    return start if start == dt else start + HOUR
+
+
+class Calendar:
+    """Preis und Band je Stunde; Stunden als Epoch-Stunden (lokale Zeit, naiv wie schema.to_epoch)."""
+
+    def __init__(self, tariffs=(), spot=None):
+        self.tariffs = []
+        names = []
+        for t in tariffs:
+            bands = []
+            for b in t.get("bands", []):
+                if b["name"] not in names:
+                    names.append(b["name"])
+                bands.append((names.index(b["name"]), float(b["price"]),
+                              _ranges(b.get("days"), WEEKDAYS, 7), _ranges(b.get("hours"))))
+            since = to_epoch(datetime.fromisoformat(t["from"])) // 3600 if t.get("from") else None
+            self.tariffs.append((since, bands))
+        self.tariffs.sort(key=lambda t: -1 << 62 if t[0] is None else t[0])
+        self.spot = spot or {}
+        self.flat = not self.tariffs and not self.spot
+        self.bands = [FLAT_BAND] if self.flat else names + [DEFAULT_BAND, SPOT_BAND]
+        self.years = {}
+        self.lock = threading.Lock()
+
+    def _year(self, year):
+        """Preise und Bänder eines Jahres als Arrays (einmal berechnet)."""
+        entry = self.years.get(year)
+        if entry is not None:
+            return entry
+        h0, h1 = to_epoch(datetime(year, 1, 1)) // 3600, to_epoch(datetime(year + 1, 1, 1)) // 3600
+        fallback, spot = len(self.bands) - 2, len(self.bands) - 1
+        prices, bands = [PRICE_KWH] * (h1 - h0), [0 if self.flat else fallback] * (h1 - h0)
+        starts = [t[0] for t in self.tariffs]
+        for i, h in enumerate(range(h0, h1)):
+            price = self.spot.get(h)
+            if price is not None:
+                prices[i], bands[i] = price, spot
+                continue
+            # gültiger Tarif: letzter mit from <= h
+            active = None
+            for since, t in zip(starts, self.tariffs):
+                if since is None or since <= h:
+                    active = t[1]
+            hour, weekday = h % 24, (h // 24 + 3) % 7
+            for band, price, days, hours in active or ():
+                if weekday in days and hour in hours:
+                    prices[i], bands[i] = price, band
+                    break
+        if np is not None:
+            prices, bands = np.array(prices), np.array(bands, dtype=np.int32)
+        with self.lock:
+            self.years[year] = (h0, prices, bands)
+        return self.years[year]
+
+    def hours(self, origin, n):
+        """(Preise, Bänder) für n Stunden ab `origin` (volle Stunde)."""
+        first = to_epoch(origin) // 3600
+        prices, bands = [], []
+        year, h = origin.year, first
+        while h < first + n:
+            y0, p, b = self._year(year)
+            lo, hi = h - y0, min(first + n - y0, len(p))
+            prices.append(p[lo:hi])
+            bands.append(b[lo:hi])
+            h, year = y0 + hi, year + 1
+        if np is not None:
+            return np.concatenate(prices), np.concatenate(bands)
+        return [x for p in prices for x in p], [x for b in bands for x in b]
+
+
+def read_spot(path):
+    """Spotpreise je Epoch-Stunde aus CSV/JSON-Zeilen (Format von backfill.py, Feld `price`)."""
+    from backfill import TIME_FIELDS, parse_time, read_records
+    out = {}
+    for rec in read_records(path):
+        try:
+            ts = parse_time(next(rec[k] for k in TIME_FIELDS if rec.get(k) not in (None, "")))
+            out[to_epoch(ts) // 3600] = float(rec["price"]) / SPOT_PRICE_DIVISOR + SPOT_MARKUP
+        except (StopIteration, KeyError, ValueError) as e:
+            log.warning(f"Skipping spot price record {rec}: {e!r}")
+    return out
+
+
+# Dateien höchstens so oft auf Änderungen prüfen (Sekunden)
+CHECK_SECONDS = 1.0
+
+_calendar = (None, None)
+_calendar_lock = threading.Lock()
+_checked = (0.0, None)
+
+
+def _stamp():
+    global _checked
+    now = time.monotonic()
+    if now - _checked[0] >= CHECK_SECONDS:
+        _checked = (now, tuple(os.stat(p).st_mtime_ns if p and os.path.exists(p) else None
+                               for p in (TARIFF_FILE, SPOT_FILE)))
+    return _checked[1]
+
+
+def calendar():
+    """Aktueller Kalender; neu geladen, wenn sich TARIFF_FILE oder SPOT_FILE geändert haben."""
+    global _calendar
+    stamp = _stamp()
+    if _calendar[0] == stamp:
+        return _calendar[1]
+    with _calendar_lock:
+        if _calendar[0] != stamp:
+            try:
+                tariffs = []
+                if stamp[0] is not None:
+                    with open(TARIFF_FILE, encoding="utf-8") as f:
+                        data = json.load(f)
+                    tariffs = data.get("tariffs") or [data]
+                spot = read_spot(SPOT_FILE) if stamp[1] is not None else {}
+                _calendar = (stamp, Calendar(tariffs, spot))
+                log.info(f"Tariff calendar loaded: {len(tariffs)} tariff(s), {len(spot)} spot prices")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # bis zur nächsten Änderung der Dateien flach mit PRICE_KWH rechnen
+                log.error(f"Loading tariff failed, using flat PRICE_KWH: {e!r}")
+                _calendar = (stamp, Calendar())
+    return _calendar[1]
+
+
+def version():
+    """Kennung des Kalenders für Cache-Schlüssel (ändert sich mit den Dateien)."""
+    return _stamp()
+
+
+def day_bounds(start, end):
+    """Kalendertage in [start, end), an den Rändern abgeschnitten (für die kWh je Tag)."""
+    days = []
+    cursor = start
+    while cursor < end:
+        next_day = cursor.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        days.append((cursor, min(next_day, end)))
+        cursor = next_day
+    return days
+
+
+def flat(kwh, bar_kwh=()):
+    """Kosten bei flachem Tarif direkt aus den kWh, ohne Tage und Stundenverteilung."""
+    return {"cost": round(kwh * PRICE_KWH, 2), "bars": [round(k * PRICE_KWH, 3) for k in bar_kwh],
+            "bands": {FLAT_BAND: {"kwh": round(kwh, 3), "cost": round(kwh * PRICE_KWH, 2)}} if kwh else {},
+            "kwh_estimated": 0.0}
+
+
+def hourly_shape(conn, origin, n):
+    """Mittlere Leistung je Stunde ab `origin`: Stunden-Tier, Minuten (und Rohwerte) ab der ersten Lücke
+    im Stunden-Tier, 0 ohne Daten. Davor liegen nur Tageswerte, dort gibt es auch keine Minuten."""
+    end = origin + n * HOUR
+    coarse = bucket_means(*hour_series(conn, origin, end), origin, 3600, n)
+    first = next((i for i, v in enumerate(coarse) if v > 0), None)
+    gap = 0 if first is None else next((i for i in range(first, n) if coarse[i] <= 0), n)
+    fine = bucket_means(*minute_series(conn, origin + gap * HOUR, end), origin, 3600, n)
+    if np is not None:
+        fine, coarse = np.asarray(fine), np.asarray(coarse)
+        return np.where(fine > 0, fine, coarse)
+    return [f if f > 0 else c for f, c in zip(fine, coarse)]
+
+
+def costs(conn, days, day_kwh, bars, now, kwh_total=None, shape=None):
+    """Kosten für die Tage `days` (aus day_bounds) mit ihren kWh, je Balken in `bars` und je Band.
+
+    Balken sind Zeiträume [start, end) innerhalb der Tage (Stunden, Tage oder Monate), Lücken
+    dazwischen sind erlaubt. Mit `kwh_total` werden die Tage auf die kWh des ganzen Zeitraums
+    skaliert (die Summe der Tage liegt an den Tagesgrenzen etwas darunter), damit Kosten und
+    angezeigte kWh zusammenpassen. `shape(origin, n)` ersetzt hourly_shape (z.B. mit Memo je
+    Request). Ergebnis: {"cost", "bars", "bands", "kwh_estimated"}.
+    """
+    cal = calendar()
+    shape_of = shape or (lambda origin, n: hourly_shape(conn, origin, n))
+    if kwh_total is not None and sum(day_kwh) > 0:
+        scale = kwh_total / sum(day_kwh)
+        day_kwh = [k * scale for k in day_kwh]
+    if not days:
+        return {"cost": 0.0, "bars": [0.0] * len(bars), "bands": {}, "kwh_estimated": 0.0}
+    origin = _hour_start(days[0][0])
+    n = int((_hour_end(days[-1][1]) - origin).total_seconds()) // 3600
+    slot = lambda dt: min(max(int((dt - origin).total_seconds()) // 3600, 0), n)
+    first = [slot(_hour_start(s)) for s, _ in days]
+    last = [slot(_hour_end(e)) for _, e in days]
+    # ohne Zeitbänder hängen die Kosten nicht von der Verteilung ab, nur Stundenbalken brauchen sie
+    needs_shape = not cal.flat or any(e - s <= HOUR for s, e in bars)
+    until = slot(_hour_end(min(now, days[-1][1])))
+    prices, bands = cal.hours(origin, n)
+
+    if np is not None:
+        owner = np.repeat(np.arange(len(days)), np.array(last) - np.array(first))
+        present = np.arange(n) < until
+        shape = np.asarray(shape_of(origin, n)) if needs_shape else np.zeros(n)
+        weight_sum = np.bincount(owner, weights=shape, minlength=len(days))
+        estimated = weight_sum[owner] <= 0
+        # Tage ohne Stundenprofil: gleichmäßig über die vergangenen Stunden
+        weights = np.where(estimated, present.astype(float), shape)
+        totals = np.bincount(owner, weights=weights, minlength=len(days))
+        kwh = np.asarray(day_kwh)[owner] * np.divide(weights, totals[owner], out=np.zeros(n),
+                                                      where=totals[owner] > 0)
+        cost = kwh * prices
+        cum = np.concatenate(([0.0], np.cumsum(cost)))
+        band_kwh = np.bincount(bands, weights=kwh, minlength=len(cal.bands))
+        band_cost = np.bincount(bands, weights=cost, minlength=len(cal.bands))
+        kwh_estimated = float(kwh[estimated].sum()) if needs_shape else 0.0
+        per_bar = [float(cum[slot(_hour_end(e))] - cum[slot(_hour_start(s))]) for s, e in bars]
+        total = float(cum[-1])
+    else:
+        shape = list(shape_of(origin, n)) if needs_shape else [0.0] * n
+        kwh, kwh_estimated = [0.0] * n, 0.0
+        for d, (a, b) in enumerate(zip(first, last)):
+            weights = shape[a:b]
+            if sum(weights) <= 0:
+                weights = [1.0 if a + i < until else 0.0 for i in range(b - a)]
+                kwh_estimated += day_kwh[d] if needs_shape else 0.0
+            total = sum(weights)
+            for i, w in enumerate(weights):
+                kwh[a + i] += day_kwh[d] * w / total if total else 0.0
+        cost = [k * p for k, p in zip(kwh, prices)]
+        band_kwh, band_cost = [0.0] * len(cal.bands), [0.0] * len(cal.bands)
+        for k, c, b in zip(kwh, cost, bands):
+            band_kwh[b] += k
+            band_cost[b] += c
+        per_bar = [sum(cost[slot(_hour_start(s)):slot(_hour_end(e))]) for s, e in bars]
+        total = sum(cost)
+
+    return {
+        "cost": round(total, 2),
+        "bars": [round(c, 3) for c in per_bar],
+        "bands": {name: {"kwh": round(float(k), 3), "cost": round(float(c), 2)}
+                  for name, k, c in zip(cal.bands, band_kwh, band_cost) if k},
+        "kwh_estimated": round(kwh_estimated, 3),
+    }
@@ -0,0 +1,21 @@
+"""
+Gemeinsame Testdaten: eine synthetische Datenbank aus bench/fixtures.py,
+einmal je Testlauf erzeugt. Gut 200 Tage bis NOW; die Tageswerte reichen
+über einen Jahreswechsel hinaus, damit auch das Archiv nach Jahr und Monat
+etwas zu tun hat. Tests, die die
+Datei verändern, arbeiten auf einer Kopie.
+"""
+from datetime import datetime
+
+import pytest
+
+from bench.fixtures import generate
+
+NOW = datetime(2026, 5, 15, 12, 0, 0)
+
+
+@pytest.fixture(scope="session")
+def energy_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("energy") / "energy.db")
+    generate(path, years=0.6, raw_days=1, now=NOW)
+    return path
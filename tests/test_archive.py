@@ -0,0 +1,125 @@
+"""
+Rundreise des Archivs (archive.py)
+
+Archiviert eine Kopie der Testdatenbank aus conftest.py nach Monat bzw. Jahr
+und vergleicht kWh (Zusammenfassung und Kaskade) und die Stunden-Zeitreihe
+mit der unveränderten Datei. restore() muss die Tabellen danach wieder
+genau herstellen.
+
+    python -m pytest tests
+"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import archive
+import schema
+from conftest import NOW
+from energy import hour_series, kwh_for_buckets
+from storage import reader_engine, writer_engine
+
+# Grenze des Archivs (Beginn des Zeitraums vor NOW - OLDER_THAN Tagen)
+OLDER_THAN = 20
+UNTIL = {"month": datetime(2026, 2, 1), "year": datetime(2026, 1, 1)}
+
+
+def copy_db(src, dst):
+    with sqlite3.connect(src) as a, sqlite3.connect(dst) as b:
+        a.backup(b)
+    return dst
+
+
+def table_rows(conn, name):
+    """Alle Zeilen ohne Ersatzschlüssel `id` (nach restore() neu vergeben), nach Zeit sortiert."""
+    table = schema.metadata.tables[name]
+    cols = [c for c in table.c if c.name != "id"]
+    return conn.execute(select(*cols).order_by(table.c.timestamp)).fetchall()
+
+
+def ranges(first):
+    """Tage, Monate und Zeiträume über die Archivgrenzen hinweg."""
+    days = int((NOW - first).total_seconds() // 86400)
+    out = [(first + timedelta(days=d), first + timedelta(days=d + 1)) for d in range(days)]
+    out += [(datetime(y, m, 1), datetime(y + m // 12, m % 12 + 1, 1))
+            for y, m in ((2025, 10), (2025, 11), (2025, 12), (2026, 1), (2026, 2), (2026, 3), (2026, 4))]
+    out += [(u - timedelta(days=d, hours=h), u + timedelta(days=d, hours=h)) for u in UNTIL.values()
+            for d, h in ((0, 5), (3, 0), (10, 7), (40, 0))]
+    out += [(first - timedelta(days=3), NOW), (first + timedelta(hours=7, minutes=13), NOW - timedelta(days=2))]
+    return out
+
+
+def snapshot(path, first):
+    """Alles, was das Archiv nicht ändern darf; `first` ist der erste Tag der ungekürzten Datei."""
+    engine = reader_engine(path)
+    with engine.connect() as conn:
+        bounds = ranges(first)
+        out = {
+            "summary": kwh_for_buckets(conn, bounds),
+            "cascade": kwh_for_buckets(conn, bounds, summary=False),
+            "hours": [list(col) for col in hour_series(conn, first - timedelta(days=1), NOW)],
+            "tables": {name: table_rows(conn, name) for name in archive.TABLES},
+        }
+    engine.dispose()
+    return out
+
+
+@pytest.fixture(scope="module")
+def base(energy_db, tmp_path_factory):
+    """Kopie der Testdatenbank mit Stundenwerten für die ersten zwei Wochen, wie sie ältere
+    Installationen noch neben den Tageswerten haben; sonst läge keine Stunde vor der Archivgrenze."""
+    path = copy_db(energy_db, str(tmp_path_factory.mktemp("archive") / "base.db"))
+    day, hour = schema.measurement_day, schema.measurement_hour
+    engine = writer_engine(path)
+    with engine.begin() as conn:
+        days = conn.execute(select(day.c.timestamp, day.c.power_avg, day.c.power_max, day.c.power_min, day.c.kwh_used)
+                            .order_by(day.c.timestamp).limit(14)).fetchall()
+        conn.execute(hour.insert(), [{"timestamp": ts + timedelta(hours=h), "power_avg": avg, "power_max": mx,
+                                      "power_min": mn, "kwh_used": kwh / 24}
+                                     for ts, avg, mx, mn, kwh in days for h in range(24)])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture(scope="module")
+def first(base):
+    engine = reader_engine(base)
+    with engine.connect() as conn:
+        day = schema.measurement_day.c.timestamp
+        yield conn.execute(select(day).order_by(day).limit(1)).scalar()
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def original(base, first):
+    return snapshot(base, first)
+
+
+@pytest.mark.parametrize("by", ["month", "year"])
+def test_archive_round_trip(base, first, original, tmp_path, by):
+    path = copy_db(base, str(tmp_path / "archived.db"))
+    engine = writer_engine(path)
+    written, deleted, *_ = archive.archive(engine, now=NOW, older_than=OLDER_THAN, by=by)
+    store = archive.Archive(path).refresh()
+    assert store.until == UNTIL[by] and store.by == by
+    assert written > 0 and deleted == written
+    periods = 4 if by == "month" else 1
+    assert {name: len(segs) for name, segs in store.segments.items()} == \
+        {"energy_daily": periods, "measurement_day": periods, "measurement_hour": 1}
+
+    archived = snapshot(path, first)
+    for name in archive.TABLES:
+        # in der DB nur noch Zeilen ab der Grenze
+        assert len(archived["tables"][name]) < len(original["tables"][name])
+        assert all(archive.to_epoch(r[0]) >= archive.to_epoch(store.until) for r in archived["tables"][name])
+    assert archived["summary"] == pytest.approx(original["summary"], rel=1e-12, abs=1e-9)
+    assert archived["cascade"] == pytest.approx(original["cascade"], rel=1e-12, abs=1e-9)
+    assert archived["hours"][0] == original["hours"][0]
+    assert archived["hours"][1] == pytest.approx(original["hours"][1], rel=1e-12)
+
+    assert archive.restore(engine) == written
+    engine.dispose()
+    assert not os.path.exists(archive.folder(path))
+    assert snapshot(path, first) == original
@@ -0,0 +1,104 @@
+"""
+Vertrag des Downsamplings (downsample.py)
+
+Exakte Punktzahl, aufsteigende eindeutige Indizes, Spitzen bleiben erhalten,
+Randfälle n <= 2 und n >= len, und mit wie ohne NumPy dasselbe Ergebnis.
+
+    python -m pytest tests
+"""
+import random
+
+import pytest
+
+import downsample
+from downsample import MODES
+
+SIZES = (3, 4, 10, 101, 1440, 5000)
+
+
+def series(size, seed=1):
+    """Minutenwerte (epoch, watt) mit Grundlast, Rauschen und einzelnen Lastspitzen."""
+    rnd = random.Random(seed)
+    x = [1_700_000_000 + 60 * i for i in range(size)]
+    y = [150 + 40 * rnd.random() + (2000 * rnd.random() if rnd.random() < 0.01 else 0) for _ in range(size)]
+    return x, y
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(downsample, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("size", SIZES)
+def test_exact_count_and_sorted_unique_indices(backend, mode, size):
+    x, y = series(size)
+    for n in sorted({3, 4, 5, 7, 50, 299, 300, size - 1}):
+        if not 2 < n < size:
+            continue
+        idx = downsample.downsample(x, y, n, mode)
+        assert len(idx) == n
+        assert idx == sorted(set(idx))
+        assert 0 <= idx[0] and idx[-1] < size
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_peak_retained(backend, mode):
+    x, y = series(1440)
+    y = [min(v, 200) for v in y]
+    y[777] = 3500
+    y[1000] = 0
+    idx = downsample.downsample(x, y, 50, mode)
+    assert 777 in idx
+    if mode == "minmax":
+        assert 1000 in idx
+
+
+def test_lttb_keeps_first_and_last(backend):
+    x, y = series(1000)
+    idx = downsample.downsample(x, y, 100, "lttb")
+    assert idx[0] == 0 and idx[-1] == 999
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_constant_series(backend, mode):
+    x, y = list(range(100)), [42.0] * 100
+    idx = downsample.downsample(x, y, 10, mode)
+    assert len(idx) == 10 and idx == sorted(set(idx))
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_small_n(mode):
+    x, y = series(100)
+    assert downsample.downsample(x, y, 0, mode) == []
+    assert downsample.downsample(x, y, 1, mode) == [99]
+    assert downsample.downsample(x, y, 2, mode) == [0, 99]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_n_at_least_len_returns_all(mode):
+    x, y = series(20)
+    assert downsample.downsample(x, y, 20, mode) == list(range(20))
+    assert downsample.downsample(x, y, 500, mode) == list(range(20))
+    assert downsample.downsample([], [], 10, mode) == []
+
+
+def test_unknown_mode():
+    x, y = series(10)
+    with pytest.raises(ValueError):
+        downsample.downsample(x, y, 5, "stride")
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("size", SIZES)
+def test_same_result_without_numpy(monkeypatch, mode, size):
+    np = pytest.importorskip("numpy")
+    x, y = series(size, seed=size)
+    ns = [n for n in (3, 4, 50, 300, size - 1) if 2 < n < size]
+    with_np = [downsample.downsample(np.asarray(x), np.asarray(y), n, mode) for n in ns]
+    monkeypatch.setattr(downsample, "np", None)
+    assert [downsample.downsample(x, y, n, mode) for n in ns] == with_np
@@ -0,0 +1,136 @@
+"""
+Regressionstest der Energie-Engine (energy.py)
+
+Nutzt die synthetische Datenbank aus conftest.py (bench/fixtures.py: Tages-,
+Stunden-, Minuten- und Rohdaten wie nach längerem Betrieb) und vergleicht
+kwh_for_buckets mit der ursprünglichen Kaskade get_kwh_for_range aus
+app.py, die hier als Kopie auf SQLAlchemy Core erhalten bleibt.
+
+Die Tageszusammenfassung energy_daily und die Stunden- und Tageswerte
+zählen ab dem Zählerstand vor dem Bucket (lückenlos). Sie stimmen mit der
+Kaskade über dieselben Tiers überein; die Kaskade über Minuten und Rohdaten
+zählt wie bisher ab dem ersten Wert im Bucket und liegt um diesen Anlauf
+darunter.
+
+    python -m pytest tests
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from aggregate import TIERS
+from conftest import NOW
+from energy import kwh_for_buckets
+from schema import KEY, measurement, measurement_day, measurement_hour, measurement_minute
+from storage import reader_engine
+
+RANGES = 200
+
+
+@pytest.fixture(scope="module")
+def conn(energy_db):
+    engine = reader_engine(energy_db)
+    with engine.connect() as c:
+        yield c
+    engine.dispose()
+
+
+def baseline_kwh(conn, start, end):
+    """get_kwh_for_range(start, end) aus app.py vor energy.py, Abfrage für Abfrage."""
+    def first(table, lo, desc=False):
+        order = table.c.timestamp.desc() if desc else table.c.timestamp.asc()
+        return conn.execute(select(table).where(table.c.timestamp >= lo, table.c.timestamp < end)
+                            .order_by(order).limit(1)).first()
+
+    total = conn.execute(select(func.sum(measurement_day.c.kwh_used)).where(
+        measurement_day.c.timestamp >= start, measurement_day.c.timestamp < end)).scalar() or 0
+    day_last = first(measurement_day, start, desc=True)
+    cursor = day_last.timestamp + timedelta(days=1) if day_last else start
+
+    total += conn.execute(select(func.sum(measurement_hour.c.kwh_used)).where(
+        measurement_hour.c.timestamp >= cursor, measurement_hour.c.timestamp < end)).scalar() or 0
+    hour_last = first(measurement_hour, cursor, desc=True)
+    cursor = hour_last.timestamp + timedelta(hours=1) if hour_last else cursor
+
+    minute_first, minute_last = first(measurement_minute, cursor), first(measurement_minute, cursor, desc=True)
+    if minute_first and minute_last and minute_first._mapping[KEY] != minute_last._mapping[KEY]:
+        total += minute_last.total_kwh - minute_first.total_kwh
+    if minute_last:
+        cursor = minute_last.timestamp + timedelta(minutes=1)
+
+    raw_first, raw_last = first(measurement, cursor), first(measurement, cursor, desc=True)
+    if raw_first and raw_last and raw_first._mapping[KEY] != raw_last._mapping[KEY]:
+        total += raw_last.total_kwh - raw_first.total_kwh
+    return total
+
+
+def random_ranges(conn, n, seed=1):
+    """Zufällige Zeiträume über alle Tiers: beliebige Zeitpunkte und auf Stunden bzw. Tage gerundete."""
+    first = conn.execute(select(func.min(measurement_day.c.timestamp))).scalar()
+    span = (NOW - first).total_seconds()
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        start = first + timedelta(seconds=rnd.uniform(-86400, span))
+        end = start + timedelta(seconds=rnd.choice((3600, 86400, 30 * 86400, span)) * rnd.random())
+        if i % 3 == 1:
+            start, end = start.replace(minute=0, second=0, microsecond=0), end.replace(minute=0, second=0, microsecond=0)
+        elif i % 3 == 2:
+            start, end = (start.replace(hour=0, minute=0, second=0, microsecond=0),
+                          end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
+        out.append((start, end))
+    return out
+
+
+def test_cascade_matches_baseline(conn):
+    bounds = random_ranges(conn, RANGES)
+    expected = [baseline_kwh(conn, s, e) for s, e in bounds]
+    assert kwh_for_buckets(conn, bounds, summary=False) == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+
+def test_cascade_matches_baseline_for_hourly_bars(conn):
+    # mehr Buckets als energy.CHUNK, über die Grenze Stunden-/Minuten-/Rohdaten hinweg
+    start = (NOW - timedelta(days=15)).replace(minute=0, second=0, microsecond=0)
+    bounds = [(start + timedelta(hours=i), start + timedelta(hours=i + 1)) for i in range(15 * 24 + 12)]
+    expected = [baseline_kwh(conn, s, e) for s, e in bounds]
+    assert kwh_for_buckets(conn, bounds, summary=False) == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+
+def test_cascade_matches_baseline_for_short_buckets(conn):
+    # Grenzen mitten in Stunden und Minuten, über Stunden-, Minuten- und Rohdaten hinweg
+    start, step = NOW - timedelta(days=3, seconds=17), timedelta(minutes=23, seconds=7)
+    bounds = [(start + k * step, start + (k + 1) * step) for k in range(190)]
+    expected = [baseline_kwh(conn, s, e) for s, e in bounds]
+    assert kwh_for_buckets(conn, bounds, summary=False) == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+
+def test_empty_and_inverted_ranges(conn):
+    bounds = [(NOW, NOW), (NOW, NOW - timedelta(days=1)), (NOW + timedelta(days=1), NOW + timedelta(days=2))]
+    assert kwh_for_buckets(conn, bounds, summary=False) == [0.0, 0.0, 0.0]
+
+
+def test_summary_matches_exact_cascade_for_days(conn):
+    # abgeschlossene Tage; der laufende Tag kommt auch mit Zusammenfassung aus der Kaskade
+    today = NOW.replace(hour=0, minute=0, second=0, microsecond=0)
+    bounds = [(s, min(e, today)) for s, e in random_ranges(conn, RANGES)[2::3]]
+    assert kwh_for_buckets(conn, bounds) == pytest.approx(
+        kwh_for_buckets(conn, bounds, summary=False, exact=True), rel=1e-12, abs=1e-9)
+
+
+def test_summary_close_to_cascade(conn):
+    # Unterschied nur durch den Anlauf vor dem ersten Wert eines Stücks in Minuten oder Rohdaten
+    bounds = random_ranges(conn, RANGES)
+    assert kwh_for_buckets(conn, bounds) == pytest.approx(kwh_for_buckets(conn, bounds, summary=False),
+                                                          rel=1e-3, abs=0.01)
+
+
+def test_hours_add_up_to_day_in_hour_tier(conn):
+    minute_age = TIERS[1][4]
+    for age in (minute_age + timedelta(days=1), timedelta(days=30), timedelta(days=80)):
+        day = (NOW - age).replace(hour=0, minute=0, second=0, microsecond=0)
+        hours = kwh_for_buckets(conn, [(day + timedelta(hours=h), day + timedelta(hours=h + 1)) for h in range(24)])
+        (total,) = kwh_for_buckets(conn, [(day, day + timedelta(days=1))])
+        assert sum(hours) == pytest.approx(total, rel=1e-12)
+        assert total == pytest.approx(baseline_kwh(conn, day, day + timedelta(days=1)), rel=1e-12)
@@ -0,0 +1,21 @@
+"""
+WSGI-Einstieg für den Produktivbetrieb
+
+    gunicorn -w 2 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:app
+    python subscriber.py
+
+Die Web-Worker abonnieren nie MQTT und schreiben nichts: Messwerte, Schema
+und Migrationen macht allein der Ingest-Prozess (subscriber.py) bzw.
+aggregate.py. Bis die Datenbank angelegt ist, antwortet die API mit 503. Jeder Worker liest neue Rohwerte
+alle LIVE_FOLLOW_SECONDS aus der Datenbank in seinen Live-Puffer
+(live.Follower), damit Live-Anzeige, SSE und Cache-Invalidierung wie im
+Entwicklungsserver funktionieren. Threads pro Worker (gthread) halten die
+offenen SSE-Verbindungen, ohne Worker zu blockieren.
+"""
+import atexit
+
+from app import app, meters
+
+# Zähler werden erst beim ersten Request geöffnet, also in jedem Worker nach dem Fork
+meters.ingest = False
+atexit.register(meters.close)